@@ -1,15 +1,36 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import io
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+import zipfile
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import unquote, urlparse
+from xml.etree.ElementTree import iterparse
 from github import Github
 import json
 import hashlib
 import uuid as _uuid_mod
 
+# Copy-on-Write: os caches da camada de dados devolvem cópias rasas
+# (copy(deep=False)) e só com CoW as alterações feitas pelas páginas não
+# atingem o objeto guardado. Padrão a partir do pandas 3; no 2.x é ligado aqui.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
 # ====================== SUPABASE — CLIENTE CENTRALIZADO ======================
 # Credenciais lidas dos secrets do Streamlit.
 # Configure em .streamlit/secrets.toml:
@@ -18,27 +39,283 @@ import uuid as _uuid_mod
 #   key = "eyJ..."
 # No Streamlit Cloud: Settings → Secrets
 
-def _supa_headers():
-    """Retorna headers HTTP para chamadas à API REST do Supabase."""
+class SupabaseErro(Exception):
+    """Falha em uma chamada REST ao Supabase (status HTTP quando houver resposta)"""
+
+    def __init__(self, mensagem, status=None):
+        super().__init__(mensagem)
+        self.status = status
+
+
+_SEM_CACHE = object()
+
+def _total_content_range(valor):
+    """Total de linhas de um Content-Range do PostgREST ("0-49/1234", "*/0"), ou None"""
     try:
-        key = st.secrets["supabase"]["key"]
-    except Exception:
+        return int(str(valor).rsplit("/", 1)[1])
+    except (IndexError, ValueError):
         return None
-    return {
-        "apikey": key,
-        "Authorization": f"Bearer {key}",
-        "Content-Type": "application/json",
-        "Prefer": "return=representation",
+
+
+class CacheLeituraSupabase:
+    """
+    Cache de leituras (GET) por tabela com TTL curto, na frente do
+    SupabaseClient: reruns da mesma página não voltam à rede. Escritas feitas
+    pelo cliente invalidam as tabelas afetadas; atualizar_linhas aplica uma
+    mudança conhecida (ex.: status) às linhas em cache sem descartá-las.
+    Escritas de outros processos aparecem em até `ttl` segundos.
+    """
+
+    # Parâmetros PostgREST que não filtram colunas
+    _PARAMS_NEUTROS = {"select", "limit", "offset", "on_conflict"}
+
+    def __init__(self, ttl=30, max_por_tabela=64):
+        self.ttl = ttl
+        self.max_por_tabela = max_por_tabela
+        self._tabelas = {}
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    @staticmethod
+    def chave(params, headers, retornar_total):
+        itens = params.items() if isinstance(params, dict) else (params or ())
+        return (tuple((str(k), str(v)) for k, v in itens),
+                tuple(sorted((headers or {}).items())), retornar_total)
+
+    @staticmethod
+    def _colunas_agregadas(select):
+        """
+        Colunas de um select com agregação (ex.: "status,qtd:count(),total:valor_total.sum()"
+        → {"status", "valor_total"}). As linhas agregadas não têm id para
+        receber a atualização otimista: mudar uma dessas colunas descarta a entrada.
+        """
+        if "()" not in select:
+            return set()
+        colunas = set()
+        for parte in select.split(","):
+            expressao = re.sub(r"^\s*\w+:(?!:)", "", parte)
+            m = re.match(r"\s*([A-Za-z_]\w*)(?!\w*\()", expressao)
+            if m:
+                colunas.add(m.group(1))
+        return colunas
+
+    @staticmethod
+    def _copiar(valor):
+        # As páginas ordenam/alteram as listas recebidas; o cache guarda as suas
+        if isinstance(valor, tuple):
+            return (CacheLeituraSupabase._copiar(valor[0]),) + valor[1:]
+        if isinstance(valor, list):
+            return [dict(r) if isinstance(r, dict) else r for r in valor]
+        return valor
+
+    def obter(self, tabela, chave, padrao=None):
+        with self._trava:
+            entrada = self._tabelas.get(tabela, {}).get(chave)
+            if entrada is None or entrada[0] < time.monotonic():
+                self.faltas += 1
+                return padrao
+            self.acertos += 1
+            return self._copiar(entrada[2])
+
+    def guardar(self, tabela, chave, valor):
+        # Colunas que filtram/ordenam a consulta: se mudarem, a entrada sai do cache
+        colunas = set()
+        for k, v in chave[0]:
+            if k == "order":
+                colunas.update(c.split(".")[0] for c in v.split(","))
+            elif k in ("or", "and"):
+                colunas.update(re.findall(r"([A-Za-z_]\w*)\.(?:eq|neq|lt|lte|gt|gte|like|ilike|in|is)\.", v))
+            elif k == "select":
+                colunas.update(self._colunas_agregadas(v))
+            elif k not in self._PARAMS_NEUTROS:
+                colunas.add(k)
+        with self._trava:
+            entradas = self._tabelas.setdefault(tabela, OrderedDict())
+            entradas[chave] = (time.monotonic() + self.ttl, colunas, self._copiar(valor))
+            entradas.move_to_end(chave)
+            while len(entradas) > self.max_por_tabela:
+                entradas.popitem(last=False)
+
+    def invalidar(self, *tabelas):
+        """Descarta as leituras das tabelas indicadas (nenhuma, sem argumentos)"""
+        with self._trava:
+            for tabela in tabelas:
+                self._tabelas.pop(tabela, None)
+
+    def atualizar_linhas(self, tabela, id_valor, campos, id_col="id"):
+        """
+        Atualização otimista: aplica `campos` às linhas em cache com
+        id_col == id_valor. Entradas que filtram ou ordenam por um dos campos
+        alterados são descartadas (a linha pode ter entrado ou saído delas).
+        """
+        with self._trava:
+            entradas = self._tabelas.get(tabela)
+            if not entradas:
+                return
+            for chave in list(entradas):
+                expira, colunas, valor = entradas[chave]
+                if colunas & set(campos):
+                    del entradas[chave]
+                    continue
+                linhas = valor[0] if isinstance(valor, tuple) else valor
+                for linha in linhas or ():
+                    if isinstance(linha, dict) and str(linha.get(id_col)) == str(id_valor):
+                        linha.update({k: v for k, v in campos.items() if k in linha})
+
+
+class SupabaseClient:
+    """
+    Cliente REST do Supabase compartilhado pelo processo: uma requests.Session
+    com pool de conexões e headers fixos, no máximo `max_concorrentes`
+    chamadas simultâneas, novas tentativas com backoff exponencial e jitter
+    em falhas de conexão, timeouts e 5xx/429, e métricas de latência por
+    operação. Falhas levantam SupabaseErro.
+    """
+
+    STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+    # Tabelas gravadas por cada função RPC (para invalidar o cache de leitura);
+    # () para funções que não gravam em tabelas lidas pelo app
+    TABELAS_RPC = {
+        "rpc/salvar_pedido_completo": ("pedidos", "itens_pedido", "historico_status"),
+        "rpc/proximo_numero_pedido": (),
     }
 
-def _supa_url(tabela):
-    """Retorna a URL REST para uma tabela do Supabase."""
+    def __init__(self, url, key, max_concorrentes=4, tentativas=3, timeout=10, backoff=0.3):
+        self.base = f"{url.rstrip('/')}/rest/v1"
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.backoff = backoff
+        self._sessao = requests.Session()
+        self._sessao.headers.update({
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+            "Prefer": "return=representation",
+        })
+        self._sessao.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_concorrentes))
+        self._limite = threading.BoundedSemaphore(max_concorrentes)
+        self._trava = threading.Lock()
+        self._metricas = {}
+        self.erros = deque(maxlen=20)
+        self.cache = CacheLeituraSupabase()
+        self._rpc_ausentes = set()
+        self.sem_agregacao = False
+
+    def _registrar(self, operacao, segundos, retentativas, erro):
+        ms = segundos * 1000
+        with self._trava:
+            m = self._metricas.setdefault(operacao, {
+                'chamadas': 0, 'erros': 0, 'retentativas': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            })
+            m['chamadas'] += 1
+            m['retentativas'] += retentativas
+            m['total_ms'] += ms
+            m['max_ms'] = max(m['max_ms'], ms)
+            if erro is not None:
+                m['erros'] += 1
+                self.erros.append(f"{datetime.now():%d/%m %H:%M:%S} {operacao}: {erro}")
+
+    def requisitar(self, metodo, tabela, params=None, dados=None, headers=None, retornar_total=False,
+                   invalidar=True):
+        """
+        Executa uma chamada REST e devolve o JSON da resposta (None se vazia);
+        com retornar_total=True devolve (json, total) lendo o Content-Range
+        (requer o header "Prefer: count=exact").
+        GETs passam pelo cache de leitura; as demais chamadas invalidam as
+        tabelas que gravam (invalidar=False quando o chamador atualiza o cache).
+        Timeouts de leitura só são repetidos em GET/PATCH/DELETE (idempotentes);
+        um POST repetido após falha de conexão ou 5xx/429 não duplica linhas
+        porque os registros levam o id gerado no app.
+        """
+        operacao = f"{metodo} {tabela}"
+        if metodo == "GET":
+            chave_cache = self.cache.chave(params, headers, retornar_total)
+            em_cache = self.cache.obter(tabela, chave_cache, _SEM_CACHE)
+            if em_cache is not _SEM_CACHE:
+                return em_cache
+        corpo = json.dumps(dados) if dados is not None else None
+        inicio = time.perf_counter()
+        tentativa = 0
+        erro = None
+        try:
+            while True:
+                tentativa += 1
+                try:
+                    with self._limite:
+                        r = self._sessao.request(metodo, f"{self.base}/{tabela}", params=params,
+                                                 data=corpo, headers=headers, timeout=self.timeout)
+                except requests.exceptions.ConnectionError as e:
+                    falha, retentavel = SupabaseErro(f"sem conexão com o Supabase ({e.__class__.__name__})"), True
+                except requests.exceptions.Timeout:
+                    falha, retentavel = SupabaseErro(f"timeout após {self.timeout}s"), metodo != "POST"
+                else:
+                    if r.status_code < 400:
+                        resposta = r.json() if r.content else None
+                        if retornar_total:
+                            resposta = resposta, _total_content_range(r.headers.get("Content-Range"))
+                        if metodo == "GET":
+                            self.cache.guardar(tabela, chave_cache, resposta)
+                        return resposta
+                    falha = SupabaseErro(f"HTTP {r.status_code}: {r.text[:200]}", r.status_code)
+                    retentavel = r.status_code in self.STATUS_RETENTAVEIS
+                if not retentavel or tentativa >= self.tentativas:
+                    raise falha
+                time.sleep(self.backoff * 2 ** (tentativa - 1) * random.uniform(0.5, 1.5))
+        except SupabaseErro as e:
+            erro = e
+            raise
+        finally:
+            self._registrar(operacao, time.perf_counter() - inicio, tentativa - 1, erro)
+            # Mesmo após falha (ex.: timeout) a escrita pode ter sido aplicada
+            if metodo != "GET" and invalidar:
+                self.cache.invalidar(*self.TABELAS_RPC.get(tabela, (tabela,)))
+
+    def rpc(self, funcao, dados=None):
+        """
+        Chama a função Postgres `funcao` (POST rpc/<funcao>). Um 404 (função
+        ainda não instalada pelas migrações em supabase/migrations) é lembrado
+        pelo processo: as chamadas seguintes levantam o mesmo SupabaseErro
+        (status 404) sem ir à rede. Após instalar a função, reinicie o app.
+        """
+        if funcao in self._rpc_ausentes:
+            raise SupabaseErro(f"função {funcao} não instalada no banco", 404)
+        try:
+            return self.requisitar("POST", f"rpc/{funcao}", dados=dados)
+        except SupabaseErro as e:
+            if e.status == 404:
+                self._rpc_ausentes.add(funcao)
+            raise
+
+    def metricas(self):
+        """Latência por operação ('GET pedidos', ...) desde o início do processo"""
+        with self._trava:
+            return [
+                {'Operação': op, 'Chamadas': m['chamadas'], 'Erros': m['erros'],
+                 'Retentativas': m['retentativas'],
+                 'Média (ms)': round(m['total_ms'] / m['chamadas'], 1),
+                 'Máx (ms)': round(m['max_ms'], 1)}
+                for op, m in sorted(self._metricas.items())
+            ]
+
+
+@st.cache_resource(show_spinner=False)
+def supabase_cliente():
+    """SupabaseClient compartilhado pelo processo, ou None sem credenciais configuradas"""
     try:
-        base = st.secrets["supabase"]["url"].rstrip("/")
-        return f"{base}/rest/v1/{tabela}"
+        cfg = st.secrets["supabase"]
+        return SupabaseClient(cfg["url"], cfg["key"])
     except Exception:
         return None
 
+def _avisar_erro_supabase(erro):
+    """Exibe a falha de uma chamada ao Supabase (as funções supa_* mantêm o retorno vazio)"""
+    try:
+        st.toast(f"Supabase: {erro}", icon="⚠️")
+    except Exception:
+        pass
+
 def supa_disponivel():
     """Verifica se as credenciais do Supabase estão configuradas."""
     try:
@@ -48,99 +325,262 @@ def supa_disponivel():
     except Exception:
         return False
 
-def supa_select(tabela, filtros=None, ordem=None, limite=1000):
+def _valor_lista_postgrest(valor):
+    """Valor entre aspas para in.(...) e and=(...): vírgulas, parênteses e aspas não quebram a lista"""
+    texto = str(valor).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{texto}"'
+
+def _padrao_contem(texto):
+    """
+    Padrão ilike "contém `texto`" com o texto digitado tratado como literal:
+    % e _ são escapados e * (curinga do PostgREST, sem escape) vira _.
+    """
+    texto = str(texto).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"*{texto.replace('*', '_')}*"
+
+def _params_filtros(filtros):
+    """
+    Converte filtros em parâmetros PostgREST (lista de pares, aceita a mesma
+    coluna mais de uma vez). Cada valor pode ser:
+      valor                    → igualdade (eq.)
+      ("operador", valor)      → ex.: ("gte", "2025-01-01"), ("ilike", "MED*")
+      ("contem", texto)        → ilike com o texto digitado pelo usuário como
+                                 literal (vai num and=(...) com o valor entre aspas)
+      ("in", [v1, v2, ...])    → pertence à lista (valores entre aspas)
+      [(op, valor), ...]       → várias condições na mesma coluna
+    """
+    params, contem = [], []
+    for col, val in (filtros or {}).items():
+        condicoes = val if isinstance(val, list) else [val]
+        for cond in condicoes:
+            if isinstance(cond, tuple):
+                op, v = cond
+                if op == "contem":
+                    contem.append(f"{col}.ilike.{_valor_lista_postgrest(_padrao_contem(v))}")
+                    continue
+                if op == "in":
+                    v = "(" + ",".join(_valor_lista_postgrest(x) for x in v) + ")"
+                params.append((col, f"{op}.{v}"))
+            else:
+                params.append((col, f"eq.{cond}"))
+    if contem:
+        params.append(("and", "(" + ",".join(contem) + ")"))
+    return params
+
+def supa_select(tabela, filtros=None, ordem=None, limite=1000, colunas=None):
     """
     Lê registros de uma tabela.
-    filtros: dict {coluna: valor} → igualdade simples
+    filtros: dict {coluna: valor} → ver _params_filtros (eq., ilike, gte/lte, in...)
     ordem:   string ex: "criado_em.desc"
-    Retorna lista de dicts ou [] em caso de erro.
+    colunas: projeção ex: "id,status,valor_total" (padrão: todas)
+    Retorna lista de dicts ou [] em caso de erro (o erro é exibido).
     """
-    url = _supa_url(tabela)
-    headers = _supa_headers()
-    if not url or not headers:
+    cliente = supabase_cliente()
+    if cliente is None:
         return []
-    params = {"limit": limite}
-    if filtros:
-        for col, val in filtros.items():
-            params[col] = f"eq.{val}"
+    params = _params_filtros(filtros) + [("limit", limite)]
     if ordem:
-        params["order"] = ordem
+        params.append(("order", ordem))
+    if colunas:
+        params.append(("select", colunas))
     try:
-        r = requests.get(url, headers=headers, params=params, timeout=10)
-        if r.status_code == 200:
-            return r.json()
+        return cliente.requisitar("GET", tabela, params=params) or []
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
         return []
-    except Exception:
+
+def supa_select_todos(tabela, filtros=None, colunas=None, ordem="id.asc", lote=1000):
+    """
+    Lê todas as linhas que atendem aos filtros, em blocos de `lote` pedidos
+    pelo header Range (o PostgREST limita cada resposta). Use com `colunas`
+    enxutas para totais e exportações.
+    Retorna lista de dicts ou [] em caso de erro (o erro é exibido).
+    """
+    cliente = supabase_cliente()
+    if cliente is None:
+        return []
+    params = _params_filtros(filtros) + [("order", ordem)]
+    if colunas:
+        params.append(("select", colunas))
+    registros, inicio = [], 0
+    try:
+        while True:
+            bloco = cliente.requisitar("GET", tabela, params=params, headers={
+                "Range-Unit": "items", "Range": f"{inicio}-{inicio + lote - 1}"}) or []
+            registros.extend(bloco)
+            if len(bloco) < lote:
+                return registros
+            inicio += lote
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
         return []
 
+def supa_resumo(tabela, filtros=None, grupo="status", soma="valor_total"):
+    """
+    Quantidade de linhas e soma de `soma` por valor de `grupo` entre as
+    linhas filtradas, calculadas no banco pela agregação do PostgREST
+    (select=grupo,count(),soma.sum()): uma linha por grupo, sem baixar os
+    registros. Requer agregações habilitadas (migração
+    20261018000200_agregacoes_postgrest.sql); sem elas — lembrado pelo
+    processo — soma as colunas lidas em blocos.
+    Retorna {grupo: (quantidade, soma)} ou {} em caso de erro (o erro é exibido).
+    """
+    cliente = supabase_cliente()
+    if cliente is None:
+        return {}
+    if not cliente.sem_agregacao:
+        params = _params_filtros(filtros) + [
+            ("select", f"{grupo},quantidade:count(),total:{soma}.sum()")]
+        try:
+            linhas = cliente.requisitar("GET", tabela, params=params) or []
+            return {l.get(grupo): (int(l.get("quantidade") or 0), float(l.get("total") or 0))
+                    for l in linhas}
+        except SupabaseErro as e:
+            if e.status != 400 or "PGRST123" not in str(e):
+                _avisar_erro_supabase(e)
+                return {}
+            cliente.sem_agregacao = True
+    resumo = {}
+    for reg in supa_select_todos(tabela, filtros=filtros, colunas=f"id,{grupo},{soma}"):
+        qtd, total = resumo.get(reg.get(grupo), (0, 0.0))
+        resumo[reg.get(grupo)] = (qtd + 1, total + float(reg.get(soma) or 0))
+    return resumo
+
+def supa_select_pagina(tabela, filtros=None, colunas=None, tamanho=50, cursor=None,
+                       chave="criado_em"):
+    """
+    Uma página em ordem decrescente de `chave` com paginação por cursor
+    (keyset): `cursor` é o (chave, id) da última linha da página anterior,
+    então o custo não cresce com o número da página.
+    Retorna (registros, total_filtrado, proximo_cursor); proximo_cursor é
+    None na última página. Em caso de erro: ([], 0, None) (o erro é exibido).
+    """
+    cliente = supabase_cliente()
+    if cliente is None:
+        return [], 0, None
+    params = _params_filtros(filtros) + [
+        ("order", f"{chave}.desc,id.desc"), ("limit", tamanho + 1)]
+    if colunas:
+        params.append(("select", colunas))
+    if cursor:
+        valor, ultimo_id = cursor
+        params.append(("or", f'({chave}.lt."{valor}",and({chave}.eq."{valor}",id.lt."{ultimo_id}"))'))
+    try:
+        registros, total = cliente.requisitar(
+            "GET", tabela, params=params, headers={"Prefer": "count=exact"}, retornar_total=True)
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
+        return [], 0, None
+    registros = registros or []
+    proximo = None
+    if len(registros) > tamanho:
+        registros = registros[:tamanho]
+        proximo = (registros[-1].get(chave), registros[-1].get("id"))
+    return registros, total or 0, proximo
+
 def supa_insert(tabela, dados):
     """
     Insere um registro.
     dados: dict com os campos.
-    Retorna o registro inserido (dict) ou None em caso de erro.
+    Retorna o registro inserido (dict) ou None em caso de erro (o erro é exibido).
     """
-    url = _supa_url(tabela)
-    headers = _supa_headers()
-    if not url or not headers:
+    cliente = supabase_cliente()
+    if cliente is None:
         return None
     try:
-        r = requests.post(url, headers=headers,
-                          data=json.dumps(dados), timeout=10)
-        if r.status_code in (200, 201):
-            resultado = r.json()
-            return resultado[0] if isinstance(resultado, list) else resultado
-        return None
-    except Exception:
+        resultado = cliente.requisitar("POST", tabela, dados=dados)
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
         return None
+    return resultado[0] if isinstance(resultado, list) and resultado else resultado
 
 def supa_update(tabela, id_valor, dados, id_col="id"):
     """
     Atualiza um registro pelo id.
     Retorna True em caso de sucesso.
     """
-    url = _supa_url(tabela)
-    headers = _supa_headers()
-    if not url or not headers:
+    cliente = supabase_cliente()
+    if cliente is None:
         return False
     try:
-        r = requests.patch(
-            url,
-            headers=headers,
-            params={id_col: f"eq.{id_valor}"},
-            data=json.dumps(dados),
-            timeout=10,
-        )
-        return r.status_code in (200, 204)
-    except Exception:
+        cliente.requisitar("PATCH", tabela, params={id_col: f"eq.{id_valor}"}, dados=dados)
+        return True
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
         return False
 
 def supa_delete(tabela, id_valor, id_col="id"):
     """Deleta um registro pelo id. Retorna True em caso de sucesso."""
-    url = _supa_url(tabela)
-    headers = _supa_headers()
-    if not url or not headers:
+    cliente = supabase_cliente()
+    if cliente is None:
         return False
     try:
-        r = requests.delete(
-            url,
-            headers=headers,
-            params={id_col: f"eq.{id_valor}"},
-            timeout=10,
-        )
-        return r.status_code in (200, 204)
-    except Exception:
+        cliente.requisitar("DELETE", tabela, params={id_col: f"eq.{id_valor}"})
+        return True
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
         return False
 
+def supa_select_em(tabela, coluna, valores, ordem=None, lote=150, limite=1000):
+    """
+    Lê os registros cuja `coluna` está em `valores` com poucas consultas
+    `coluna=in.(...)` (lotes de até `lote` valores) em vez de uma por valor.
+    Um lote que atinge o limite de linhas da API é dividido ao meio.
+    Retorna lista de dicts ou [] em caso de erro (o erro é exibido).
+    """
+    cliente = supabase_cliente()
+    valores = list(dict.fromkeys(v for v in valores if v))
+    if cliente is None or not valores:
+        return []
+
+    def _buscar(parte):
+        params = _params_filtros({coluna: ("in", parte)}) + [("limit", limite)]
+        if ordem:
+            params.append(("order", ordem))
+        linhas = cliente.requisitar("GET", tabela, params=params) or []
+        if len(linhas) >= limite and len(parte) > 1:
+            meio = len(parte) // 2
+            return _buscar(parte[:meio]) + _buscar(parte[meio:])
+        return linhas
+
+    try:
+        registros = []
+        for i in range(0, len(valores), lote):
+            registros.extend(_buscar(valores[i:i + lote]))
+        return registros
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
+        return []
+
 # ── Funções específicas de pedidos ──────────────────────────────────────
 
-def gerar_numero_pedido():
+def carregar_detalhes_pedidos(pedido_ids, historico=True):
     """
-    Gera o próximo número sequencial no padrão MED-AAAA-NNNNNN.
-    Consulta o maior número do ano atual e incrementa.
+    Itens (e histórico de status) de vários pedidos em consultas em lote.
+    Retorna (itens_por_pedido, historico_por_pedido): dicts pedido_id → lista,
+    na mesma ordem em que a API devolveu os registros.
     """
-    ano = datetime.now().year
+    itens, hist = {}, {}
+    for reg in supa_select_em("itens_pedido", "pedido_id", pedido_ids):
+        itens.setdefault(reg.get("pedido_id"), []).append(reg)
+    if historico:
+        for reg in supa_select_em("historico_status", "pedido_id", pedido_ids, ordem="criado_em.asc"):
+            hist.setdefault(reg.get("pedido_id"), []).append(reg)
+    return itens, hist
+
+# Numeração: o contador por ano pedidos_sequencia e a função
+# proximo_numero_pedido (migração supabase/migrations/
+# 20261018000000_pedidos_sequencia.sql) incrementam e devolvem o número numa
+# única instrução, sem corrida entre vendedores.
+
+def _formatar_numero_pedido(ano, seq):
+    return f"MED-{ano}-{str(seq).zfill(6)}"
+
+def _numero_pedido_pelo_maximo(cliente, ano):
+    """Leitura do maior número do ano + 1 (sujeito a corrida; só sem o contador no banco)"""
     prefixo = f"MED-{ano}-"
-    registros = supa_select("pedidos", ordem="numero.desc", limite=1)
+    registros = cliente.requisitar("GET", "pedidos", params=[
+        ("numero", f"like.{prefixo}*"), ("order", "numero.desc"), ("limit", 1)]) or []
     ultimo_seq = 0
     for reg in registros:
         num = reg.get("numero", "")
@@ -149,18 +589,253 @@ def gerar_numero_pedido():
                 ultimo_seq = int(num.replace(prefixo, ""))
             except Exception:
                 pass
-    return f"{prefixo}{str(ultimo_seq + 1).zfill(6)}"
+    return _formatar_numero_pedido(ano, ultimo_seq + 1)
+
+def gerar_numero_pedido(cliente=None):
+    """
+    Gera o próximo número sequencial no padrão MED-AAAA-NNNNNN pelo contador
+    atômico proximo_numero_pedido do banco e, se a função não existir (404,
+    lembrado pelo processo em SupabaseClient.rpc), pelo maior número do ano
+    atual + 1. Retorna "" sem cliente configurado.
+    """
+    cliente = cliente or supabase_cliente()
+    if cliente is None:
+        return ""
+    ano = datetime.now().year
+    try:
+        numero = cliente.rpc("proximo_numero_pedido", {"p_ano": ano})
+        if numero:
+            return numero
+    except SupabaseErro as e:
+        if e.status != 404:
+            raise
+    return _numero_pedido_pelo_maximo(cliente, ano)
+
+# Campos de itens_pedido comparados para decidir se uma linha precisa ser regravada
+_CAMPOS_ITEM_PEDIDO = (
+    "codigo_produto", "descricao", "gramatura", "cx_embarque", "quantidade",
+    "valor_unit", "preco_ref", "preco_historico", "comissao_perc", "total",
+    "alerta_preco_baixo",
+)
+
+# A função Postgres salvar_pedido_completo (migração
+# supabase/migrations/20261018000100_salvar_pedido_completo.sql) grava
+# cabeçalho + itens + histórico numa única transação. Sem ela no banco,
+# salvar_pedido usa o caminho REST em lote (_salvar_pedido_rest).
+
+class SupabaseMemoria:
+    """
+    Backend em memória com a interface de SupabaseClient usada pelos pedidos
+    (requisitar, rpc e cache), para exercitar salvar_pedido — inclusive
+    gravações concorrentes — sem o banco: salvar_pedido(..., cliente=
+    SupabaseMemoria()). Filtros eq./like./in., order e limit nas leituras;
+    POST com on_conflict=id faz upsert. As funções salvar_pedido_completo e
+    proximo_numero_pedido seguem as migrações (cada chamada é atômica);
+    `funcoes` define quais estão "instaladas" — as demais respondem 404, o
+    que leva salvar_pedido ao caminho REST.
+    """
+
+    FUNCOES = ("salvar_pedido_completo", "proximo_numero_pedido")
+    _CAMPOS_ATUALIZAVEIS_PEDIDO = (
+        "status", "cliente_razao_social", "cliente_cpf_cnpj", "cliente_ie", "cliente_cidade",
+        "cliente_estado", "cliente_telefone", "cliente_email_nfe", "cliente_endereco",
+        "representante", "obs_cliente", "tabela_preco", "tipo_frete", "data_venda",
+        "cond_pagto", "estado_comissao", "obs_pedido", "valor_total", "atualizado_em",
+    )
+
+    def __init__(self, funcoes=FUNCOES):
+        self.funcoes = set(funcoes)
+        self.tabelas = {"pedidos": {}, "itens_pedido": {}, "historico_status": {}}
+        self.sequencia = {}
+        self.cache = CacheLeituraSupabase()
+        self._trava = threading.RLock()
+
+    @staticmethod
+    def _condicao(col, expr):
+        op, _, valor = str(expr).partition(".")
+        if op == "eq":
+            return lambda r: str(r.get(col)) == valor
+        if op == "like":
+            return lambda r: str(r.get(col) or "").startswith(valor.rstrip("*"))
+        if op == "in":
+            valores = {v.strip().strip('"') for v in valor.strip("()").split(",")}
+            return lambda r: str(r.get(col)) in valores
+        raise SupabaseErro(f"operador {op} não suportado em memória", 400)
+
+    def _selecionar(self, tabela, params):
+        pares = list(params.items()) if isinstance(params, dict) else list(params or [])
+        ignorar = {"order", "limit", "select", "on_conflict"}
+        condicoes = [self._condicao(c, v) for c, v in pares if c not in ignorar]
+        linhas = [r for r in self.tabelas[tabela].values() if all(f(r) for f in condicoes)]
+        opcoes = dict(p for p in pares if p[0] in ignorar)
+        if "order" in opcoes:
+            col, _, sentido = opcoes["order"].partition(".")
+            linhas.sort(key=lambda r: str(r.get(col) or ""), reverse=sentido.startswith("desc"))
+        if "limit" in opcoes:
+            linhas = linhas[:int(opcoes["limit"])]
+        return linhas
+
+    def _proximo_numero(self, ano):
+        with self._trava:
+            if ano not in self.sequencia:
+                prefixo = f"MED-{ano}-"
+                self.sequencia[ano] = max(
+                    (int(r["numero"][len(prefixo):]) for r in self.tabelas["pedidos"].values()
+                     if str(r.get("numero", "")).startswith(prefixo)), default=0)
+            self.sequencia[ano] += 1
+            return _formatar_numero_pedido(ano, self.sequencia[ano])
+
+    def requisitar(self, metodo, tabela, params=None, dados=None, headers=None,
+                   retornar_total=False, invalidar=True):
+        if tabela.startswith("rpc/"):
+            return self.rpc(tabela[4:], dados)
+        if tabela not in self.tabelas:
+            raise SupabaseErro(f"HTTP 404: tabela {tabela}", 404)
+        with self._trava:
+            linhas = self._selecionar(tabela, params)
+            if metodo == "GET":
+                resposta = [dict(r) for r in linhas]
+                return (resposta, len(resposta)) if retornar_total else resposta
+            if metodo == "PATCH":
+                for r in linhas:
+                    r.update(dados)
+                return [dict(r) for r in linhas]
+            if metodo == "DELETE":
+                for r in linhas:
+                    del self.tabelas[tabela][r["id"]]
+                return None
+            registros = dados if isinstance(dados, list) else [dados]
+            upsert = dict(params or {}).get("on_conflict") == "id"
+            for reg in registros:
+                if reg["id"] in self.tabelas[tabela] and not upsert:
+                    raise SupabaseErro(f"HTTP 409: id duplicado em {tabela}", 409)
+                self.tabelas[tabela].setdefault(reg["id"], {}).update(reg)
+            return [dict(self.tabelas[tabela][reg["id"]]) for reg in registros]
+
+    def rpc(self, funcao, dados=None):
+        if funcao not in self.funcoes:
+            raise SupabaseErro(f"HTTP 404: função {funcao}", 404)
+        if funcao == "proximo_numero_pedido":
+            return self._proximo_numero(dados["p_ano"])
+        pedido, itens, hist = dados["p_pedido"], dados["p_itens"], dados["p_historico"]
+        with self._trava:
+            pedidos = self.tabelas["pedidos"]
+            if pedido["id"] in pedidos:
+                atual = pedidos[pedido["id"]]
+                atual.update({c: pedido.get(c) for c in self._CAMPOS_ATUALIZAVEIS_PEDIDO})
+                numero = atual.get("numero")
+            else:
+                numero = pedido.get("numero") or self._proximo_numero(datetime.now().year)
+                pedidos[pedido["id"]] = {**pedido, "numero": numero}
+            ids = {i["id"] for i in itens}
+            tabela_itens = self.tabelas["itens_pedido"]
+            for item_id in [i for i, r in tabela_itens.items()
+                            if r.get("pedido_id") == pedido["id"] and i not in ids]:
+                del tabela_itens[item_id]
+            for item in itens:
+                if item["id"] in tabela_itens:
+                    tabela_itens[item["id"]].update({c: item.get(c) for c in _CAMPOS_ITEM_PEDIDO})
+                else:
+                    tabela_itens[item["id"]] = dict(item)
+            self.tabelas["historico_status"].setdefault(hist["id"], dict(hist))
+            return numero
+
+    def metricas(self):
+        return []
+
+
+def item_pedido_do_registro(reg):
+    """Converte uma linha de itens_pedido no formato de item do carrinho do ERP (mantém o id)"""
+    return {
+        "id":                 reg.get("id"),
+        "codigo":             reg.get("codigo_produto", ""),
+        "descricao":          reg.get("descricao", ""),
+        "peso":               reg.get("gramatura", ""),
+        "cx_embarque":        reg.get("cx_embarque", ""),
+        "quantidade":         reg.get("quantidade", 0),
+        "valor_unit":         reg.get("valor_unit", 0),
+        "preco_ref":          reg.get("preco_ref", 0),
+        "preco_historico":    reg.get("preco_historico", 0),
+        "comissao":           reg.get("comissao_perc", ""),
+        "total":              reg.get("total", 0),
+        "alerta_preco_baixo": reg.get("alerta_preco_baixo", False),
+    }
+
+def _mesmo_valor_item(a, b):
+    """Compara campos de item tolerando 10 x 10.0 x "10.00" vindos da API"""
+    if a == b:
+        return True
+    try:
+        return abs(float(a) - float(b)) < 1e-9
+    except (TypeError, ValueError):
+        return str(a if a is not None else "") == str(b if b is not None else "")
+
+def _salvar_pedido_rest(cliente, cabecalho, linhas, hist, novo):
+    """
+    Caminho sem a função salvar_pedido_completo: no máximo uma chamada por
+    etapa (cabeçalho, leitura dos itens atuais, DELETE dos removidos, upsert
+    em lote dos novos/alterados, histórico). Itens iguais aos do banco não
+    são regravados. Se um pedido novo falhar nos itens, o cabeçalho é desfeito.
+    """
+    pedido_id = cabecalho["id"]
+    if novo:
+        cliente.requisitar("POST", "pedidos", dados=cabecalho)
+        existentes = {}
+    else:
+        cliente.requisitar("PATCH", "pedidos", params={"id": f"eq.{pedido_id}"}, dados=cabecalho)
+        existentes = {
+            r.get("id"): r for r in cliente.requisitar(
+                "GET", "itens_pedido", params={"pedido_id": f"eq.{pedido_id}"}) or []
+        }
+    try:
+        ids_atuais = {l["id"] for l in linhas}
+        removidos = [i for i in existentes if i not in ids_atuais]
+        if removidos:
+            cliente.requisitar("DELETE", "itens_pedido", params={
+                "id": "in.(" + ",".join(f'"{i}"' for i in removidos) + ")"})
+        gravar = []
+        for l in linhas:
+            atual = existentes.get(l["id"])
+            if atual is None:
+                gravar.append(l)
+            elif not all(_mesmo_valor_item(l[c], atual.get(c)) for c in _CAMPOS_ITEM_PEDIDO):
+                gravar.append({**l, "criado_em": atual.get("criado_em") or l["criado_em"]})
+        if gravar:
+            cliente.requisitar(
+                "POST", "itens_pedido", params={"on_conflict": "id"}, dados=gravar,
+                headers={"Prefer": "resolution=merge-duplicates,return=minimal"})
+    except SupabaseErro:
+        if novo:
+            try:
+                cliente.requisitar("DELETE", "itens_pedido", params={"pedido_id": f"eq.{pedido_id}"})
+                cliente.requisitar("DELETE", "pedidos", params={"id": f"eq.{pedido_id}"})
+            except SupabaseErro:
+                pass
+        raise
+    cliente.requisitar("POST", "historico_status", dados=hist,
+                       headers={"Prefer": "return=minimal"})
 
 def salvar_pedido(dados_cliente, dados_pedido, itens, obs_pedido,
                   status="rascunho", usuario_id=None, usuario_nome=None,
-                  pedido_id=None):
+                  pedido_id=None, cliente=None):
     """
-    Cria ou atualiza um pedido completo (cabeçalho + itens).
+    Cria ou atualiza um pedido completo (cabeçalho + itens + histórico).
     Se pedido_id for fornecido, atualiza; caso contrário, cria novo.
+    Grava tudo numa transação pela função salvar_pedido_completo (migração em
+    supabase/migrations) ou, se ela não existir no banco, pelo caminho REST
+    em lote. Nos dois casos só itens novos ou alterados são regravados;
+    os itens recebem o id da linha em itens_pedido para as próximas gravações.
+    Pedidos novos são numerados pela própria função no banco, sem leitura
+    prévia. `cliente` substitui o SupabaseClient do processo (ex.:
+    SupabaseMemoria em testes de gravações concorrentes).
     Retorna (pedido_id, numero_pedido) ou (None, None) em caso de erro.
     """
+    cliente = cliente or supabase_cliente()
+    if cliente is None:
+        return None, None
     agora = datetime.now().isoformat()
     total = sum(i.get("total", 0) for i in itens)
+    novo = not pedido_id
 
     cabecalho = {
         "status":               status,
@@ -184,33 +859,25 @@ def salvar_pedido(dados_cliente, dados_pedido, itens, obs_pedido,
         "atualizado_em":        agora,
     }
 
-    if pedido_id:
-        # Atualização
-        ok = supa_update("pedidos", pedido_id, cabecalho)
-        if not ok:
-            return None, None
-        # Apagar itens antigos e reinserir
-        supa_delete("itens_pedido", pedido_id, id_col="pedido_id")
-        numero = dados_pedido.get("numero", "")
-    else:
-        # Criação
-        numero = gerar_numero_pedido()
+    if novo:
+        numero = ""
         pedido_id = str(_uuid_mod.uuid4())
         cabecalho.update({
-            "id":           pedido_id,
             "numero":       numero,
             "criado_por_id": usuario_id or "",
             "criado_por_nome": usuario_nome or "",
             "criado_em":    agora,
         })
-        resultado = supa_insert("pedidos", cabecalho)
-        if not resultado:
-            return None, None
+    else:
+        numero = dados_pedido.get("numero", "")
+    cabecalho["id"] = pedido_id
 
-    # Inserir itens
+    linhas = []
     for item in itens:
-        item_row = {
-            "id":              str(_uuid_mod.uuid4()),
+        if not item.get("id"):
+            item["id"] = str(_uuid_mod.uuid4())
+        linhas.append({
+            "id":              item["id"],
             "pedido_id":       pedido_id,
             "codigo_produto":  item.get("codigo", ""),
             "descricao":       item.get("descricao", ""),
@@ -224,10 +891,8 @@ def salvar_pedido(dados_cliente, dados_pedido, itens, obs_pedido,
             "total":           item.get("total", 0),
             "alerta_preco_baixo": item.get("alerta_preco_baixo", False),
             "criado_em":       agora,
-        }
-        supa_insert("itens_pedido", item_row)
+        })
 
-    # Registrar no histórico de status
     hist = {
         "id":              str(_uuid_mod.uuid4()),
         "pedido_id":       pedido_id,
@@ -235,33 +900,57 @@ def salvar_pedido(dados_cliente, dados_pedido, itens, obs_pedido,
         "status_novo":     status,
         "usuario_id":      usuario_id or "",
         "usuario_nome":    usuario_nome or "",
-        "observacao":      f"Pedido {'criado' if not pedido_id else 'atualizado'}",
+        "observacao":      f"Pedido {'criado' if novo else 'atualizado'}",
         "criado_em":       agora,
     }
-    supa_insert("historico_status", hist)
+
+    try:
+        try:
+            numero = cliente.rpc("salvar_pedido_completo", {
+                "p_pedido": cabecalho, "p_itens": linhas, "p_historico": hist}) or numero
+        except SupabaseErro as e:
+            if e.status != 404:
+                raise
+            # Função ainda não criada no banco: grava em lote pela API REST
+            if novo and not numero:
+                numero = cabecalho["numero"] = gerar_numero_pedido(cliente)
+            _salvar_pedido_rest(cliente, cabecalho, linhas, hist, novo)
+    except SupabaseErro as e:
+        _avisar_erro_supabase(e)
+        return None, None
 
     return pedido_id, numero
 
 def mudar_status_pedido(pedido_id, status_novo, usuario_id,
                         usuario_nome, observacao="", status_anterior=""):
-    """Muda o status de um pedido e registra no histórico."""
+    """
+    Muda o status de um pedido e registra no histórico. As leituras de
+    pedidos em cache recebem o novo status no lugar, sem nova consulta.
+    """
+    cliente = supabase_cliente()
+    if cliente is None:
+        return False
     agora = datetime.now().isoformat()
-    ok = supa_update("pedidos", pedido_id, {
-        "status": status_novo,
-        "atualizado_em": agora,
+    campos = {"status": status_novo, "atualizado_em": agora}
+    try:
+        cliente.requisitar("PATCH", "pedidos", params={"id": f"eq.{pedido_id}"},
+                           dados=campos, invalidar=False)
+    except SupabaseErro as e:
+        cliente.cache.invalidar("pedidos")
+        _avisar_erro_supabase(e)
+        return False
+    cliente.cache.atualizar_linhas("pedidos", pedido_id, campos)
+    supa_insert("historico_status", {
+        "id":              str(_uuid_mod.uuid4()),
+        "pedido_id":       pedido_id,
+        "status_anterior": status_anterior,
+        "status_novo":     status_novo,
+        "usuario_id":      usuario_id,
+        "usuario_nome":    usuario_nome,
+        "observacao":      observacao,
+        "criado_em":       agora,
     })
-    if ok:
-        supa_insert("historico_status", {
-            "id":              str(_uuid_mod.uuid4()),
-            "pedido_id":       pedido_id,
-            "status_anterior": status_anterior,
-            "status_novo":     status_novo,
-            "usuario_id":      usuario_id,
-            "usuario_nome":    usuario_nome,
-            "observacao":      observacao,
-            "criado_em":       agora,
-        })
-    return ok
+    return True
 
 # ── Funções de autenticação via Supabase ────────────────────────────────
 
@@ -747,94 +1436,963 @@ GITHUB_REPO = "fabiosilvavendas-byte/CRM_Medtextil2.0"
 GITHUB_FOLDER = "dados"  # ⭐ PASTA ONDE ESTÃO AS PLANILHAS
 GITHUB_TOKEN = None  # Opcional: adicione token se repositório for privado
 
+def _buscar_planilhas_github():
+    """Consulta a pasta 'dados' no GitHub (sem cache). Propaga exceções de conexão."""
+    if GITHUB_TOKEN:
+        g = Github(GITHUB_TOKEN, timeout=15)
+    else:
+        g = Github(timeout=15)
+
+    repo = g.get_repo(GITHUB_REPO)
+    # ⭐ BUSCAR NA PASTA 'dados'
+    contents = repo.get_contents(GITHUB_FOLDER)
+
+    planilhas = {
+        'vendas': None,
+        'inadimplencia': None,
+        'vendas_produto': None,
+        'produtos_agrupados': None,
+        'pedidos_pendentes': None,
+        'tabela_ne': None,
+        'contrato': None,
+        'todas': []
+    }
+    
+    for content in contents:
+        if content.name.endswith(('.xlsx', '.xls')):
+            info = {
+                'nome': content.name,
+                'url': content.download_url,
+                'path': content.path,
+                'sha': content.sha
+            }
+            planilhas['todas'].append(info)
+            
+            # Identificar planilha de vendas
+            if 'CONSULTA_VENDEDORES' in content.name.upper():
+                planilhas['vendas'] = info
+            
+            # Identificar planilha de inadimplência
+            if 'LANCAMENTO A RECEBER' in content.name.upper() or 'LANCAMENTO_A_RECEBER' in content.name.upper():
+                planilhas['inadimplencia'] = info
+            
+            # Identificar planilha de vendas por produto
+            if 'VENDAS POR PRODUTO' in content.name.upper() and 'GERAL' in content.name.upper():
+                planilhas['vendas_produto'] = info
+            
+            # Identificar planilha de produtos agrupados
+            if 'PRODUTOS_AGRUPADOS_COMPLETOS_CONCILIADOS' in content.name.upper():
+                planilhas['produtos_agrupados'] = info
+            
+            # Identificar planilha de pedidos pendentes
+            if 'PEDIDOSPENDENTES' in content.name.upper().replace(' ', '').replace('_', ''):
+                planilhas['pedidos_pendentes'] = info
+
+            # Identificar tabela NE
+            if 'TABELA_NE' in content.name.upper().replace(' ', '_'):
+                planilhas['tabela_ne'] = info
+            # Identificar planilha de contratos (Grid Contrato Consulta)
+            if 'CONTRATO' in content.name.upper() and 'CONSULTA' in content.name.upper():
+                planilhas['contrato'] = info
+
+    return planilhas
+
+
 @st.cache_data(ttl=3600)
 def listar_planilhas_github():
     """Lista todos os arquivos Excel da pasta 'dados' no repositório GitHub"""
     try:
-        if GITHUB_TOKEN:
-            g = Github(GITHUB_TOKEN, timeout=15)
-        else:
-            g = Github(timeout=15)
-        
-        repo = g.get_repo(GITHUB_REPO)
-        # ⭐ BUSCAR NA PASTA 'dados'
-        contents = repo.get_contents(GITHUB_FOLDER)
-        
-        planilhas = {
-            'vendas': None,
-            'inadimplencia': None,
-            'vendas_produto': None,
-            'produtos_agrupados': None,
-            'pedidos_pendentes': None,
-            'tabela_ne': None,
-            'contrato': None,
-            'todas': []
-        }
-        
-        for content in contents:
-            if content.name.endswith(('.xlsx', '.xls')):
-                info = {
-                    'nome': content.name,
-                    'url': content.download_url,
-                    'path': content.path
-                }
-                planilhas['todas'].append(info)
-                
-                # Identificar planilha de vendas
-                if 'CONSULTA_VENDEDORES' in content.name.upper():
-                    planilhas['vendas'] = info
-                
-                # Identificar planilha de inadimplência
-                if 'LANCAMENTO A RECEBER' in content.name.upper() or 'LANCAMENTO_A_RECEBER' in content.name.upper():
-                    planilhas['inadimplencia'] = info
-                
-                # Identificar planilha de vendas por produto
-                if 'VENDAS POR PRODUTO' in content.name.upper() and 'GERAL' in content.name.upper():
-                    planilhas['vendas_produto'] = info
-                
-                # Identificar planilha de produtos agrupados
-                if 'PRODUTOS_AGRUPADOS_COMPLETOS_CONCILIADOS' in content.name.upper():
-                    planilhas['produtos_agrupados'] = info
-                
-                # Identificar planilha de pedidos pendentes
-                if 'PEDIDOSPENDENTES' in content.name.upper().replace(' ', '').replace('_', ''):
-                    planilhas['pedidos_pendentes'] = info
-
-                # Identificar tabela NE
-                if 'TABELA_NE' in content.name.upper().replace(' ', '_'):
-                    planilhas['tabela_ne'] = info
-                # Identificar planilha de contratos (Grid Contrato Consulta)
-                if 'CONTRATO' in content.name.upper() and 'CONSULTA' in content.name.upper():
-                    planilhas['contrato'] = info
+        planilhas = _buscar_planilhas_github()
 
-        
         if not planilhas['todas']:
             st.warning(f"⚠️ Nenhuma planilha Excel encontrada na pasta '{GITHUB_FOLDER}'")
-        
+
         return planilhas
     except Exception as e:
         st.error(f"❌ Erro ao conectar ao GitHub: {str(e)}")
         st.info(f"💡 Verificando: {GITHUB_REPO}/{GITHUB_FOLDER}")
         return {'vendas': None, 'inadimplencia': None, 'vendas_produto': None, 'produtos_agrupados': None, 'pedidos_pendentes': None, 'tabela_ne': None, 'contrato': None, 'todas': []}
 
-@st.cache_data(ttl=3600)
-def carregar_planilha_github(url):
-    """Carrega planilha diretamente do GitHub"""
+# ====================== SNAPSHOT LOCAL DAS PLANILHAS ======================
+# Cada planilha baixada é gravada em disco em formato colunar (Parquet),
+# identificada pelo SHA do blob no GitHub. Enquanto o arquivo não mudar no
+# repositório, o app relê o snapshot local em vez de baixar e reprocessar o
+# Excel — inclusive após reinício do processo. Sem pyarrow, usa pickle.
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots")
+
+try:
+    import pyarrow  # noqa: F401
+    _SNAPSHOT_PARQUET = True
+except ImportError:
+    _SNAPSHOT_PARQUET = False
+
+
+def _snapshot_base(url, sha):
+    """Prefixo do snapshot: <nome do arquivo normalizado>__<sha>"""
+    nome = os.path.basename(unquote(urlparse(url).path)) or "planilha"
+    nome = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.splitext(nome)[0])
+    return f"{nome}__{sha}"
+
+
+def ler_snapshot(url, sha):
+    """Retorna o DataFrame do snapshot local, ou None se não existir/estiver corrompido"""
+    if not sha:
+        return None
+    base = os.path.join(SNAPSHOT_DIR, _snapshot_base(url, sha))
+    try:
+        if _SNAPSHOT_PARQUET and os.path.exists(base + ".parquet"):
+            return pd.read_parquet(base + ".parquet")
+        if os.path.exists(base + ".pkl"):
+            return pd.read_pickle(base + ".pkl")
+    except Exception:
+        pass
+    return None
+
+
+def gravar_snapshot(url, sha, df):
+    """Grava o snapshot (escrita atômica) e remove versões antigas da mesma planilha"""
+    if not sha or df is None:
+        return
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        base = _snapshot_base(url, sha)
+        destino = None
+        if _SNAPSHOT_PARQUET:
+            destino = os.path.join(SNAPSHOT_DIR, base + ".parquet")
+            try:
+                df.to_parquet(destino + ".tmp", index=False)
+            except Exception:
+                # Colunas com tipos mistos não são aceitas pelo Parquet
+                destino = None
+        if destino is None:
+            destino = os.path.join(SNAPSHOT_DIR, base + ".pkl")
+            df.to_pickle(destino + ".tmp")
+        os.replace(destino + ".tmp", destino)
+
+        prefixo = base.rsplit("__", 1)[0] + "__"
+        for arq in os.listdir(SNAPSHOT_DIR):
+            if arq.startswith(prefixo) and not arq.startswith(base):
+                try:
+                    os.remove(os.path.join(SNAPSHOT_DIR, arq))
+                except OSError:
+                    pass
+    except Exception:
+        # Snapshot é apenas otimização — falha ao gravar não interrompe o app
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def sessao_http():
+    """requests.Session compartilhada (keep-alive, pool de conexões) para baixar as planilhas"""
+    sessao = requests.Session()
+    sessao.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return sessao
+
+
+# ====================== LOGO — CACHE DE ATIVOS ======================
+# O logo é lido uma vez por processo (de preferência do dados/logo.png local)
+# e entregue em memória aos geradores de PDF/PNG: nenhum download por página.
+LOGO_LOCAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), GITHUB_FOLDER, "logo.png")
+LOGO_URLS = (
+    f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/{GITHUB_FOLDER}/logo.png",
+    "https://i.imgur.com/gt3rgyL.png",
+)
+
+@st.cache_resource(show_spinner=False)
+def _carregar_logo():
+    """PNG do logo: arquivo local ou, na falta, a primeira URL que responder (falha não fica em cache)"""
+    if os.path.exists(LOGO_LOCAL):
+        with open(LOGO_LOCAL, "rb") as f:
+            return f.read()
+    for url in LOGO_URLS:
+        try:
+            r = sessao_http().get(url, timeout=8)
+            if r.status_code == 200 and r.content:
+                return r.content
+        except requests.RequestException:
+            continue
+    raise FileNotFoundError("logo indisponível (local e remoto)")
+
+def logo_bytes():
+    """Bytes do PNG do logo, ou None se indisponível"""
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        df = pd.read_excel(io.BytesIO(response.content))
+        return _carregar_logo()
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def _caminho_logo():
+    if os.path.exists(LOGO_LOCAL):
+        return LOGO_LOCAL
+    import tempfile
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+        f.write(_carregar_logo())
+        return f.name
+
+def logo_caminho():
+    """Caminho de um arquivo com o logo (para FPDF.image, que o embute uma vez por documento), ou None"""
+    try:
+        return _caminho_logo()
+    except Exception:
+        return None
+
+@st.cache_resource(show_spinner=False)
+def _logo_base64():
+    import base64
+    return base64.b64encode(_carregar_logo()).decode()
+
+def logo_base64():
+    """Logo em base64 para <img src="data:image/png;base64,...">, ou "" se indisponível"""
+    try:
+        return _logo_base64()
+    except Exception:
+        return ""
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _ler_planilha_github(url, sha=None):
+    """
+    Baixa e lê a planilha do GitHub, reaproveitando o snapshot local quando o
+    SHA não mudou. Erros são propagados (e não ficam em cache): quem exibe a
+    mensagem é a sessão que pediu a planilha.
+    """
+    df = ler_snapshot(url, sha)
+    if df is not None:
         return df
-    except requests.exceptions.Timeout:
-        st.error("⏱️ Timeout ao carregar planilha. Tente novamente.")
+    response = sessao_http().get(url, timeout=30)
+    response.raise_for_status()
+    df = pd.read_excel(io.BytesIO(response.content))
+    gravar_snapshot(url, sha, df)
+    return df
+
+def mensagem_erro_planilha(erro):
+    """Texto exibido ao usuário para uma falha ao carregar planilha"""
+    if isinstance(erro, requests.exceptions.Timeout):
+        return "⏱️ Timeout ao carregar planilha. Tente novamente."
+    if isinstance(erro, requests.exceptions.RequestException):
+        return f"❌ Erro ao carregar planilha: {str(erro)}"
+    return f"❌ Erro ao processar planilha: {str(erro)}"
+
+def carregar_planilha_github(url, sha=None):
+    """Carrega planilha do GitHub (em cache por url/sha); em caso de erro exibe a mensagem e retorna None"""
+    try:
+        return _ler_planilha_github(url, sha)
+    except Exception as e:
+        st.error(mensagem_erro_planilha(e))
         return None
-    except requests.exceptions.RequestException as e:
-        st.error(f"❌ Erro ao carregar planilha: {str(e)}")
+
+# ====================== ATUALIZAÇÃO SELETIVA (POR SHA) ======================
+# Compara o SHA atual de cada arquivo em 'dados/' com o da listagem em cache.
+# Só a listagem é invalidada; as planilhas alteradas passam a ter outra chave
+# (url, sha) em carregar_planilha_github e as etapas derivadas (processar_dados,
+# processar_inadimplencia...) recalculam apenas para elas. O que não mudou
+# continua servido do cache.
+def atualizar_planilhas_alteradas():
+    """Recarrega apenas as planilhas cujo SHA mudou. Retorna um relatório da operação."""
+    inicio = time.perf_counter()
+    anteriores = {p['path']: p for p in listar_planilhas_github().get('todas', [])}
+    atuais = {p['path']: p for p in _buscar_planilhas_github().get('todas', [])}
+
+    alteradas = [p for path, p in atuais.items()
+                 if path not in anteriores or anteriores[path].get('sha') != p.get('sha')]
+    removidas = [p['nome'] for path, p in anteriores.items() if path not in atuais]
+
+    if alteradas or removidas:
+        listar_planilhas_github.clear()
+
+    detalhes = []
+    for info in alteradas:
+        t0 = time.perf_counter()
+        ok = carregar_planilha_github(info['url'], info.get('sha')) is not None
+        detalhes.append({'nome': info['nome'], 'ok': ok, 'segundos': time.perf_counter() - t0})
+
+    return {
+        'alteradas': detalhes,
+        'removidas': removidas,
+        'inalteradas': len(atuais) - len(alteradas),
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+# ====================== PEDIDOS PENDENTES — LEITURA DA PLANILHA ======================
+# O PEDIDOSPENDENTES.xlsx é um relatório agrupado (linha de cliente seguida das
+# linhas "N° do pedido:"), que o pd.read_excel não estrutura. O XML interno é
+# lido em streaming (iterparse), linha a linha, liberando cada <row> após o uso.
+_NS_XLSX = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def _ler_shared_strings_xlsx(z):
+    """Lista de textos compartilhados (um por <si>, concatenando trechos formatados)"""
+    if 'xl/sharedStrings.xml' not in z.namelist():
+        return []
+    textos = []
+    with z.open('xl/sharedStrings.xml') as f:
+        for _evento, elem in iterparse(f, events=('end',)):
+            if elem.tag == _NS_XLSX + 'si':
+                textos.append(''.join(t.text or '' for t in elem.iter(_NS_XLSX + 't')))
+                elem.clear()
+    return textos
+
+
+def _linhas_sheet_xlsx(z, shared_strings, sheet='xl/worksheets/sheet1.xml'):
+    """Gera um dict {coluna: valor} por linha não vazia da planilha"""
+    with z.open(sheet) as f:
+        for _evento, row in iterparse(f, events=('end',)):
+            if row.tag != _NS_XLSX + 'row':
+                continue
+            row_data = {}
+            for cell in row.iter(_NS_XLSX + 'c'):
+                if cell.get('t') == 'inlineStr':
+                    texto = ''.join(t.text or '' for t in cell.iter(_NS_XLSX + 't'))
+                    if texto:
+                        row_data[''.join(ch for ch in cell.get('r', '') if ch.isalpha())] = texto
+                    continue
+                v_elem = cell.find(_NS_XLSX + 'v')
+                if v_elem is None or not v_elem.text:
+                    continue
+                col = ''.join(ch for ch in cell.get('r', '') if ch.isalpha())
+                if cell.get('t', 'n') == 's':
+                    idx = int(v_elem.text)
+                    row_data[col] = shared_strings[idx] if idx < len(shared_strings) else v_elem.text
+                else:
+                    row_data[col] = v_elem.text
+            row.clear()
+            if row_data:
+                yield row_data
+
+
+@st.cache_data(ttl=3600)
+def carregar_pedidos_pendentes(url, sha=None):
+    """
+    Baixa e interpreta o PEDIDOSPENDENTES.xlsx uma única vez por versão (url, sha).
+    Retorna um item por pedido/produto (sem duplicatas), com colunas numéricas e
+    DataEmissao em datetime. Erros de download/leitura são propagados ao chamador.
+    """
+    response = sessao_http().get(url, timeout=30)
+    response.raise_for_status()
+
+    data = []
+    current_client = None
+    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
+        shared_strings = _ler_shared_strings_xlsx(z)
+        for row_data in _linhas_sheet_xlsx(z, shared_strings):
+            col_a = row_data.get('A', '')
+            col_b = row_data.get('B', '')
+
+            # Linha de cliente (apenas coluna A preenchida com nome)
+            if col_a and not col_b and 'N° do pedido' not in col_a and 'Valor Total' not in col_a and col_a != 'Subgrupo:':
+                current_client = col_a
+                continue
+
+            # Linha de pedido (tem "N° do pedido:")
+            if 'N° do pedido' not in col_a:
+                continue
+            descricao = row_data.get('C', '')
+            if not descricao or ' - ' not in descricao:
+                continue
+
+            # Separar observação da descrição (tudo após a palavra "observa")
+            _obs_match = re.search(r'observa[çc][aã]o[:\s]*', descricao, re.IGNORECASE)
+            if _obs_match:
+                observacao = descricao[_obs_match.end():].strip()
+                descricao = descricao[:_obs_match.start()].strip()
+            else:
+                observacao = ''
+
+            try:
+                qtd_contratada = float(row_data.get('D', 0))
+                valor_unit = float(row_data.get('E', 0))
+                qtd_entregue = float(row_data.get('H', 0))
+                perc_entregue = float(row_data.get('I', 0))
+            except (TypeError, ValueError):
+                continue
+            qtd_pendente = qtd_contratada - qtd_entregue
+
+            # Data de emissão (coluna G) vem como serial do Excel
+            dt_emissao = None
+            if row_data.get('G'):
+                try:
+                    dt_emissao = pd.Timestamp('1899-12-30') + pd.Timedelta(days=float(row_data['G']))
+                except Exception:
+                    dt_emissao = None
+
+            data.append({
+                'Cliente': current_client,
+                'NumeroPedido': col_b,
+                'CodigoProduto': descricao.split(' - ')[0].strip(),
+                'Descricao': descricao,
+                'Observacoes': observacao,
+                'QtdContratada': qtd_contratada,
+                'QtdEntregue': qtd_entregue,
+                'QtdPendente': qtd_pendente,
+                'ValorUnit': valor_unit,
+                'ValorPendente': qtd_pendente * valor_unit,
+                'DataEmissao': dt_emissao,
+                'Vendedor': row_data.get('J', ''),
+                'PercEntregue': perc_entregue
+            })
+
+    df_pendentes = pd.DataFrame(data, columns=[
+        'Cliente', 'NumeroPedido', 'CodigoProduto', 'Descricao', 'Observacoes',
+        'QtdContratada', 'QtdEntregue', 'QtdPendente', 'ValorUnit', 'ValorPendente',
+        'DataEmissao', 'Vendedor', 'PercEntregue'
+    ])
+    df_pendentes['DataEmissao'] = pd.to_datetime(df_pendentes['DataEmissao'], errors='coerce')
+    return df_pendentes.drop_duplicates(subset=['NumeroPedido', 'CodigoProduto'])
+
+# ====================== REGISTRO DE DATASETS (SOMENTE LEITURA) ======================
+# st.cache_data devolve uma cópia nova a cada chamada; para o catálogo de produtos,
+# usado em quase todos os módulos, isso significava dezenas de cópias re-normalizadas
+# por rerun. Aqui o catálogo é normalizado UMA vez por versão (url, sha), fica no
+# processo (st.cache_resource, compartilhado entre sessões) e os módulos recebem
+# visões rasas (copy(deep=False)) — sem duplicar os dados. Não altere valores
+# in-place nas visões; acrescentar colunas ou renomear é seguro.
+def _chave_produto(df):
+    """Coluna de código do catálogo: ID_COD ou, na falta, a primeira com CODIGO/COD"""
+    if 'ID_COD' in df.columns:
+        return 'ID_COD'
+    return next((c for c in df.columns if any(x in c for x in ['CODIGO', 'COD'])), None)
+
+
+def _mapa_por_codigo(chaves, valores):
+    """dict código → valor, mantendo a primeira ocorrência de cada código"""
+    serie = pd.Series(valores.to_numpy(), index=chaves.to_numpy())
+    return serie[~serie.index.duplicated(keep='first')].to_dict()
+
+
+def normalizar_texto_busca(texto):
+    """Maiúsculas, sem acentos e só letras/números separados por espaço (chave de busca)"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').upper()
+    return re.sub(r'[^A-Z0-9]+', ' ', texto).strip()
+
+
+def _trigramas(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class IndiceBusca:
+    """
+    Índice de busca textual sem acentos: tokens → linhas, vocabulário ordenado
+    (busca por prefixo com bisect) e trigramas (trechos no meio da palavra e
+    pequenos erros de digitação). buscar() devolve as linhas ordenadas por
+    relevância: palavra exata > prefixo > semelhança por trigramas.
+    """
+
+    def __init__(self, textos):
+        self._linhas_token = {}
+        for pos, texto in enumerate(textos):
+            for token in set(normalizar_texto_busca(texto).split()):
+                self._linhas_token.setdefault(token, []).append(pos)
+        self._vocab = sorted(self._linhas_token)
+        self._tokens_trigrama = {}
+        for token in self._vocab:
+            for tri in _trigramas(token):
+                self._tokens_trigrama.setdefault(tri, []).append(token)
+
+    def _pontuar_token(self, termo):
+        """{posição: pontuação} das linhas com algum token compatível com o termo"""
+        pontos = {}
+
+        def _marcar(token, valor):
+            for pos in self._linhas_token[token]:
+                if valor > pontos.get(pos, 0):
+                    pontos[pos] = valor
+
+        if termo in self._linhas_token:
+            _marcar(termo, 3.0)
+        i = bisect_left(self._vocab, termo)
+        while i < len(self._vocab) and self._vocab[i].startswith(termo):
+            if self._vocab[i] != termo:
+                _marcar(self._vocab[i], 2.0)
+            i += 1
+        tris = _trigramas(termo)
+        if tris:
+            comuns = {}
+            for tri in tris:
+                for token in self._tokens_trigrama.get(tri, ()):
+                    comuns[token] = comuns.get(token, 0) + 1
+            for token, n in comuns.items():
+                similaridade = n / len(tris)
+                if similaridade >= 0.5:
+                    _marcar(token, similaridade)
+        return pontos
+
+    def buscar(self, consulta, limite=20):
+        """Posições ordenadas por relevância (linhas que casam com todos os termos primeiro)"""
+        termos = normalizar_texto_busca(consulta).split()
+        if not termos:
+            return []
+        total, casados = {}, {}
+        for termo in dict.fromkeys(termos):
+            for pos, valor in self._pontuar_token(termo).items():
+                total[pos] = total.get(pos, 0) + valor
+                casados[pos] = casados.get(pos, 0) + 1
+        ordem = sorted(total, key=lambda pos: (-casados[pos], -total[pos], pos))
+        return ordem[:limite] if limite else ordem
+
+
+def _texto_coluna(serie):
+    """Valores da coluna como texto sem espaços nas pontas ('' para vazios)"""
+    texto = pd.Series(serie.to_numpy().astype(str), index=serie.index, dtype=object).str.strip()
+    return texto.where(serie.notna(), '')
+
+
+class ProductCatalog:
+    """
+    Índice do catálogo de produtos, montado uma vez por versão da planilha.
+    Consultas por código (qualquer formato: 476, '476', '476.0') em O(1) e
+    índice de busca (IndiceBusca) pré-montado para pesquisa por descrição.
+    """
+    COLUNAS_DESCRICAO = ['GRUPO', 'DESCRIÇÃO', 'DESCRICAO', 'LINHA', 'LINHAS']
+
+    def __init__(self, df):
+        df.columns = df.columns.astype(str).str.upper().str.strip()
+        self.col_codigo = _chave_produto(df)
+        self.col_preco = next((c for c in df.columns if 'PRECO' in c or 'PREÇO' in c), None)
+        self.col_gramatura = next((c for c in df.columns if 'GRAMATUR' in c), None)
+        self.col_cx = next((c for c in df.columns if 'CX_EMB' in c), None)
+        if self.col_codigo and 'ID_COD_N' not in df.columns:
+            df['ID_COD_N'] = normalizar_codigo_serie(df[self.col_codigo])
+        self.df = df
+
+        self._posicao, self.gramaturas, self.cx_embs, self.precos = {}, {}, {}, {}
+        self.codigos = []
+        if self.col_codigo:
+            cod_n = df['ID_COD_N']
+            primeira = ~cod_n.duplicated(keep='first')
+            self._posicao = dict(zip(cod_n[primeira], np.flatnonzero(primeira.to_numpy())))
+            self.codigos = sorted(df[self.col_codigo].dropna().astype(str).unique().tolist())
+            if self.col_gramatura:
+                _g = _texto_coluna(df[self.col_gramatura])
+                _ok = ~_g.str.lower().isin(['nan', 'none', '0', '0.0', ''])
+                self.gramaturas = _mapa_por_codigo(cod_n[_ok], _g[_ok])
+            if self.col_cx:
+                _cx = pd.to_numeric(df[self.col_cx], errors='coerce')
+                self.cx_embs = _mapa_por_codigo(cod_n[_cx > 0], _cx[_cx > 0])
+            if self.col_preco:
+                _pr = pd.to_numeric(df[self.col_preco], errors='coerce')
+                self.precos = _mapa_por_codigo(cod_n[_pr.notna()], _pr[_pr.notna()])
+
+        # Descrição montada (GRUPO + DESCRIÇÃO + LINHA)
+        _partes = [_texto_coluna(df[c]) for c in self.COLUNAS_DESCRICAO if c in df.columns]
+        self.descricoes = pd.Series(
+            [' '.join(v for v in valores if v) for valores in zip(*[p.tolist() for p in _partes])]
+            if _partes else '',
+            index=df.index, dtype=object
+        )
+
+        # Índice de busca por descrição: um registro por produto (primeira linha de cada código)
+        self._pos_busca = (np.flatnonzero((~df['ID_COD_N'].duplicated(keep='first')).to_numpy())
+                           if self.col_codigo else np.arange(len(df)))
+        _nomes = [_texto_coluna(df[c]) for c in df.columns if 'NOME' in c or c == 'PRODUTO']
+        _cods = df['ID_COD_N'] if self.col_codigo else pd.Series('', index=df.index)
+        self._busca = IndiceBusca(
+            ' '.join([_cods.iloc[p], self.descricoes.iloc[p]] + [n.iloc[p] for n in _nomes])
+            for p in self._pos_busca
+        )
+
+    def __len__(self):
+        return len(self.df)
+
+    @staticmethod
+    def normalizar(codigo):
+        """Mesma normalização de normalizar_codigo_serie, para um valor"""
+        try:
+            return str(int(float(str(codigo).strip())))
+        except Exception:
+            return str(codigo).strip()
+
+    def posicao(self, codigo):
+        """Posição (iloc) da primeira linha do código, ou None"""
+        return self._posicao.get(self.normalizar(codigo))
+
+    def linha(self, codigo):
+        """Linha do catálogo (Series) para o código, ou None"""
+        pos = self.posicao(codigo)
+        return None if pos is None else self.df.iloc[pos]
+
+    def gramatura(self, codigo, padrao=''):
+        return self.gramaturas.get(self.normalizar(codigo), padrao)
+
+    def cx_emb(self, codigo, padrao=None):
+        return self.cx_embs.get(self.normalizar(codigo), padrao)
+
+    def preco(self, codigo, padrao=0.0):
+        return self.precos.get(self.normalizar(codigo), padrao)
+
+    def descricao(self, codigo, padrao=''):
+        pos = self.posicao(codigo)
+        return self.descricoes.iloc[pos] if pos is not None else padrao
+
+    def buscar(self, termo, limite=20):
+        """Produtos mais relevantes para o termo (sem acentos, por palavra/prefixo/trecho): [(codigo, descricao)]"""
+        resultado = []
+        for i in self._busca.buscar(termo, limite):
+            pos = self._pos_busca[i]
+            codigo = str(self.df[self.col_codigo].iloc[pos]) if self.col_codigo else ''
+            resultado.append((codigo, self.descricoes.iloc[pos]))
+        return resultado
+
+
+@st.cache_resource(ttl=3600, max_entries=4, show_spinner=False)
+def _carregar_catalogo_produtos(url, sha=None):
+    """ProductCatalog do Produtos_Agrupados (colunas em maiúsculas, ID_COD_N e mapas por código)"""
+    return ProductCatalog(_ler_planilha_github(url, sha))
+
+
+def indice_produtos(info):
+    """ProductCatalog compartilhado (somente leitura) da planilha, ou None"""
+    if not info:
         return None
+    try:
+        return _carregar_catalogo_produtos(info['url'], info.get('sha'))
     except Exception as e:
-        st.error(f"❌ Erro ao processar planilha: {str(e)}")
+        st.error(mensagem_erro_planilha(e))
         return None
 
+
+def catalogo_produtos(info):
+    """Visão (sem cópia) do catálogo normalizado a partir do info {'url','sha'} da planilha, ou None"""
+    cat = indice_produtos(info)
+    return cat.df.copy(deep=False) if cat else None
+
+# ====================== PREFETCH DAS PLANILHAS ======================
+# Logo após a listagem do GitHub, todas as planilhas usadas pelos módulos são
+# baixadas e lidas em paralelo (pool de threads sobre a sessão HTTP
+# compartilhada), aquecendo os mesmos caches que os módulos consultam. Quando
+# um módulo pede uma planilha ainda em download, o cache do Streamlit aguarda
+# a thread em vez de baixar de novo. As threads não têm contexto de sessão
+# (são do processo): os carregadores chamados aqui só levantam exceções, e a
+# sessão que lê o resultado é quem exibe o erro guardado no future.
+_PLANILHAS_PREFETCH = ['vendas', 'produtos_agrupados', 'inadimplencia', 'contrato', 'pedidos_pendentes']
+
+def _baixar_planilha(chave, info):
+    """Carrega uma planilha pelo mesmo caminho em cache usado pelo módulo correspondente"""
+    if chave == 'pedidos_pendentes':
+        carregar_pedidos_pendentes(info['url'], info.get('sha'))
+    elif chave == 'produtos_agrupados':
+        _carregar_catalogo_produtos(info['url'], info.get('sha'))
+    else:
+        _ler_planilha_github(info['url'], info.get('sha'))
+    return chave
+
+
+@st.cache_resource(ttl=3600, max_entries=2, show_spinner=False)
+def iniciar_prefetch_planilhas(versoes, _planilhas):
+    """
+    Dispara o download das planilhas em paralelo, uma vez por versão da
+    listagem (tupla de path/sha). Retorna os futures por planilha; erros ficam
+    no future (ver erros_prefetch) e o módulo volta a tentar ao abrir.
+    """
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+    futuros = {
+        chave: executor.submit(_baixar_planilha, chave, _planilhas[chave])
+        for chave in _PLANILHAS_PREFETCH if _planilhas.get(chave)
+    }
+    executor.shutdown(wait=False)
+    return futuros
+
+
+def erros_prefetch(futuros):
+    """{planilha: exceção} dos downloads em segundo plano que já terminaram com erro"""
+    return {chave: futuro.exception() for chave, futuro in futuros.items()
+            if futuro.done() and futuro.exception() is not None}
+
+# ====================== TAREFAS EM SEGUNDO PLANO ======================
+# Exportações longas (ZIP semanal, PDF de performance, cards PNG) rodam num
+# pool de threads do processo em vez de prender o script da sessão. A tabela
+# de tarefas fica em memória, por usuário, e os arquivos gerados em disco
+# (EXPORTS_DIR): navegar, usar outros widgets ou reconectar o navegador não
+# interrompe nem perde o resultado.
+EXPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".exports")
+
+
+class ExecutorTarefas:
+    """
+    Fila de exportações em segundo plano. Cada tarefa recebe uma função
+    funcao(progresso) -> bytes; progresso(feitos, total, etapa="") atualiza a
+    barra exibida no painel. Tarefas concluídas ficam disponíveis por
+    `reter_horas`, no máximo `max_por_dono` por usuário.
+    """
+
+    def __init__(self, diretorio=EXPORTS_DIR, max_workers=2, reter_horas=24, max_por_dono=10):
+        self.diretorio = diretorio
+        self.reter_horas = reter_horas
+        self.max_por_dono = max_por_dono
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="exportacao")
+        self._tarefas = {}
+        self._trava = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+        self._varrer_diretorio()
+
+    def _varrer_diretorio(self):
+        """
+        Apaga do disco os arquivos vencidos pela data de modificação. A tabela
+        de tarefas vive só na memória do processo: o que sobrou de execuções
+        anteriores (reinício, deploy, .tmp de escrita interrompida) não tem mais
+        dono e seria acumulado para sempre.
+        """
+        corte = time.time() - self.reter_horas * 3600
+        try:
+            entradas = list(os.scandir(self.diretorio))
+        except OSError:
+            return
+        for entrada in entradas:
+            try:
+                if entrada.is_file() and entrada.stat().st_mtime < corte:
+                    os.remove(entrada.path)
+            except OSError:
+                pass
+
+    def _arquivo(self, tarefa_id):
+        return os.path.join(self.diretorio, f"{tarefa_id}.bin")
+
+    def _descartar(self, tarefa_id):
+        self._tarefas.pop(tarefa_id, None)
+        try:
+            os.remove(self._arquivo(tarefa_id))
+        except OSError:
+            pass
+
+    def _limpar(self, dono):
+        """Remove tarefas vencidas e as concluídas mais antigas além do limite do usuário"""
+        corte = time.time() - self.reter_horas * 3600
+        for t in list(self._tarefas.values()):
+            if t['criada'] < corte and t['status'] in ('concluida', 'erro'):
+                self._descartar(t['id'])
+        do_dono = sorted((t for t in self._tarefas.values() if t['dono'] == dono),
+                         key=lambda t: t['criada'])
+        excedente = len(do_dono) - self.max_por_dono + 1
+        for t in do_dono:
+            if excedente <= 0:
+                break
+            if t['status'] in ('concluida', 'erro'):
+                self._descartar(t['id'])
+                excedente -= 1
+
+    def enviar(self, dono, rotulo, funcao, nome_arquivo, mime):
+        """
+        Enfileira a tarefa e devolve o id. A thread roda sem o contexto da
+        sessão (como o prefetch): `funcao` não pode chamar a interface (st.*)
+        e usa carregadores que levantam exceção; a exceção vira status 'erro'
+        com a mensagem no painel.
+        """
+        tarefa_id = _uuid_mod.uuid4().hex[:12]
+        with self._trava:
+            self._limpar(dono)
+            self._tarefas[tarefa_id] = {
+                'id': tarefa_id, 'dono': dono, 'rotulo': rotulo,
+                'nome_arquivo': nome_arquivo, 'mime': mime,
+                'status': 'na_fila', 'progresso': 0.0, 'etapa': '',
+                'erro': '', 'criada': time.time(), 'duracao': None,
+            }
+
+        def _executar():
+            self._atualizar(tarefa_id, status='executando')
+            inicio = time.perf_counter()
+
+            def progresso(feitos, total, etapa=""):
+                self._atualizar(tarefa_id, progresso=min(feitos / total, 1.0) if total else 0.0,
+                                etapa=str(etapa))
+            try:
+                dados = funcao(progresso)
+                destino = self._arquivo(tarefa_id)
+                with open(destino + ".tmp", "wb") as f:
+                    f.write(dados)
+                os.replace(destino + ".tmp", destino)
+                self._atualizar(tarefa_id, status='concluida', progresso=1.0, etapa='',
+                                duracao=time.perf_counter() - inicio)
+            except Exception as e:
+                self._atualizar(tarefa_id, status='erro', erro=str(e) or e.__class__.__name__,
+                                duracao=time.perf_counter() - inicio)
+
+        self._pool.submit(_executar)
+        return tarefa_id
+
+    def _atualizar(self, tarefa_id, **campos):
+        with self._trava:
+            if tarefa_id in self._tarefas:
+                self._tarefas[tarefa_id].update(campos)
+
+    def tarefas(self, dono):
+        """Cópias das tarefas do usuário, mais recentes primeiro"""
+        with self._trava:
+            return sorted((dict(t) for t in self._tarefas.values() if t['dono'] == dono),
+                          key=lambda t: t['criada'], reverse=True)
+
+    def ler(self, tarefa_id):
+        with open(self._arquivo(tarefa_id), "rb") as f:
+            return f.read()
+
+    def remover(self, tarefa_id):
+        with self._trava:
+            if self._tarefas.get(tarefa_id, {}).get('status') in ('concluida', 'erro'):
+                self._descartar(tarefa_id)
+
+
+@st.cache_resource(show_spinner=False)
+def executor_tarefas():
+    return ExecutorTarefas()
+
+def _dono_tarefas():
+    usuario = st.session_state.get("usuario") or {}
+    return usuario.get("email") or usuario.get("id") or "anonimo"
+
+def enviar_tarefa(rotulo, funcao, nome_arquivo, mime):
+    """Envia uma exportação para segundo plano em nome do usuário logado"""
+    return executor_tarefas().enviar(_dono_tarefas(), rotulo, funcao, nome_arquivo, mime)
+
+def _painel_tarefas(dono, acompanhando):
+    executor = executor_tarefas()
+    tarefas = executor.tarefas(dono)
+    for t in tarefas:
+        st.markdown(f"**{t['rotulo']}**")
+        if t['status'] in ('na_fila', 'executando'):
+            rotulo = "Na fila..." if t['status'] == 'na_fila' else (t['etapa'] or "Gerando...")
+            st.progress(t['progresso'], text=rotulo)
+        elif t['status'] == 'erro':
+            st.caption(f"❌ {t['erro']}")
+        else:
+            if t['mime'] == 'image/png':
+                st.image(executor.ler(t['id']))
+            st.download_button(
+                f"⬇️ {t['nome_arquivo']}",
+                data=lambda tarefa_id=t['id']: executor.ler(tarefa_id),
+                file_name=t['nome_arquivo'], mime=t['mime'],
+                key=f"dl_tarefa_{t['id']}", use_container_width=True,
+            )
+            st.caption(f"Gerado em {t['duracao']:.1f}s")
+        if t['status'] in ('concluida', 'erro') and st.button(
+                "Remover", key=f"rm_tarefa_{t['id']}", use_container_width=True):
+            executor.remover(t['id'])
+            st.rerun()
+    # Quando a última tarefa em andamento termina, recarrega a página para parar o acompanhamento
+    if acompanhando and not any(t['status'] in ('na_fila', 'executando') for t in tarefas):
+        st.rerun()
+
+def exibir_painel_tarefas():
+    """Painel '📥 Exportações' do usuário; atualiza sozinho enquanto há tarefas em andamento"""
+    dono = _dono_tarefas()
+    tarefas = executor_tarefas().tarefas(dono)
+    if not tarefas:
+        return
+    st.markdown("**📥 Exportações**")
+    acompanhando = any(t['status'] in ('na_fila', 'executando') for t in tarefas)
+    st.fragment(_painel_tarefas, run_every=2 if acompanhando else None)(dono, acompanhando)
+
+# ====================== RELATÓRIO SEMANAL ======================
+def _planilhas_semanais_vendedor(vendedor, df_v_fat, df_v_pend, df_v_inad):
+    """
+    Planilhas do relatório semanal de um vendedor, a partir das fatias já
+    separadas (ou None): lista de (caminho no ZIP, bytes do .xlsx).
+    """
+    arquivos = []
+    _vend_pasta = str(vendedor).upper().replace(' ', '_')
+    _prefixo = f"RELATORIO SEMANAL/{_vend_pasta}/"
+
+    # ── 1. FATURADOS ──
+    if df_v_fat is not None and len(df_v_fat) > 0:
+        _cols = [c for c in ['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado', 'Vendedor',
+                              'DataEmissao', 'Numero_NF', 'TipoMov',
+                              'CodigoProduto', 'NomeProduto', 'Quantidade', 'PrecoUnit',
+                              'TotalProduto', 'Valor_Real'] if c in df_v_fat.columns]
+        _df_exp_f = df_v_fat[_cols].copy()
+        _df_exp_f['DataEmissao'] = _df_exp_f['DataEmissao'].dt.strftime('%d/%m/%Y')
+
+        # Aba FATURAMENTO TOTAL: dedup Numero_NF + soma
+        _cols_oc = ['CodigoProduto', 'NomeProduto', 'Quantidade', 'PrecoUnit', 'TotalProduto', 'Valor_Real']
+        _cols_ft = [c for c in _cols if c not in _cols_oc]
+        _df_ft = df_v_fat.drop_duplicates(subset=['Numero_NF'], keep='first')[_cols_ft + ['TotalProduto']].copy()
+        _df_ft['DataEmissao'] = _df_ft['DataEmissao'].dt.strftime('%d/%m/%Y')
+        _soma_ft = _df_ft['TotalProduto'].sum()
+        _ln_tot = {c: '' for c in _df_ft.columns}
+        _ln_tot['TotalProduto'] = _soma_ft
+        _ln_tot['RazaoSocial'] = 'TOTAL'
+        _df_ft = pd.concat([_df_ft, pd.DataFrame([_ln_tot])], ignore_index=True)
+
+        _buf_f = io.BytesIO()
+        with pd.ExcelWriter(_buf_f, engine='xlsxwriter') as _wr:
+            _wb = _wr.book
+            _df_exp_f.to_excel(_wr, index=False, sheet_name='PRODUTOS POR CLIENTE')
+            _ws1 = _wr.sheets['PRODUTOS POR CLIENTE']
+            if len(_df_exp_f) > 0:
+                _ws1.add_table(0, 0, len(_df_exp_f), len(_df_exp_f.columns)-1, {
+                    'name': f'TblPC_{_vend_pasta[:10]}',
+                    'style': 'Table Style Medium 2',
+                    'columns': [{'header': c} for c in _df_exp_f.columns]
+                })
+            _df_ft.to_excel(_wr, index=False, sheet_name='FATURAMENTO TOTAL')
+            _ws2 = _wr.sheets['FATURAMENTO TOTAL']
+            _nft = len(_df_ft) - 1
+            if _nft > 0:
+                _ws2.add_table(0, 0, _nft, len(_df_ft.columns)-1, {
+                    'name': f'TblFT_{_vend_pasta[:10]}',
+                    'style': 'Table Style Medium 2',
+                    'columns': [{'header': c} for c in _df_ft.columns]
+                })
+            _fmt_b = _wb.add_format({'bold': True, 'num_format': '#,##0.00'})
+            _sc = list(_df_ft.columns).index('TotalProduto')
+            _ws2.write(_nft + 1, _sc, _soma_ft, _fmt_b)
+        arquivos.append((_prefixo + f"{_vend_pasta}_FATURADOS.xlsx", _buf_f.getvalue()))
+
+    # ── 2. PENDENTES ──
+    if df_v_pend is not None and len(df_v_pend) > 0:
+        _buf_p = io.BytesIO()
+        with pd.ExcelWriter(_buf_p, engine='xlsxwriter') as _wr:
+            df_v_pend.to_excel(_wr, index=False, sheet_name='PENDENTES')
+            _wsp = _wr.sheets['PENDENTES']
+            _wsp.add_table(0, 0, len(df_v_pend), len(df_v_pend.columns)-1, {
+                'name': f'TblPend_{_vend_pasta[:10]}',
+                'style': 'Table Style Medium 2',
+                'columns': [{'header': c} for c in df_v_pend.columns]
+            })
+        arquivos.append((_prefixo + f"PENDENTES_{_vend_pasta}.xlsx", _buf_p.getvalue()))
+
+    # ── 3. INADIMPLÊNCIA ──
+    if df_v_inad is not None and len(df_v_inad) > 0:
+        _cols_inad = [c for c in ['Vendedor', 'Cliente', 'NumeroDoc', 'DataVencimento',
+                                   'ValorLiquido', 'DiasAtraso', 'FaixaAtraso', 'Banco', 'Estado']
+                      if c in df_v_inad.columns]
+        _df_v_inad = df_v_inad[_cols_inad].copy()
+        if 'DataVencimento' in _df_v_inad.columns:
+            _df_v_inad['DataVencimento'] = _df_v_inad['DataVencimento'].dt.strftime('%d/%m/%Y')
+        _buf_i = io.BytesIO()
+        with pd.ExcelWriter(_buf_i, engine='xlsxwriter') as _wr:
+            _df_v_inad.to_excel(_wr, index=False, sheet_name='INADIMPLENCIA')
+            _wsi = _wr.sheets['INADIMPLENCIA']
+            _wsi.add_table(0, 0, len(_df_v_inad), len(_df_v_inad.columns)-1, {
+                'name': f'TblInad_{_vend_pasta[:10]}',
+                'style': 'Table Style Medium 2',
+                'columns': [{'header': c} for c in _df_v_inad.columns]
+            })
+        arquivos.append((_prefixo + f"INADIMPLENCIA_{_vend_pasta}.xlsx", _buf_i.getvalue()))
+    return arquivos
+
+def gerar_zip_semanal(df_fat, df_pend, df_inad, progresso=None, max_workers=4):
+    """
+    ZIP do relatório semanal. Cada base é separada por vendedor uma única vez
+    (groupby) e as planilhas dos vendedores são montadas em paralelo; cada
+    vendedor é gravado no ZIP assim que fica pronto, na ordem alfabética.
+    """
+    def _por_vendedor(base):
+        if base is None or len(base) == 0:
+            return {}
+        return dict(tuple(base.groupby('Vendedor', sort=False, observed=True)))
+
+    fat, pend, inad = _por_vendedor(df_fat), _por_vendedor(df_pend), _por_vendedor(df_inad)
+    vendedores = sorted(set(fat) | set(pend) | set(inad))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zout, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="semanal") as pool:
+        futuros = [pool.submit(_planilhas_semanais_vendedor, v, fat.get(v), pend.get(v), inad.get(v))
+                   for v in vendedores]
+        for i, (vendedor, futuro) in enumerate(zip(vendedores, futuros), start=1):
+            for nome, dados in futuro.result():
+                zout.writestr(nome, dados)
+            if progresso is not None:
+                progresso(i, len(vendedores), vendedor)
+    return buf.getvalue()
+
 # ====================== AUTENTICAÇÃO — SISTEMA DUAL ======================
 # Prioridade 1: Supabase (usuários individuais com e-mail + senha)
 # Prioridade 2: Fallback legado (senhas compartilhadas) — ativo enquanto
@@ -957,6 +2515,129 @@ def check_password():
 
     return False
 
+# ====================== CACHE POR VERSÃO DA BASE ======================
+# st.cache_data hasheia o DataFrame de entrada inteiro a cada rerun só para
+# achar a entrada. Na camada de dados a chave é um token leve — nome da
+# transformação + versão da base (SHA da planilha) + parâmetros — e o
+# conteúdo dos DataFrames nunca é hasheado nem serializado.
+
+class CacheVersionado:
+    """Resultados de uma transformação por (versão, parâmetros), com TTL, LRU e contadores"""
+
+    def __init__(self, nome, max_entradas=4, ttl=3600):
+        self.nome = nome
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.sem_versao = 0
+        self.ms_acertos = 0.0
+        self.ms_calculo = 0.0
+
+    def obter(self, chave):
+        """(True, valor) se a chave está em cache e dentro do TTL; senão (False, None)"""
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] < time.monotonic():
+                return False, None
+            self._entradas.move_to_end(chave)
+            return True, entrada[1]
+
+    def guardar(self, chave, valor):
+        with self._trava:
+            self._entradas[chave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def registrar(self, acerto, segundos):
+        with self._trava:
+            if acerto:
+                self.acertos += 1
+                self.ms_acertos += segundos * 1000
+            else:
+                self.faltas += 1
+                self.ms_calculo += segundos * 1000
+
+    def limpar(self):
+        with self._trava:
+            self._entradas.clear()
+
+    def metricas(self):
+        with self._trava:
+            return {
+                'Transformação': self.nome,
+                'Acertos': self.acertos,
+                'Faltas': self.faltas,
+                'Sem versão': self.sem_versao,
+                'Entradas': len(self._entradas),
+                'Acerto médio (ms)': round(self.ms_acertos / self.acertos, 2) if self.acertos else None,
+                'Cálculo médio (ms)': round(self.ms_calculo / self.faltas, 1) if self.faltas else None,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _caches_versionados():
+    """Registro nome → CacheVersionado do processo (sobrevive aos reruns)"""
+    return {}
+
+def versao_conhecida(versao):
+    """
+    Falso para None e para versões compostas (tupla/lista) com algum membro
+    None: a planilha sem SHA (falha na API, arquivo local) não identifica o
+    conteúdo, e bases diferentes cairiam na mesma chave de cache.
+    """
+    if isinstance(versao, (tuple, list)):
+        return all(versao_conhecida(v) for v in versao)
+    return versao is not None
+
+def cache_por_versao(max_entradas=4, ttl=3600):
+    """
+    Decorador da camada de dados: a função decorada passa a receber o
+    keyword `versao` (ex.: SHA da planilha de origem). Argumentos posicionais
+    (os DataFrames) não entram na chave; keywords restantes entram e precisam
+    ser hasheáveis. Sem versão conhecida (ver `versao_conhecida`), a função
+    roda direto, sem cache.
+    Devolve uma cópia rasa dos DataFrames em cache (ou de objetos com
+    `copia_rasa()`): com o Copy-on-Write (ligado no início do app),
+    alterações feitas pela página não atingem o resultado guardado.
+    """
+    def decorador(funcao):
+        nome = funcao.__name__
+
+        @wraps(funcao)
+        def envolvida(*dados, versao=None, **params):
+            caches = _caches_versionados()
+            cache = caches.get(nome)
+            if cache is None:
+                cache = caches.setdefault(nome, CacheVersionado(nome, max_entradas, ttl))
+            if not versao_conhecida(versao):
+                cache.sem_versao += 1
+                return funcao(*dados, **params)
+            if isinstance(versao, list):
+                versao = tuple(versao)
+            chave = (versao, tuple(sorted(params.items())))
+            inicio = time.perf_counter()
+            acerto, valor = cache.obter(chave)
+            if not acerto:
+                valor = funcao(*dados, **params)
+                cache.guardar(chave, valor)
+            cache.registrar(acerto, time.perf_counter() - inicio)
+            if isinstance(valor, (pd.DataFrame, pd.Series)):
+                return valor.copy(deep=False)
+            return valor.copia_rasa() if hasattr(valor, 'copia_rasa') else valor
+        return envolvida
+    return decorador
+
+def metricas_caches_versionados():
+    return [c.metricas() for _, c in sorted(_caches_versionados().items())]
+
+def limpar_caches_versionados():
+    for cache in list(_caches_versionados().values()):
+        cache.limpar()
+
 # ====================== PROCESSAMENTO DE DADOS ======================
 def calcular_prazo_historico(data_emissao, data_vencimento_str):
     """
@@ -1065,15 +2746,13 @@ def gerar_pdf_pedido(dados_cliente, dados_pedido, itens_pedido, observacao=''):
     
     # CABEÇALHO - SOLUÇÃO COM CONTROLE TOTAL DE TAMANHO
     logo_adicionado = False
+    logo = logo_bytes()
     try:
-        # Buscar logo do GitHub
-        logo_url = f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/{GITHUB_FOLDER}/logo.png"
-        response = requests.get(logo_url)
-        if response.status_code == 200:
+        if logo:
             from PIL import Image as PILImage
             
             # Carregar imagem com PIL para ter controle total
-            logo_buffer = io.BytesIO(response.content)
+            logo_buffer = io.BytesIO(logo)
             pil_img = PILImage.open(logo_buffer)
             
             # Obter dimensões originais
@@ -1117,7 +2796,7 @@ def gerar_pdf_pedido(dados_cliente, dados_pedido, itens_pedido, observacao=''):
     except Exception as e:
         # Se PIL não disponível ou erro, fallback simples
         try:
-            logo_buffer = io.BytesIO(response.content)
+            logo_buffer = io.BytesIO(logo)
             # Fallback: tamanho fixo conservador
             logo_img = Image(logo_buffer, width=30*mm, height=15*mm)
             
@@ -1331,6 +3010,411 @@ def calcular_comissao(preco_unit, preco_ref):
         return ''
 
 
+def normalizar_codigo_serie(serie):
+    """Versão vetorizada de normalizar_codigo: '123.0' / 123.0 → '123'; demais valores → texto sem espaços"""
+    texto = pd.Series(serie.to_numpy().astype(str), index=serie.index, dtype=object).str.strip()
+    num = pd.to_numeric(texto, errors='coerce')
+    inteiro = num.notna() & np.isfinite(num)
+    texto[inteiro] = num[inteiro].astype('int64').astype(str)
+    return texto
+
+
+def _arredondar_como_python(serie, casas):
+    """Igual ao round() do Python; np.round só diverge perto de empates (…5), que são refeitos um a um"""
+    resultado = serie.round(casas)
+    escala = serie * (10 ** casas)
+    empate = ((escala - np.floor(escala)) - 0.5).abs() < 1e-6
+    if empate.any():
+        resultado[empate] = [round(float(v), casas) for v in serie[empate]]
+    return resultado
+
+
+def classificar_comissao_serie(preco_unit, preco_ref):
+    """Versão vetorizada de calcular_comissao — mesmas faixas, aplicada à coluna inteira"""
+    pu = _arredondar_como_python(pd.to_numeric(preco_unit, errors='coerce').astype(float), 2)
+    pr_bruto = pd.to_numeric(preco_ref, errors='coerce').astype(float)
+    pr = _arredondar_como_python(pr_bruto, 2)
+    validos = pu.notna() & pr.notna() & (pr_bruto != 0) & (pr != 0)
+    variacao = (pu - pr) / pr.where(validos) * 100
+    # O arredondamento a 4 casas só muda a faixa de valores colados aos limites
+    perto = pd.concat([(variacao - lim).abs() < 1e-3 for lim in (6, 0, -3)], axis=1).any(axis=1)
+    variacao[perto] = _arredondar_como_python(variacao[perto], 4)
+    faixas = np.select(
+        [variacao >= 6, variacao >= 0, variacao > -3],
+        ['4%', '3%', '2,5%'],
+        default='2%'
+    )
+    return pd.Series(np.where(validos, faixas, ''), index=preco_unit.index)
+
+
+@cache_por_versao()
+def enriquecer_vendas(_df, _df_ref_preco):
+    """
+    Anexa PrecoRef e Comissao à base de vendas já processada e aplica o
+    schema compacto (compactar_vendas).
+    Cache por versão: versao=(SHA das vendas, SHA do catálogo).
+    """
+    df = _df.copy()
+    if _df_ref_preco is None or 'ID_COD_N' not in _df_ref_preco.columns or 'PRECO' not in _df_ref_preco.columns:
+        df['PrecoRef'] = None
+        df['Comissao'] = ''
+        return compactar_vendas(df)
+
+    # Catálogo do registro: colunas já em maiúsculas e código já normalizado (ID_COD_N)
+    df_ref = _df_ref_preco[['ID_COD_N', 'PRECO']].rename(
+        columns={'ID_COD_N': 'CodigoProduto', 'PRECO': 'PrecoRef'}
+    )
+    df['CodigoProduto'] = normalizar_codigo_serie(df['CodigoProduto'])
+    df_ref = df_ref.drop_duplicates(subset=['CodigoProduto'], keep='first')
+    df = df.merge(df_ref, on='CodigoProduto', how='left')
+    df['Comissao'] = classificar_comissao_serie(df['PrecoUnit'], df['PrecoRef'])
+    return compactar_vendas(df)
+
+
+
+class IndiceClientes:
+    """
+    Dimensão de clientes (uma linha por CPF_CNPJ) extraída da base de vendas,
+    com nome sem acentos e CNPJ só com dígitos pré-calculados: as buscas
+    percorrem milhares de clientes em vez de centenas de milhares de itens de NF.
+    """
+
+    COLUNAS = ['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado', 'Vendedor']
+
+    def __init__(self, df):
+        cols = [c for c in self.COLUNAS if c in df.columns]
+        vendas = df[df['TipoMov'] == 'NF Venda'] if 'TipoMov' in df.columns else df
+        ultima = vendas.groupby('CPF_CNPJ', observed=True)['DataEmissao'].max().rename('UltimaCompra')
+
+        dim = df[cols].drop_duplicates(subset=['CPF_CNPJ'], keep='first')
+        dim = dim[dim['CPF_CNPJ'].notna()].merge(ultima, left_on='CPF_CNPJ', right_index=True, how='left')
+        # Dimensão pequena volta a texto simples (a base de vendas usa categóricas)
+        dim = dim.astype({c: t.categories.dtype for c, t in dim.dtypes.items() if isinstance(t, pd.CategoricalDtype)})
+        dim = dim.sort_values('RazaoSocial', kind='stable').reset_index(drop=True)
+        self.dim = dim
+        self._nome_busca = dim['RazaoSocial'].fillna('').map(normalizar_texto_busca)
+        self._doc_texto = dim['CPF_CNPJ'].astype(str).str.upper()
+        self._doc_digitos = self._doc_texto.str.replace(r'\D', '', regex=True)
+
+        # Primeira linha de cada razão social (mesmo critério de df[...].iloc[0] nos formulários)
+        self._por_nome = df[cols].drop_duplicates(subset=['RazaoSocial'], keep='first').set_index('RazaoSocial', drop=False)
+        self.nomes = sorted(self._por_nome.index.dropna().unique().tolist())
+
+    def __len__(self):
+        return len(self.dim)
+
+    def buscar_nome(self, termo):
+        """Clientes cujo nome contém o termo (sem diferenciar maiúsculas/acentos)"""
+        chave = normalizar_texto_busca(termo)
+        if not chave:
+            return self.dim.iloc[0:0]
+        return self.dim[self._nome_busca.str.contains(chave, regex=False)]
+
+    def buscar_documento(self, termo):
+        """Clientes cujo CPF/CNPJ contém o termo (com ou sem pontuação)"""
+        digitos = re.sub(r'\D', '', str(termo))
+        if digitos:
+            return self.dim[self._doc_digitos.str.contains(digitos, regex=False)]
+        return self.dim[self._doc_texto.str.contains(str(termo).strip().upper(), regex=False)]
+
+    def cliente(self, razao_social):
+        """Dados (Series) da primeira ocorrência da razão social na base, ou None"""
+        if razao_social in self._por_nome.index:
+            return self._por_nome.loc[razao_social]
+        return None
+
+
+@st.cache_resource(ttl=3600, max_entries=4, show_spinner=False)
+def _indice_clientes_em_cache(_df, versao_vendas):
+    return IndiceClientes(_df)
+
+def indice_clientes(df, versao_vendas):
+    """IndiceClientes compartilhado, montado uma vez por versão da planilha de vendas (sem SHA, um novo a cada chamada)"""
+    if not versao_conhecida(versao_vendas):
+        return IndiceClientes(df)
+    return _indice_clientes_em_cache(df, versao_vendas)
+
+
+class CuboVendas:
+    """
+    Cubo mensal pré-agregado da base de vendas: uma linha por
+    mês × vendedor × UF × cliente × TipoMov, com a soma de TotalProduto e
+    Valor_Real das notas únicas, a quantidade de notas e de itens. Como o
+    cliente faz parte da chave, a contagem de clientes distintos de qualquer
+    recorte é exata (nunique sobre o cubo). Dashboards e rankings agregam o
+    cubo em vez dos itens de NF.
+
+    Notas únicas seguem o mesmo critério de filtrar + obter_notas_unicas:
+    primeira ocorrência da NF (na ordem da base) dentro do recorte. Quase
+    toda NF tem todos os itens numa só célula e data, e aí o critério não
+    depende do recorte: essas notas vão pré-somadas no cubo. As poucas NFs
+    cujo número aparece em mais de uma célula ou data (ex.: venda de um
+    vendedor e devolução de outro com o mesmo número) ficam como itens e são
+    deduplicadas a cada recorte, então um recorte pode trazer mais de uma
+    linha por célula.
+    """
+
+    CHAVES = ['MesRef', 'MesAno', 'Ano', 'Mes', 'Vendedor', 'Estado',
+              'CPF_CNPJ', 'RazaoSocial', 'Cidade', 'TipoMov']
+    COLUNAS_LINHAS = ['DataEmissao', 'MesAno', 'Ano', 'Mes', 'Vendedor', 'Estado',
+                      'CPF_CNPJ', 'RazaoSocial', 'Cidade', 'TipoMov',
+                      'Numero_NF', 'TotalProduto', 'Valor_Real']
+
+    def __init__(self, df):
+        cols = [c for c in self.COLUNAS_LINHAS if c in df.columns]
+        # _Pos guarda a ordem original da base (critério de primeira ocorrência)
+        linhas = df[cols].assign(
+            _Pos=np.arange(len(df)),
+            MesRef=df['DataEmissao'].dt.to_period('M').dt.to_timestamp(),
+        )
+        chaves = [c for c in self.CHAVES if c in linhas.columns]
+        pares = linhas[chaves + ['DataEmissao', 'Numero_NF']].drop_duplicates()
+        em_varias = linhas['Numero_NF'].isin(
+            pares.loc[pares['Numero_NF'].duplicated(), 'Numero_NF'].unique()).to_numpy()
+        self._compartilhadas = linhas[em_varias]
+        simples = linhas[~em_varias]
+        self._cubo_simples = self._agregar(simples)
+        self.cubo = pd.concat([self._cubo_simples, self._agregar(self._compartilhadas)],
+                              ignore_index=True)
+        # Itens das NFs simples ordenados por data: meses cortados por um
+        # filtro de datas são reagregados só a partir da fatia de itens
+        # daquele trecho (searchsorted)
+        self._linhas = simples.sort_values('DataEmissao', kind='stable').reset_index(drop=True)
+        self._datas = self._linhas['DataEmissao'].to_numpy()
+
+    @classmethod
+    def _agregar(cls, linhas, primeira=None):
+        """
+        Agrega itens de NF na granularidade do cubo. `primeira` marca as
+        notas únicas; por padrão, a primeira ocorrência de cada NF entre as
+        `linhas` recebidas.
+        """
+        if primeira is None:
+            if not linhas['_Pos'].is_monotonic_increasing:
+                linhas = linhas.sort_values('_Pos', kind='stable')
+            primeira = ~linhas['Numero_NF'].duplicated(keep='first')
+        base = linhas.drop(columns=['_Pos', 'Numero_NF']).assign(
+            TotalProduto=linhas['TotalProduto'].where(primeira, 0),
+            Valor_Real=linhas['Valor_Real'].where(primeira, 0),
+            Notas=primeira.astype('int64'),
+        )
+        chaves = [c for c in cls.CHAVES if c in base.columns]
+        return base.groupby(chaves, dropna=False, sort=False, observed=True).agg(
+            TotalProduto=('TotalProduto', 'sum'),
+            Valor_Real=('Valor_Real', 'sum'),
+            Notas=('Notas', 'sum'),
+            Linhas=('Notas', 'size'),
+        ).reset_index()
+
+    @staticmethod
+    def _ativo(valor):
+        return valor is not None and valor not in ('Todos', 'Todas')
+
+    def _filtrar(self, dados, vendedor, estado, mes, ano):
+        """Filtros de igualdade; uma tupla de valores exige todos (filtros encadeados)"""
+        mascara = np.ones(len(dados), dtype=bool)
+        for coluna, valor in (('Vendedor', vendedor), ('Estado', estado), ('Mes', mes), ('Ano', ano)):
+            for v in (valor if isinstance(valor, tuple) else (valor,)):
+                if self._ativo(v):
+                    mascara &= (dados[coluna] == v).to_numpy()
+        return dados if mascara.all() else dados[mascara]
+
+    @staticmethod
+    def _limites(ini, fim):
+        """Período inclusivo da tela → [ini, fim) em timestamps (None = aberto)"""
+        ini = pd.Timestamp(ini).normalize() if ini else None
+        # fim inclusivo: tudo antes do dia seguinte (DataEmissao é normalizada)
+        fim = pd.Timestamp(fim).normalize() + pd.Timedelta(days=1) if fim else None
+        return ini, fim
+
+    @staticmethod
+    def _no_periodo(datas, ini, fim):
+        mascara = np.ones(len(datas), dtype=bool)
+        if ini is not None:
+            mascara &= (datas >= ini).to_numpy()
+        if fim is not None:
+            mascara &= (datas < fim).to_numpy()
+        return mascara
+
+    def _trecho_linhas(self, ini, fim):
+        """Itens com ini <= DataEmissao < fim (limites None = aberto)"""
+        i = 0 if ini is None else np.searchsorted(self._datas, np.datetime64(ini, 'ns'), side='left')
+        j = len(self._datas) if fim is None else np.searchsorted(self._datas, np.datetime64(fim, 'ns'), side='left')
+        return self._linhas.iloc[i:max(i, j)]
+
+    def _fatiar_simples(self, ini, fim, vendedor, estado, mes, ano):
+        """Recorte das NFs simples: meses inteiros do cubo + trechos reagregados"""
+        if ini is None and fim is None:
+            return self._filtrar(self._cubo_simples, vendedor, estado, mes, ano)
+
+        # [a, b) = meses inteiramente dentro do período
+        a = None if ini is None else (ini if ini.day == 1 else ini + pd.offsets.MonthBegin(1))
+        b = None if fim is None else (fim if fim.day == 1 else fim - pd.offsets.MonthBegin(1))
+        if a is not None and b is not None and a >= b:
+            partes = [self._trecho_linhas(ini, fim)]
+            meses = self._cubo_simples.iloc[0:0]
+        else:
+            ref = self._cubo_simples['MesRef']
+            mascara = np.ones(len(ref), dtype=bool)
+            if a is not None:
+                mascara &= (ref >= a).to_numpy()
+            if b is not None:
+                mascara &= (ref < b).to_numpy()
+            meses = self._cubo_simples[mascara]
+            partes = []
+            if ini is not None and ini < a:
+                partes.append(self._trecho_linhas(ini, a))
+            if fim is not None and b < fim:
+                partes.append(self._trecho_linhas(b, fim))
+
+        partes = [self._agregar(p) for p in partes if len(p)]
+        if partes:
+            meses = pd.concat([meses] + partes, ignore_index=True)
+        return self._filtrar(meses, vendedor, estado, mes, ano)
+
+    def fatiar(self, ini=None, fim=None, vendedor=None, estado=None, mes=None, ano=None,
+               ini_local=None, fim_local=None):
+        """
+        Linhas do cubo para o período [ini, fim] (datas inclusivas, como os
+        filtros da tela) e os filtros de vendedor/UF/mês/ano ('Todos' ou None
+        = sem filtro; tupla = todos os valores). ini_local/fim_local restringem
+        o resultado depois das notas únicas, como as páginas que recortavam
+        notas_unicas por um período próprio.
+        """
+        if not any(v is not None for v in (ini, fim, ini_local, fim_local)) and \
+                not any(self._ativo(v) for v in (vendedor, estado, mes, ano)):
+            return self.cubo
+        ini, fim = self._limites(ini, fim)
+        ini_local, fim_local = self._limites(ini_local, fim_local)
+        # Para as NFs simples tanto faz filtrar antes ou depois das notas únicas
+        resultado = self._fatiar_simples(
+            max([d for d in (ini, ini_local) if d is not None], default=None),
+            min([d for d in (fim, fim_local) if d is not None], default=None),
+            vendedor, estado, mes, ano)
+
+        itens = self._compartilhadas
+        itens = self._filtrar(itens[self._no_periodo(itens['DataEmissao'], ini, fim)],
+                              vendedor, estado, mes, ano)
+        primeira = ~itens['Numero_NF'].duplicated(keep='first')
+        local = self._no_periodo(itens['DataEmissao'], ini_local, fim_local)
+        if local.any():
+            resultado = pd.concat([resultado, self._agregar(itens[local], primeira[local])],
+                                  ignore_index=True)
+        return resultado
+
+
+@st.cache_resource(ttl=3600, max_entries=4, show_spinner=False)
+def _cubo_vendas_em_cache(_df, versao_vendas):
+    return CuboVendas(_df)
+
+def cubo_vendas(df, versao_vendas):
+    """CuboVendas compartilhado, montado uma vez por versão da planilha de vendas (sem SHA, um novo a cada chamada)"""
+    if not versao_conhecida(versao_vendas):
+        return CuboVendas(df)
+    return _cubo_vendas_em_cache(df, versao_vendas)
+
+
+class FiltroVendas:
+    """
+    Motor dos filtros globais sobre a base de vendas. Mantém uma permutação
+    dos itens ordenada por DataEmissao (períodos resolvidos com searchsorted)
+    e índices de posições por Vendedor, Estado, Ano e Mês. Cada filtro parte
+    do menor conjunto candidato e só confere as demais condições nessas
+    posições, sem copiar a tabela inteira nem repassá-la a cada máscara.
+    """
+
+    COLUNAS_INDICE = ['Vendedor', 'Estado', 'Ano', 'Mes']
+    _SEM_DATA = np.iinfo(np.int32).max
+
+    def __init__(self, df):
+        self.df = df
+        # Datas como chave int32 (dias desde 1970); NaT recebe _SEM_DATA e fica no fim da ordem
+        datas = df['DataEmissao'].to_numpy(dtype='datetime64[ns]')
+        dias = datas.astype('datetime64[D]').astype('int64')
+        dias[np.isnat(datas)] = self._SEM_DATA
+        self._dias = dias.astype(np.int32)
+        self._ordem = np.argsort(self._dias, kind='stable')
+        self._dias_ord = self._dias[self._ordem]
+        self._indices = {c: df.groupby(c, sort=False, observed=True).indices
+                         for c in self.COLUNAS_INDICE if c in df.columns}
+        # Valores para conferir candidatos: códigos inteiros nas categóricas
+        self._valores = {
+            c: df[c].cat.codes.to_numpy() if isinstance(df[c].dtype, pd.CategoricalDtype) else df[c].to_numpy()
+            for c in self._indices
+        }
+        # Primeira ocorrência de cada NF na base inteira (obter_notas_unicas sem filtro)
+        self._primeira_nf = (~df['Numero_NF'].duplicated(keep='first')).to_numpy()
+
+    @staticmethod
+    def _dia(data):
+        return int(np.datetime64(pd.Timestamp(data).date(), 'D').astype('int64'))
+
+    def _chave(self, coluna, valor):
+        """Valor no formato de _valores (código da categoria; None se não existe)"""
+        serie = self.df[coluna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigo = serie.cat.categories.get_indexer([valor])[0]
+            return None if codigo < 0 else codigo
+        return valor
+
+    def posicoes(self, ini=None, fim=None, vendedor=None, estado=None, mes=None, ano=None):
+        """Posições (crescentes) dos itens que passam nos filtros, ou None se nenhum filtro está ativo"""
+        filtros = {c: v for c, v in zip(self.COLUNAS_INDICE, (vendedor, estado, ano, mes))
+                   if v is not None and v not in ('Todos', 'Todas') and c in self._indices}
+        if not filtros and not ini and not fim:
+            return None
+        vazio = np.empty(0, dtype=np.intp)
+        chaves = {c: self._chave(c, v) for c, v in filtros.items()}
+        if any(k is None for k in chaves.values()):
+            return vazio
+
+        # Candidatos: o menor entre o trecho de datas e os índices dos filtros ativos
+        candidatos = {c: self._indices[c].get(v, vazio) for c, v in filtros.items()}
+        d_ini = self._dia(ini) if ini else np.iinfo(np.int32).min
+        d_fim = self._dia(fim) if fim else self._SEM_DATA - 1
+        i = np.searchsorted(self._dias_ord, d_ini, side='left')
+        j = max(i, np.searchsorted(self._dias_ord, d_fim, side='right'))
+        menor = min(candidatos, key=lambda c: len(candidatos[c]), default=None)
+        if (ini or fim) and (menor is None or j - i <= len(candidatos[menor])):
+            pos = np.sort(self._ordem[i:j])
+            conferir_datas = False
+        else:
+            pos = candidatos.pop(menor)
+            conferir_datas = bool(ini or fim)
+
+        for c in candidatos:
+            if len(pos):
+                pos = pos[self._valores[c][pos] == chaves[c]]
+        if conferir_datas and len(pos):
+            d = self._dias[pos]
+            pos = pos[(d >= d_ini) & (d <= d_fim)]
+        return pos
+
+    def filtrar(self, ini=None, fim=None, vendedor=None, estado=None, mes=None, ano=None):
+        """
+        (itens filtrados, notas únicas) — sem filtro ativo devolve a própria
+        base, sem cópia. As notas únicas são a primeira ocorrência de cada NF
+        dentro do resultado (posições crescentes = ordem da base), como
+        obter_notas_unicas sobre o recorte.
+        """
+        pos = self.posicoes(ini, fim, vendedor, estado, mes, ano)
+        if pos is None:
+            return self.df, self.df[self._primeira_nf]
+        itens = self.df.iloc[pos]
+        return itens, itens[~itens['Numero_NF'].duplicated(keep='first').to_numpy()]
+
+
+@st.cache_resource(ttl=3600, max_entries=4, show_spinner=False)
+def _filtro_vendas_em_cache(_df, versao_vendas):
+    return FiltroVendas(_df)
+
+def filtro_vendas(df, versao_vendas):
+    """FiltroVendas compartilhado, montado uma vez por versão da planilha de vendas (sem SHA, um novo a cada chamada)"""
+    if not versao_conhecida(versao_vendas):
+        return FiltroVendas(df)
+    return _filtro_vendas_em_cache(df, versao_vendas)
+
+
 # ── Paleta institucional e helper de layout de gráficos ──────────────────
 CORES_INST = ['#1F4788', '#2E86AB', '#28A745', '#F4A261', '#6C757D',
               '#163561', '#1B5E8A', '#1E7B34', '#C97A3A', '#495057']
@@ -1353,13 +3437,54 @@ def aplicar_layout_grafico(fig, height=None):
     fig.update_layout(**layout_kwargs)
     return fig
 
-@st.cache_data(ttl=3600)
+def calcular_prazos_vetorizado(data_emissao, data_vencimento):
+    """
+    Mesma regra de calcular_prazo_historico, aplicada à coluna inteira de uma vez:
+    explode os vencimentos separados por ';', converte todas as datas distintas
+    numa única chamada e calcula os dias com aritmética vetorizada.
+
+    Retorna (PrazoHistorico, PrazoDias): a string "28/35/42" e a lista [28, 35, 42]
+    de cada linha (string vazia / lista vazia quando não há prazo válido).
+    """
+    n = len(data_emissao)
+    emissao = pd.Series(data_emissao.to_numpy(), index=np.arange(n))
+    venc_txt = pd.Series(data_vencimento.to_numpy(), index=np.arange(n))
+    validos = venc_txt.notna() & emissao.notna()
+
+    texto = pd.Series(venc_txt[validos].to_numpy().astype(str), index=venc_txt.index[validos], dtype=object)
+    partes = texto.str.strip().str.split(';').explode().str.strip()
+    partes = partes[partes.notna() & (partes != '')]
+
+    prazo_txt = pd.Series('', index=emissao.index, dtype=object)
+    prazo_dias = pd.Series([[] for _ in range(n)], index=emissao.index, dtype=object)
+    if partes.empty:
+        return prazo_txt.set_axis(data_emissao.index), prazo_dias.set_axis(data_emissao.index)
+
+    # Cada data distinta é convertida uma única vez (dia primeiro, padrão brasileiro)
+    unicas = pd.Series(partes.unique())
+    try:
+        convertidas = pd.to_datetime(unicas, errors='coerce', dayfirst=True, format='mixed')
+    except Exception:
+        convertidas = pd.Series([pd.to_datetime(u, errors='coerce', dayfirst=True) for u in unicas])
+    mapa = pd.Series(pd.DatetimeIndex(convertidas).normalize(), index=unicas.to_numpy())
+    venc = pd.Series(mapa.reindex(partes.to_numpy()).to_numpy(), index=partes.index)
+
+    # Ano entre 2020 e 2030 e prazo entre 1 e 365 dias (contados a partir do dia seguinte à emissão)
+    venc = venc[venc.notna() & venc.dt.year.between(2020, 2030)]
+    dias = (venc - emissao.reindex(venc.index)).dt.days
+    dias = dias[(dias >= 1) & (dias <= 365)].astype(int)
+
+    if not dias.empty:
+        agrupado = dias.groupby(level=0, sort=False)
+        prazo_dias.loc[agrupado.size().index] = agrupado.agg(list)
+        prazo_txt.loc[agrupado.size().index] = dias.astype(str).groupby(level=0, sort=False).agg('/'.join)
+
+    return prazo_txt.set_axis(data_emissao.index), prazo_dias.set_axis(data_emissao.index)
+
+@cache_por_versao()
 def processar_dados(df):
-    """Aplica as regras de negócio nos dados"""
-    df['Valor_Real'] = df.apply(
-        lambda row: row['TotalProduto'] if row['TipoMov'] == 'NF Venda' else -row['TotalProduto'],
-        axis=1
-    )
+    """Aplica as regras de negócio nos dados (cache por versao=SHA da planilha de vendas)"""
+    df['Valor_Real'] = np.where(df['TipoMov'] == 'NF Venda', df['TotalProduto'], -df['TotalProduto'])
     # Converter DataEmissao com formato brasileiro e normalizar para meia-noite
     df['DataEmissao'] = pd.to_datetime(df['DataEmissao'], errors='coerce', dayfirst=True)
     # Normalizar para meia-noite (remove hora) para cálculos corretos de dias
@@ -1370,13 +3495,12 @@ def processar_dados(df):
     df['MesAno'] = df['DataEmissao'].dt.to_period('M').astype(str)
     
     # Calcular prazo histórico se a coluna DataVencimento existir
+    # PrazoDias guarda os mesmos prazos como lista de inteiros (evita reprocessar a string)
     if 'DataVencimento' in df.columns:
-        df['PrazoHistorico'] = df.apply(
-            lambda row: calcular_prazo_historico(row['DataEmissao'], row['DataVencimento']),
-            axis=1
-        )
+        df['PrazoHistorico'], df['PrazoDias'] = calcular_prazos_vetorizado(df['DataEmissao'], df['DataVencimento'])
     else:
         df['PrazoHistorico'] = ''
+        df['PrazoDias'] = [[] for _ in range(len(df))]
     
     return df
 
@@ -1384,9 +3508,60 @@ def obter_notas_unicas(df):
     """Remove duplicatas de Numero_NF mantendo apenas primeira ocorrência"""
     return df.drop_duplicates(subset=['Numero_NF'], keep='first')
 
+# ── Schema compacto da base de vendas ─────────────────────────────────────
+# Dimensões textuais repetidas a cada item de NF viram categóricas (um código
+# inteiro por linha + uma cópia de cada texto) e inteiros são reduzidos ao
+# menor tipo que comporta os valores. Valores monetários continuam float64
+# para as somas não perderem precisão.
+COLUNAS_CATEGORICAS_VENDAS = ['Vendedor', 'Estado', 'TipoMov', 'Cidade', 'RazaoSocial',
+                              'CPF_CNPJ', 'MesAno', 'Comissao', 'PrazoHistorico']
+
+def compactar_vendas(df):
+    """Aplica o schema compacto (categóricas + inteiros reduzidos) à base de vendas"""
+    for col in COLUNAS_CATEGORICAS_VENDAS:
+        if col in df.columns and pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = df[col].astype('category')
+    for col in df.select_dtypes(include=['integer']).columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    # Mes/Ano chegam como float quando há datas inválidas (NaT)
+    for col in ('Mes', 'Ano'):
+        if col in df.columns and df[col].notna().all():
+            df[col] = pd.to_numeric(df[col].astype('int64'), downcast='integer')
+    return df
+
+def _memoria_mb(df):
+    return df.memory_usage(index=True, deep=True).sum() / 1024 ** 2
+
+def relatorio_memoria(datasets):
+    """
+    Pegada de memória por dataset: 'Antes' mede o mesmo DataFrame com as
+    categóricas de volta ao tipo texto e os inteiros em int64 — o formato em
+    que a base chegava sem o schema compacto.
+    """
+    linhas = []
+    for nome, df in datasets.items():
+        if df is None:
+            continue
+        original = df.astype({
+            c: (t.categories.dtype if isinstance(t, pd.CategoricalDtype) else 'int64')
+            for c, t in df.dtypes.items()
+            if isinstance(t, pd.CategoricalDtype) or pd.api.types.is_integer_dtype(t)
+        })
+        antes, depois = _memoria_mb(original), _memoria_mb(df)
+        linhas.append({
+            'Dataset': nome,
+            'Linhas': len(df),
+            'Antes (MB)': round(antes, 1),
+            'Depois (MB)': round(depois, 1),
+            'Redução': f"{(1 - depois / antes) * 100:.0f}%" if antes else "—",
+        })
+    return pd.DataFrame(linhas)
+
 def to_excel(df):
     """Converte DataFrame para Excel"""
     output = io.BytesIO()
+    # PrazoDias (listas) é coluna interna — o Excel recebe só o texto de PrazoHistorico
+    df = df.drop(columns=['PrazoDias'], errors='ignore')
     with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
         df.to_excel(writer, index=False, sheet_name='Dados')
     return output.getvalue()
@@ -1453,6 +3628,85 @@ def to_excel_pedidos_pendentes(df):
     
     return output.getvalue()
 
+# ====================== EXPORTAÇÃO EXCEL SOB DEMANDA ======================
+class ExportacoesLRU:
+    """
+    Planilhas já geradas, por chave (função geradora + versão/conteúdo dos
+    dados), com descarte LRU por número de entradas e total de bytes.
+    Compartilhado entre sessões: a chave só bate para os mesmos dados.
+    """
+
+    def __init__(self, max_entradas=32, max_bytes=64 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+
+    def obter_ou_gerar(self, chave, gerar):
+        with self._trava:
+            if chave in self._entradas:
+                self._entradas.move_to_end(chave)
+                return self._entradas[chave]
+        dados = gerar()
+        with self._trava:
+            if chave not in self._entradas:
+                self._entradas[chave] = dados
+                self._bytes += len(dados)
+            while self._entradas and (len(self._entradas) > self.max_entradas
+                                      or self._bytes > self.max_bytes):
+                _, antigo = self._entradas.popitem(last=False)
+                self._bytes -= len(antigo)
+        return dados
+
+
+@st.cache_resource(show_spinner=False)
+def exportacoes_lru():
+    return ExportacoesLRU()
+
+def _digest_exportacao(obj):
+    """Impressão digital estável de argumentos de exportação (DataFrames pelo conteúdo)"""
+    h = hashlib.sha1()
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        rotulos = list(obj.columns) if isinstance(obj, pd.DataFrame) else [obj.name]
+        h.update(repr((type(obj).__name__, obj.shape, rotulos)).encode())
+        try:
+            h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        except TypeError:
+            # Colunas com listas (ex.: PrazoDias) não são hasheáveis pelo pandas
+            h.update(pd.util.hash_pandas_object(obj.astype(str), index=True).values.tobytes())
+    elif isinstance(obj, (tuple, list)):
+        for item in obj:
+            h.update(_digest_exportacao(item).encode())
+    elif isinstance(obj, dict):
+        for k in sorted(obj, key=str):
+            h.update(str(k).encode())
+            h.update(_digest_exportacao(obj[k]).encode())
+    else:
+        h.update(repr(obj).encode())
+    return h.hexdigest()
+
+def excel_sob_demanda(gerar, *args, chave=None, **kwargs):
+    """
+    Callable para st.download_button(data=...): a planilha gerar(*args, **kwargs)
+    só é montada quando o usuário clica (o Streamlit chama em outra thread) e
+    fica no LRU de exportações. A chave é `chave` (ex.: versão da base +
+    filtros) ou, sem ela, o conteúdo dos argumentos — calculada só no clique.
+    DataFrames são capturados por cópia rasa, imune a alterações posteriores
+    da página.
+    """
+    def _instantaneo(v):
+        return v.copy(deep=False) if isinstance(v, (pd.DataFrame, pd.Series)) else v
+    args = tuple(_instantaneo(a) for a in args)
+    kwargs = {k: _instantaneo(v) for k, v in kwargs.items()}
+    cache = exportacoes_lru()
+
+    def _gerar():
+        base = chave if chave is not None else (args, kwargs)
+        return cache.obter_ou_gerar((gerar.__qualname__, _digest_exportacao(base)),
+                                    lambda: gerar(*args, **kwargs))
+    return _gerar
+
 def formatar_moeda(valor):
     """Formata valor para moeda brasileira"""
     return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
@@ -1473,9 +3727,108 @@ def formatar_numero_br(valor, casas=0):
         return str(valor)
     return texto.replace(",", "X").replace(".", ",").replace("X", ".")
 
-@st.cache_data(ttl=3600)
-def processar_inadimplencia(df):
-    """Processa dados de inadimplência"""
+# ====================== INADIMPLÊNCIA — AGING ======================
+FAIXAS_ATRASO = ['A Vencer', '1-30 dias', '31-60 dias', '61-90 dias', 'Acima de 90 dias']
+_LIMITES_FAIXAS_ATRASO = [-np.inf, 0, 30, 60, 90, np.inf]
+
+def resumo_aging(titulos, chave=None):
+    """
+    Aging agregado por `chave` (Vendedor, Estado, Cliente) — ou uma linha
+    única 'Total' sem chave: Total, Vencido, Titulos, Clientes, AtrasoMedio,
+    AtrasoMax e o valor em aberto de cada faixa, ordenado pelo total.
+    """
+    if chave is not None and chave not in titulos.columns:
+        return pd.DataFrame(columns=['Total', 'Vencido', 'Titulos', 'Clientes',
+                                     'AtrasoMedio', 'AtrasoMax'] + FAIXAS_ATRASO)
+    grupo = titulos[chave] if chave is not None else pd.Series('Total', index=titulos.index)
+    agregacoes = {
+        'Total': ('ValorLiquido', 'sum'),
+        'Titulos': ('ValorLiquido', 'size'),
+        'AtrasoMedio': ('DiasAtraso', 'mean'),
+        'AtrasoMax': ('DiasAtraso', 'max'),
+    }
+    if 'Cliente' in titulos.columns and chave != 'Cliente':
+        agregacoes['Clientes'] = ('Cliente', 'nunique')
+    resumo = titulos.groupby(grupo).agg(**agregacoes)
+    faixas = (titulos.groupby([grupo, titulos['FaixaAtraso']], observed=True)['ValorLiquido']
+              .sum().unstack(fill_value=0)
+              .reindex(index=resumo.index, columns=FAIXAS_ATRASO, fill_value=0))
+    faixas.columns = FAIXAS_ATRASO
+    resumo = resumo.join(faixas)
+    resumo['Vencido'] = resumo['Total'] - resumo['A Vencer']
+    if 'Clientes' not in resumo.columns:
+        resumo['Clientes'] = 1 if chave == 'Cliente' else 0
+    resumo.index.name = chave
+    return resumo.sort_values('Total', ascending=False)
+
+
+class CarteiraReceber:
+    """
+    Carteira de títulos em aberto posicionada numa data-base: títulos com
+    DiasAtraso/FaixaAtraso e os resumos de aging geral, por vendedor, por UF
+    e por cliente. Página de Inadimplência, cards de Performance e a prévia
+    da home leem deste mesmo resultado.
+    """
+
+    def __init__(self, titulos, data_base, resumos=None):
+        self.titulos = titulos
+        self.data_base = data_base
+        if resumos is None:
+            geral = resumo_aging(titulos)
+            resumos = {
+                'geral': geral.iloc[0] if len(geral) else
+                         pd.Series(0.0, index=geral.columns),
+                'por_vendedor': resumo_aging(titulos, 'Vendedor'),
+                'por_uf': resumo_aging(titulos, 'Estado'),
+                'por_cliente': resumo_aging(titulos, 'Cliente'),
+            }
+        self._resumos = resumos
+
+    @property
+    def geral(self):
+        return self._resumos['geral']
+
+    @property
+    def por_vendedor(self):
+        return self._resumos['por_vendedor']
+
+    @property
+    def por_uf(self):
+        return self._resumos['por_uf']
+
+    @property
+    def por_cliente(self):
+        return self._resumos['por_cliente']
+
+    def copia_rasa(self):
+        return CarteiraReceber(self.titulos.copy(deep=False), self.data_base,
+                               {k: v.copy(deep=False) for k, v in self._resumos.items()})
+
+    def filtrar(self, titulos):
+        """Nova carteira (mesma data-base) sobre um recorte dos títulos"""
+        return CarteiraReceber(titulos, self.data_base)
+
+    def total(self, vendedor=None, estado=None):
+        """Valor em aberto do vendedor e/ou UF — direto dos resumos quando possível"""
+        if vendedor is not None and estado is not None:
+            recorte = self.titulos[(self.titulos['Vendedor'] == vendedor) &
+                                   (self.titulos['Estado'] == estado)]
+            return float(recorte['ValorLiquido'].sum())
+        if vendedor is not None:
+            return float(self.por_vendedor['Total'].get(vendedor, 0))
+        if estado is not None:
+            return float(self.por_uf['Total'].get(estado, 0))
+        return float(self.geral['Total'])
+
+
+@cache_por_versao()
+def processar_inadimplencia(df, data_base=None):
+    """
+    Processa dados de inadimplência e devolve a CarteiraReceber posicionada
+    em `data_base` (date; padrão hoje). Cache por versao=SHA da planilha e
+    pela data-base — passar sempre a data explícita para compartilhar o
+    mesmo resultado entre as páginas.
+    """
     # Padronizar nomes das colunas
     # Tentar várias variações de nomes de colunas
     rename_map = {
@@ -1502,27 +3855,16 @@ def processar_inadimplencia(df):
     # Converter data de vencimento
     df['DataVencimento'] = pd.to_datetime(df['DataVencimento'], errors='coerce')
     
-    # Calcular dias de atraso
-    hoje = pd.Timestamp.now()
-    df['DiasAtraso'] = (hoje - df['DataVencimento']).dt.days
-    df['DiasAtraso'] = df['DiasAtraso'].apply(lambda x: max(0, x))  # Não mostrar valores negativos
+    # Calcular dias de atraso na data-base (sem valores negativos; sem vencimento = 0)
+    data_base = pd.Timestamp(data_base if data_base is not None else datetime.now().date()).normalize()
+    dias = (data_base - df['DataVencimento']).dt.days.fillna(0)
+    df['DiasAtraso'] = np.clip(dias.to_numpy(), 0, None).astype('int64')
     
     # Classificar inadimplência
-    def classificar_inadimplencia(dias):
-        if dias == 0:
-            return 'A Vencer'
-        elif dias <= 30:
-            return '1-30 dias'
-        elif dias <= 60:
-            return '31-60 dias'
-        elif dias <= 90:
-            return '61-90 dias'
-        else:
-            return 'Acima de 90 dias'
+    df['FaixaAtraso'] = pd.cut(df['DiasAtraso'], bins=_LIMITES_FAIXAS_ATRASO,
+                               labels=FAIXAS_ATRASO, ordered=True)
     
-    df['FaixaAtraso'] = df['DiasAtraso'].apply(classificar_inadimplencia)
-    
-    return df
+    return CarteiraReceber(df, data_base.date())
 
 
 # ====================== PROPOSTA PDF (HISTÓRICO DE CLIENTE) ======================
@@ -1532,7 +3874,7 @@ def gerar_proposta_pdf_historico(cliente_info_dict, historico_df, vendas_resumo)
     Usa apenas a biblioteca fpdf2 (pip install fpdf2).
     Fallback: se fpdf2 não estiver disponível, usa ReportLab.
     """
-    import io, requests
+    import io
     from datetime import date
 
     razao    = str(cliente_info_dict.get('RazaoSocial', ''))
@@ -1548,20 +3890,13 @@ def gerar_proposta_pdf_historico(cliente_info_dict, historico_df, vendas_resumo)
 
         class PropostaPDF(FPDF):
             def header(self):
-                # Logo
-                try:
-                    resp = requests.get("https://i.imgur.com/gt3rgyL.png", timeout=8)
-                    if resp.status_code == 200:
-                        tmp = io.BytesIO(resp.content)
-                        tmp.seek(0)
-                        import tempfile, os
-                        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f_tmp:
-                            f_tmp.write(resp.content)
-                            tmp_path = f_tmp.name
-                        self.image(tmp_path, x=10, y=8, w=32)
-                        os.unlink(tmp_path)
-                except Exception:
-                    pass
+                # Logo (arquivo em cache: o PDF embute a imagem uma única vez)
+                caminho_logo = logo_caminho()
+                if caminho_logo:
+                    try:
+                        self.image(caminho_logo, x=10, y=8, w=32)
+                    except Exception:
+                        pass
                 self.set_xy(46, 10)
                 self.set_font('Helvetica', 'B', 13)
                 self.set_text_color(31, 71, 136)
@@ -1674,7 +4009,7 @@ def gerar_proposta_pdf_historico(cliente_info_dict, historico_df, vendas_resumo)
             }
         try:
             resumo_prod = vendas_only.groupby(
-                ['CodigoProduto', 'NomeProduto'], as_index=False
+                ['CodigoProduto', 'NomeProduto'], as_index=False, observed=True
             ).agg({k: v for k, v in grp_cols_agg.items() if k in vendas_only.columns})
             resumo_prod = resumo_prod.sort_values('TotalProduto', ascending=False)
         except Exception:
@@ -1763,7 +4098,7 @@ def gerar_proposta_pdf_historico(cliente_info_dict, historico_df, vendas_resumo)
         header = ['Código', 'Produto', 'Qtd', 'Preço Unit.', 'Total']
         rows = [header]
         try:
-            grp = vendas_only.groupby(['CodigoProduto','NomeProduto'], as_index=False).agg(
+            grp = vendas_only.groupby(['CodigoProduto','NomeProduto'], as_index=False, observed=True).agg(
                 {'Quantidade':'sum','PrecoUnit':'mean','TotalProduto':'sum'})
             grp = grp.sort_values('TotalProduto', ascending=False)
             for _, r in grp.iterrows():
@@ -1874,10 +4209,15 @@ with st.sidebar:
     with st.expander("🛠️ Status das Planilhas", expanded=False):
         with st.spinner("Conectando ao GitHub..."):
             planilhas_disponiveis = listar_planilhas_github()
+        _prefetch_planilhas = iniciar_prefetch_planilhas(
+            tuple((p['path'], p.get('sha')) for p in planilhas_disponiveis['todas']),
+            planilhas_disponiveis
+        )
 
         if planilhas_disponiveis['vendas']:
             st.success(f"✅ Vendas: {planilhas_disponiveis['vendas']['nome']}")
             url_planilha_vendas = planilhas_disponiveis['vendas']['url']
+            sha_planilha_vendas = planilhas_disponiveis['vendas'].get('sha')
         else:
             st.error("❌ Planilha de vendas não encontrada")
             st.info("Procurando por arquivo com 'CONSULTA_VENDEDORES' no nome")
@@ -1900,8 +4240,36 @@ with st.sidebar:
         else:
             st.warning("⚠️ Planilha de pedidos pendentes não encontrada")
 
-        if st.button("🔄 Recarregar Dados", use_container_width=True, key="btn_reload"):
+        for _chave_pref, _erro_pref in erros_prefetch(_prefetch_planilhas).items():
+            st.warning(f"Pré-carregamento ({_chave_pref}): {mensagem_erro_planilha(_erro_pref)}")
+
+        _rel_refresh = st.session_state.pop('_relatorio_refresh', None)
+        if _rel_refresh:
+            if _rel_refresh['alteradas'] or _rel_refresh['removidas']:
+                for _r in _rel_refresh['alteradas']:
+                    _ic = "✅" if _r['ok'] else "❌"
+                    st.caption(f"{_ic} {_r['nome']} — {_r['segundos']:.1f}s")
+                for _nome in _rel_refresh['removidas']:
+                    st.caption(f"🗑️ {_nome} (removida)")
+                st.info(f"🔄 {len(_rel_refresh['alteradas'])} planilha(s) atualizada(s), "
+                        f"{_rel_refresh['inalteradas']} sem alteração — {_rel_refresh['segundos']:.1f}s")
+            else:
+                st.info(f"✔️ Nenhuma planilha alterada no GitHub ({_rel_refresh['segundos']:.1f}s)")
+
+        if st.button("🔄 Recarregar Dados", use_container_width=True, key="btn_reload",
+                     help="Recarrega apenas as planilhas que mudaram no GitHub"):
+            try:
+                with st.spinner("Verificando alterações no GitHub..."):
+                    st.session_state['_relatorio_refresh'] = atualizar_planilhas_alteradas()
+            except Exception as e:
+                st.error(f"❌ Erro ao verificar atualizações: {str(e)}")
+            else:
+                st.rerun()
+
+        if st.button("♻️ Recarregar Tudo", use_container_width=True, key="btn_reload_total",
+                     help="Limpa todos os caches e reprocessa todas as planilhas"):
             st.cache_data.clear()
+            limpar_caches_versionados()
             st.rerun()
 
 # Validação crítica fora do expander (sem mensagem visual)
@@ -1910,42 +4278,22 @@ if not planilhas_disponiveis.get('vendas'):
     st.stop()
 
 with st.spinner(""):
-    df = carregar_planilha_github(url_planilha_vendas)
+    df = carregar_planilha_github(url_planilha_vendas, sha_planilha_vendas)
 
 if df is None:
     st.error("❌ Não foi possível carregar os dados de vendas.")
     st.stop()
 
-df = processar_dados(df)
+df = processar_dados(df, versao=sha_planilha_vendas)
 
-# Carregar planilha de produtos para cálculo de comissão
-if planilhas_disponiveis.get('produtos_agrupados'):
-    df_ref_preco = carregar_planilha_github(planilhas_disponiveis['produtos_agrupados']['url'])
-    if df_ref_preco is not None:
-        df_ref_preco.columns = df_ref_preco.columns.str.upper()
-        if 'ID_COD' in df_ref_preco.columns and 'PRECO' in df_ref_preco.columns:
-            df_ref_preco = df_ref_preco[['ID_COD', 'PRECO']].rename(
-                columns={'ID_COD': 'CodigoProduto', 'PRECO': 'PrecoRef'}
-            )
-            def normalizar_codigo(val):
-                try:
-                    return str(int(float(str(val).strip())))
-                except Exception:
-                    return str(val).strip()
-            df['CodigoProduto'] = df['CodigoProduto'].apply(normalizar_codigo)
-            df_ref_preco['CodigoProduto'] = df_ref_preco['CodigoProduto'].apply(normalizar_codigo)
-            df_ref_preco = df_ref_preco.drop_duplicates(subset=['CodigoProduto'], keep='first')
-            df = df.merge(df_ref_preco, on='CodigoProduto', how='left')
-            df['Comissao'] = df.apply(
-                lambda row: calcular_comissao(row['PrecoUnit'], row['PrecoRef']),
-                axis=1
-            )
-        else:
-            df['PrecoRef'] = None
-            df['Comissao'] = ''
-else:
-    df['PrecoRef'] = None
-    df['Comissao'] = ''
+# Carregar planilha de produtos e calcular comissão (cache por versão das planilhas)
+_info_ref_preco = planilhas_disponiveis.get('produtos_agrupados')
+df_ref_preco = catalogo_produtos(_info_ref_preco)
+df = enriquecer_vendas(
+    df, df_ref_preco,
+    versao=(sha_planilha_vendas,
+            _info_ref_preco.get('sha') if _info_ref_preco and df_ref_preco is not None else None)
+)
 
 # ── Filtros Globais — dentro de expander único ───────────────────────────
 with st.expander("⚙️ Filtros", expanded=False):
@@ -1973,22 +4321,51 @@ with st.expander("⚙️ Filtros", expanded=False):
     with fc6:
         anos_opcoes = ['Todos'] + sorted(df['Ano'].dropna().unique().tolist(), reverse=True)
         ano_filtro = st.selectbox("🗓️ Ano", anos_opcoes, key="ano_global")
-df_filtrado = df.copy()
-
-if data_inicial:
-    df_filtrado = df_filtrado[df_filtrado['DataEmissao'] >= pd.to_datetime(data_inicial)]
-if data_final:
-    df_filtrado = df_filtrado[df_filtrado['DataEmissao'] <= pd.to_datetime(data_final)]
-if vendedor_filtro != 'Todos':
-    df_filtrado = df_filtrado[df_filtrado['Vendedor'] == vendedor_filtro]
-if estado_filtro != 'Todos':
-    df_filtrado = df_filtrado[df_filtrado['Estado'] == estado_filtro]
-if mes_filtro != 'Todos':
-    df_filtrado = df_filtrado[df_filtrado['Mes'] == mes_filtro]
-if ano_filtro != 'Todos':
-    df_filtrado = df_filtrado[df_filtrado['Ano'] == ano_filtro]
-
-notas_unicas = obter_notas_unicas(df_filtrado)
+# Filtros globais via índices (ordem por data + posições por vendedor/UF/mês/ano)
+df_filtrado, notas_unicas = filtro_vendas(df, sha_planilha_vendas).filtrar(
+    data_inicial, data_final, vendedor_filtro, estado_filtro, mes_filtro, ano_filtro
+)
+
+# Cubo mensal pré-agregado (uma vez por versão da planilha) para KPIs e gráficos
+cubo = cubo_vendas(df, sha_planilha_vendas)
+
+def fatiar_cubo_global(ini_local=None, fim_local=None):
+    """
+    Recorte do cubo com os filtros globais (mesmas notas de notas_unicas),
+    opcionalmente restrito a um período local
+    """
+    return cubo.fatiar(data_inicial, data_final, vendedor_filtro, estado_filtro, mes_filtro, ano_filtro,
+                       ini_local=ini_local, fim_local=fim_local)
+
+# Pegada de memória das bases em cache (schema compacto) — só administradores
+if usuario.get('tipo', 'administrador') == 'administrador':
+    with st.sidebar:
+        with st.expander("🧠 Memória dos Dados", expanded=False):
+            if st.button("📏 Medir", use_container_width=True, key="btn_memoria"):
+                st.dataframe(relatorio_memoria({
+                    'Vendas': df,
+                    'Cubo mensal': cubo.cubo,
+                    'Catálogo de produtos': df_ref_preco,
+                }), use_container_width=True, hide_index=True)
+        with st.expander("⚡ Cache da Camada de Dados", expanded=False):
+            _met_versao = metricas_caches_versionados()
+            if _met_versao:
+                st.dataframe(pd.DataFrame(_met_versao), use_container_width=True, hide_index=True)
+            else:
+                st.caption("Nenhuma transformação executada ainda.")
+        _supa_cli = supabase_cliente()
+        if _supa_cli is not None:
+            with st.expander("📡 Latência Supabase", expanded=False):
+                _supa_met = _supa_cli.metricas()
+                if _supa_met:
+                    st.dataframe(pd.DataFrame(_supa_met), use_container_width=True, hide_index=True)
+                else:
+                    st.caption("Nenhuma chamada registrada ainda.")
+                _cache_supa = _supa_cli.cache
+                st.caption(f"Cache de leitura ({_cache_supa.ttl}s): "
+                           f"{_cache_supa.acertos} acertos · {_cache_supa.faltas} consultas")
+                for _erro_supa in reversed(_supa_cli.erros):
+                    st.caption(f"❌ {_erro_supa}")
 
 st.sidebar.markdown("---")
 
@@ -2166,224 +4543,45 @@ with st.sidebar:
         unsafe_allow_html=True)
 
     if st.button("📦 Gerar Relatório Semanal", key="btn_semanal", use_container_width=True):
-        import zipfile, io as _io
-        from datetime import date
-
         _hoje = pd.Timestamp.now()
         _inicio_mes = _hoje.replace(day=1)
 
-        _zip_buf = _io.BytesIO()
+        def _gerar_zip_semanal(progresso):
+            # Roda fora da sessão: falhas ao carregar as planilhas levantam
+            # exceção e a tarefa termina com erro, em vez de um ZIP sem a aba
+            # ── Carregar inadimplência ──
+            _df_inad_sem = None
+            if planilhas_disponiveis.get('inadimplencia'):
+                _raw_inad = _ler_planilha_github(planilhas_disponiveis['inadimplencia']['url'], planilhas_disponiveis['inadimplencia'].get('sha'))
+                _df_inad_sem = processar_inadimplencia(
+                    _raw_inad, versao=planilhas_disponiveis['inadimplencia'].get('sha'),
+                    data_base=_hoje.date()).titulos
+
+            # ── Carregar pedidos pendentes ──
+            _df_pend_sem = None
+            if planilhas_disponiveis.get('pedidos_pendentes'):
+                _df_pend_sem = carregar_pedidos_pendentes(
+                    planilhas_disponiveis['pedidos_pendentes']['url'],
+                    planilhas_disponiveis['pedidos_pendentes'].get('sha')
+                )
+                # Filtrar: apenas com quantidade pendente (independente do mês)
+                if len(_df_pend_sem) > 0 and 'QtdPendente' in _df_pend_sem.columns:
+                    _df_pend_sem = _df_pend_sem[_df_pend_sem['QtdPendente'] > 0]
+
+            # ── Faturados: início do mês vigente até hoje ──
+            _df_fat_sem = df[
+                (df['TipoMov'] == 'NF Venda') &
+                (df['DataEmissao'] >= _inicio_mes) &
+                (df['DataEmissao'] <= _hoje)
+            ].copy()
 
-        with st.sidebar.spinner("Gerando relatórios..."):
-            try:
-                # ── Carregar inadimplência ──
-                _df_inad_sem = None
-                if planilhas_disponiveis.get('inadimplencia'):
-                    _raw_inad = carregar_planilha_github(planilhas_disponiveis['inadimplencia']['url'])
-                    if _raw_inad is not None:
-                        _df_inad_sem = processar_inadimplencia(_raw_inad)
-
-                # ── Carregar pedidos pendentes ──
-                _df_pend_sem = None
-                if planilhas_disponiveis.get('pedidos_pendentes'):
-                    try:
-                        import zipfile as _zf, xml.etree.ElementTree as _ET
-                        _resp_p = requests.get(planilhas_disponiveis['pedidos_pendentes']['url'])
-                        _ef = _io.BytesIO(_resp_p.content)
-                        _data_p = []
-                        _cur_cli = None
-                        with _zf.ZipFile(_ef) as _z:
-                            with _z.open('xl/sharedStrings.xml') as _f:
-                                _st = _ET.parse(_f)
-                                _ns_s = {'ss': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
-                                _ss = [si.text if si.text else '' for si in _st.findall('.//ss:t', _ns_s)]
-                            with _z.open('xl/worksheets/sheet1.xml') as _f:
-                                _sh = _ET.parse(_f)
-                                _ns = {'ss': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
-                                for _row in _sh.findall('.//ss:row', _ns):
-                                    _rd = {}
-                                    for _cell in _row.findall('.//ss:c', _ns):
-                                        _ref = _cell.get('r', '')
-                                        _col = ''.join([c for c in _ref if c.isalpha()])
-                                        _ve = _cell.find('.//ss:v', _ns)
-                                        if _ve is not None and _ve.text:
-                                            if _cell.get('t', 'n') == 's':
-                                                _idx = int(_ve.text)
-                                                _rd[_col] = _ss[_idx] if _idx < len(_ss) else _ve.text
-                                            else:
-                                                _rd[_col] = _ve.text
-                                    if not _rd:
-                                        continue
-                                    _ca, _cb = _rd.get('A', ''), _rd.get('B', '')
-                                    if _ca and not _cb and 'N° do pedido' not in _ca and 'Valor Total' not in _ca and _ca != 'Subgrupo:':
-                                        _cur_cli = _ca
-                                    elif 'N° do pedido' in _ca:
-                                        _desc = _rd.get('C', '')
-                                        if _desc and ' - ' in _desc:
-                                            try:
-                                                import re as _re2
-                                                _obs_m = _re2.search(r'observa[çc][aã]o[:\s]*', _desc, _re2.IGNORECASE)
-                                                if _obs_m:
-                                                    _obs = _desc[_obs_m.end():].strip()
-                                                    _desc = _desc[:_obs_m.start()].strip()
-                                                else:
-                                                    _obs = ''
-                                                _qtdc = float(_rd.get('D', 0))
-                                                _vunit = float(_rd.get('E', 0))
-                                                _qtde = float(_rd.get('H', 0))
-                                                _qtdp = _qtdc - _qtde
-                                                _dt_v = _rd.get('G', '')
-                                                _dt_em = (pd.Timestamp('1899-12-30') + pd.Timedelta(days=float(_dt_v))) if _dt_v else None
-                                                _data_p.append({
-                                                    'Cliente': _cur_cli,
-                                                    'NumeroPedido': _cb,
-                                                    'CodigoProduto': _desc.split(' - ')[0].strip(),
-                                                    'Descricao': _desc,
-                                                    'Observacoes': _obs,
-                                                    'QtdContratada': _qtdc,
-                                                    'QtdEntregue': _qtde,
-                                                    'QtdPendente': _qtdp,
-                                                    'ValorUnit': _vunit,
-                                                    'ValorPendente': _qtdp * _vunit,
-                                                    'DataEmissao': _dt_em,
-                                                    'Vendedor': _rd.get('J', ''),
-                                                    'PercEntregue': float(_rd.get('I', 0))
-                                                })
-                                            except Exception:
-                                                continue
-                        _df_pend_sem = pd.DataFrame(_data_p)
-                        if len(_df_pend_sem) > 0:
-                            _df_pend_sem = _df_pend_sem.drop_duplicates(subset=['NumeroPedido', 'CodigoProduto'])
-                        # Filtrar: apenas com quantidade pendente (independente do mês)
-                        if len(_df_pend_sem) > 0 and 'QtdPendente' in _df_pend_sem.columns:
-                            _df_pend_sem = _df_pend_sem[_df_pend_sem['QtdPendente'] > 0]
-                    except Exception:
-                        _df_pend_sem = None
-
-                # ── Faturados: início do mês vigente até hoje ──
-                _df_fat_sem = df[
-                    (df['TipoMov'] == 'NF Venda') &
-                    (df['DataEmissao'] >= _inicio_mes) &
-                    (df['DataEmissao'] <= _hoje)
-                ].copy()
-
-                # ── Lista de vendedores por regra independente ──
-                # Faturados: apenas quem tem NF Venda do início do mês vigente até hoje
-                _vends_fat = set(df[
-                    (df['TipoMov'] == 'NF Venda') &
-                    (df['DataEmissao'] >= _inicio_mes) &
-                    (df['DataEmissao'] <= _hoje)
-                ]['Vendedor'].dropna().unique().tolist())
-                # Inadimplência: todos com clientes na planilha de inadimplência
-                _vends_inad = set(_df_inad_sem['Vendedor'].dropna().unique().tolist()) \
-                    if _df_inad_sem is not None and len(_df_inad_sem) > 0 else set()
-                # Pendentes: todos com clientes na planilha de pedidos pendentes
-                _vends_pend = set(_df_pend_sem['Vendedor'].dropna().unique().tolist()) \
-                    if _df_pend_sem is not None and len(_df_pend_sem) > 0 else set()
-                _vendedores_ativos = sorted(_vends_fat | _vends_inad | _vends_pend)
-
-                with zipfile.ZipFile(_zip_buf, 'w', zipfile.ZIP_DEFLATED) as _zout:
-                    for _vend in _vendedores_ativos:
-                        _vend_pasta = _vend.upper().replace(' ', '_')
-                        _prefixo = f"RELATORIO SEMANAL/{_vend_pasta}/"
-
-                        # ── 1. FATURADOS ──
-                        _df_v_fat = _df_fat_sem[_df_fat_sem['Vendedor'] == _vend].copy()
-                        if len(_df_v_fat) > 0:
-                            _cols = [c for c in ['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado', 'Vendedor',
-                                                  'DataEmissao', 'Numero_NF', 'TipoMov',
-                                                  'CodigoProduto', 'NomeProduto', 'Quantidade', 'PrecoUnit',
-                                                  'TotalProduto', 'Valor_Real'] if c in _df_v_fat.columns]
-                            _df_exp_f = _df_v_fat[_cols].copy()
-                            _df_exp_f['DataEmissao'] = _df_exp_f['DataEmissao'].dt.strftime('%d/%m/%Y')
-
-                            # Aba FATURAMENTO TOTAL: dedup Numero_NF + soma
-                            _cols_oc = ['CodigoProduto', 'NomeProduto', 'Quantidade', 'PrecoUnit', 'TotalProduto', 'Valor_Real']
-                            _cols_ft = [c for c in _cols if c not in _cols_oc]
-                            _df_ft = _df_v_fat.drop_duplicates(subset=['Numero_NF'], keep='first')[_cols_ft + ['TotalProduto']].copy()
-                            _df_ft['DataEmissao'] = _df_ft['DataEmissao'].dt.strftime('%d/%m/%Y')
-                            _soma_ft = _df_ft['TotalProduto'].sum()
-                            _ln_tot = {c: '' for c in _df_ft.columns}
-                            _ln_tot['TotalProduto'] = _soma_ft
-                            _ln_tot['RazaoSocial'] = 'TOTAL'
-                            _df_ft = pd.concat([_df_ft, pd.DataFrame([_ln_tot])], ignore_index=True)
-
-                            _buf_f = _io.BytesIO()
-                            with pd.ExcelWriter(_buf_f, engine='xlsxwriter') as _wr:
-                                _wb = _wr.book
-                                _df_exp_f.to_excel(_wr, index=False, sheet_name='PRODUTOS POR CLIENTE')
-                                _ws1 = _wr.sheets['PRODUTOS POR CLIENTE']
-                                if len(_df_exp_f) > 0:
-                                    _ws1.add_table(0, 0, len(_df_exp_f), len(_df_exp_f.columns)-1, {
-                                        'name': f'TblPC_{_vend_pasta[:10]}',
-                                        'style': 'Table Style Medium 2',
-                                        'columns': [{'header': c} for c in _df_exp_f.columns]
-                                    })
-                                _df_ft.to_excel(_wr, index=False, sheet_name='FATURAMENTO TOTAL')
-                                _ws2 = _wr.sheets['FATURAMENTO TOTAL']
-                                _nft = len(_df_ft) - 1
-                                if _nft > 0:
-                                    _ws2.add_table(0, 0, _nft, len(_df_ft.columns)-1, {
-                                        'name': f'TblFT_{_vend_pasta[:10]}',
-                                        'style': 'Table Style Medium 2',
-                                        'columns': [{'header': c} for c in _df_ft.columns]
-                                    })
-                                _fmt_b = _wb.add_format({'bold': True, 'num_format': '#,##0.00'})
-                                _sc = list(_df_ft.columns).index('TotalProduto')
-                                _ws2.write(_nft + 1, _sc, _soma_ft, _fmt_b)
-                            _zout.writestr(_prefixo + f"{_vend_pasta}_FATURADOS.xlsx", _buf_f.getvalue())
-
-                        # ── 2. PENDENTES ──
-                        if _df_pend_sem is not None and len(_df_pend_sem) > 0:
-                            _df_v_pend = _df_pend_sem[_df_pend_sem['Vendedor'] == _vend].copy()
-                            if len(_df_v_pend) > 0:
-                                _buf_p = _io.BytesIO()
-                                with pd.ExcelWriter(_buf_p, engine='xlsxwriter') as _wr:
-                                    _df_v_pend.to_excel(_wr, index=False, sheet_name='PENDENTES')
-                                    _wsp = _wr.sheets['PENDENTES']
-                                    _wsp.add_table(0, 0, len(_df_v_pend), len(_df_v_pend.columns)-1, {
-                                        'name': f'TblPend_{_vend_pasta[:10]}',
-                                        'style': 'Table Style Medium 2',
-                                        'columns': [{'header': c} for c in _df_v_pend.columns]
-                                    })
-                                _zout.writestr(_prefixo + f"PENDENTES_{_vend_pasta}.xlsx", _buf_p.getvalue())
-
-                        # ── 3. INADIMPLÊNCIA ──
-                        if _df_inad_sem is not None and len(_df_inad_sem) > 0:
-                            _df_v_inad = _df_inad_sem[_df_inad_sem['Vendedor'] == _vend].copy()
-                            if len(_df_v_inad) > 0:
-                                _cols_inad = [c for c in ['Vendedor', 'Cliente', 'NumeroDoc', 'DataVencimento',
-                                                           'ValorLiquido', 'DiasAtraso', 'FaixaAtraso', 'Banco', 'Estado']
-                                              if c in _df_v_inad.columns]
-                                _df_v_inad = _df_v_inad[_cols_inad].copy()
-                                if 'DataVencimento' in _df_v_inad.columns:
-                                    _df_v_inad['DataVencimento'] = _df_v_inad['DataVencimento'].dt.strftime('%d/%m/%Y')
-                                _buf_i = _io.BytesIO()
-                                with pd.ExcelWriter(_buf_i, engine='xlsxwriter') as _wr:
-                                    _df_v_inad.to_excel(_wr, index=False, sheet_name='INADIMPLENCIA')
-                                    _wsi = _wr.sheets['INADIMPLENCIA']
-                                    _wsi.add_table(0, 0, len(_df_v_inad), len(_df_v_inad.columns)-1, {
-                                        'name': f'TblInad_{_vend_pasta[:10]}',
-                                        'style': 'Table Style Medium 2',
-                                        'columns': [{'header': c} for c in _df_v_inad.columns]
-                                    })
-                                _zout.writestr(_prefixo + f"INADIMPLENCIA_{_vend_pasta}.xlsx", _buf_i.getvalue())
-
-                st.session_state['_zip_semanal'] = _zip_buf.getvalue()
-                st.session_state['_zip_semanal_nome'] = f"RELATORIO_SEMANAL_{_hoje.strftime('%d-%m-%Y')}.zip"
-                st.rerun()
+            # Vendedores: quem tem faturado no mês, pendência ou inadimplência
+            return gerar_zip_semanal(_df_fat_sem, _df_pend_sem, _df_inad_sem, progresso)
 
-            except Exception as _e:
-                st.sidebar.error(f"Erro: {_e}")
+        enviar_tarefa("📦 Relatório Semanal", _gerar_zip_semanal,
+                      f"RELATORIO_SEMANAL_{_hoje.strftime('%d-%m-%Y')}.zip", "application/zip")
 
-    if st.session_state.get('_zip_semanal'):
-        st.sidebar.download_button(
-            "💾 Baixar ZIP Semanal",
-            st.session_state['_zip_semanal'],
-            st.session_state.get('_zip_semanal_nome', 'RELATORIO_SEMANAL.zip'),
-            "application/zip",
-            key="download_zip_semanal"
-        )
+    exibir_painel_tarefas()
 
 
 if st.session_state.menu_option == '__home__':
@@ -2432,11 +4630,13 @@ if st.session_state.menu_option == '__home__':
     # Inadimplência — carregada separadamente, usar placeholder se não disponível
     try:
         if planilhas_disponiveis.get('inadimplencia'):
-            _df_inad = carregar_planilha_github(planilhas_disponiveis['inadimplencia']['url'])
+            _df_inad = carregar_planilha_github(planilhas_disponiveis['inadimplencia']['url'], planilhas_disponiveis['inadimplencia'].get('sha'))
             if _df_inad is not None:
-                _df_inad = processar_inadimplencia(_df_inad)
-                _val_inad = _df_inad['ValorLiquido'].sum()
-                _cli_inad = _df_inad['Cliente'].nunique()
+                _carteira_inad = processar_inadimplencia(
+                    _df_inad, versao=planilhas_disponiveis['inadimplencia'].get('sha'),
+                    data_base=datetime.now().date())
+                _val_inad = _carteira_inad.geral['Total']
+                _cli_inad = _carteira_inad.geral['Clientes']
                 _info_inad = f"R$ {formatar_numero_br(_val_inad, 0)} · {formatar_numero_br(_cli_inad, 0)} clientes"
             else:
                 _info_inad = "Dados não disponíveis"
@@ -2447,7 +4647,7 @@ if st.session_state.menu_option == '__home__':
 
     # Clientes sem compra há mais de 6 meses
     try:
-        _ultima_compra = df[df['TipoMov']=='NF Venda'].groupby('CPF_CNPJ')['DataEmissao'].max()
+        _ultima_compra = df[df['TipoMov']=='NF Venda'].groupby('CPF_CNPJ', observed=True)['DataEmissao'].max()
         _sem_6m = (_ultima_compra < _6m).sum()
         _info_churn = f"{formatar_numero_br(_sem_6m, 0)} clientes sem compra há +6 meses"
     except Exception:
@@ -2456,35 +4656,12 @@ if st.session_state.menu_option == '__home__':
     # Pedidos pendentes — carregado separadamente
     try:
         if planilhas_disponiveis.get('pedidos_pendentes'):
-            _resp = requests.get(planilhas_disponiveis['pedidos_pendentes']['url'], timeout=15)
-            import zipfile, xml.etree.ElementTree as ET
-            from io import BytesIO as _BytesIO
-            _ef = _BytesIO(_resp.content)
-            with zipfile.ZipFile(_ef) as _z:
-                with _z.open('xl/sharedStrings.xml') as _f:
-                    _st = ET.parse(_f)
-                    _ns = {'ss':'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
-                    _ss = [s.text or '' for s in _st.findall('.//ss:t',_ns)]
-                with _z.open('xl/worksheets/sheet1.xml') as _f:
-                    _sh = ET.parse(_f)
-                    _val_pend = 0.0; _cli_pend = set()
-                    for _row in _sh.findall('.//ss:row',_ns):
-                        _rd = {}
-                        for _c in _row.findall('.//ss:c',_ns):
-                            _ref=''.join([x for x in _c.get('r','') if x.isalpha()])
-                            _v=_c.find('.//ss:v',_ns)
-                            if _v is not None and _v.text:
-                                _rd[_ref]=_ss[int(_v.text)] if _c.get('t')=='s' else _v.text
-                        _ca=_rd.get('A',''); _cb=_rd.get('B','')
-                        if _ca and not _cb and 'N° do pedido' not in _ca:
-                            _cur_cli=_ca
-                        elif 'N° do pedido' in _ca:
-                            try:
-                                _qc=float(_rd.get('D',0)); _vu=float(_rd.get('E',0))
-                                _qe=float(_rd.get('H',0)); _qp=_qc-_qe
-                                _val_pend+=_qp*_vu
-                                if hasattr(_cur_cli,'__len__'): _cli_pend.add(_cur_cli)
-                            except Exception: pass
+            _df_pend_home = carregar_pedidos_pendentes(
+                planilhas_disponiveis['pedidos_pendentes']['url'],
+                planilhas_disponiveis['pedidos_pendentes'].get('sha')
+            )
+            _val_pend = _df_pend_home['ValorPendente'].sum()
+            _cli_pend = set(_df_pend_home['Cliente'].dropna())
             _info_pend = f"R$ {formatar_numero_br(_val_pend, 0)} · {formatar_numero_br(len(_cli_pend), 0)} clientes"
         else:
             _info_pend = "Aguardando faturamento"
@@ -2499,7 +4676,7 @@ if st.session_state.menu_option == '__home__':
             (notas_unicas['DataEmissao'].dt.month == _mes) &
             (notas_unicas['DataEmissao'].dt.year == _ano)
         ]
-        _rank = vendas_mes_atual.groupby('Vendedor')['TotalProduto'].sum().nlargest(3)
+        _rank = vendas_mes_atual.groupby('Vendedor', observed=True)['TotalProduto'].sum().nlargest(3)
         _info_rank = " · ".join([f"{v.split()[0]} R${formatar_numero_br(r, 0)}" for v,r in _rank.items()])
     except Exception:
         _info_rank = "Top vendedores e clientes"
@@ -2674,6 +4851,41 @@ def _erp_kpi(col, label, valor, cor="#1F4788"):
             f'</div>', unsafe_allow_html=True
         )
 
+def _erp_cursor_pagina(chave, assinatura):
+    """Cursor da página atual de uma listagem ERP (volta à 1ª página se os filtros mudarem)"""
+    estado = st.session_state.setdefault(chave, {"assinatura": None, "cursores": [None]})
+    if estado["assinatura"] != assinatura:
+        estado.update(assinatura=assinatura, cursores=[None])
+    return estado["cursores"][-1]
+
+def _erp_navegacao_paginas(chave, proximo_cursor, total, exibidos, tamanho):
+    """Botões anterior/próxima e a faixa exibida de uma listagem paginada"""
+    estado = st.session_state[chave]
+    pagina = len(estado["cursores"])
+    _na, _nb, _nc = st.columns([1, 2, 1])
+    with _na:
+        if pagina > 1 and st.button("◀ Anterior", key=f"{chave}_ant",
+                                    use_container_width=True):
+            estado["cursores"].pop()
+            st.rerun()
+    with _nb:
+        if exibidos:
+            _ini = (pagina - 1) * tamanho + 1
+            st.caption(f"Pedidos {_ini}–{_ini + exibidos - 1} de {total}")
+    with _nc:
+        if proximo_cursor and st.button("Próxima ▶", key=f"{chave}_prox",
+                                        use_container_width=True):
+            estado["cursores"].append(proximo_cursor)
+            st.rerun()
+
+def _erp_filtro_periodo(periodo):
+    """Filtro criado_em ≥ corte para os períodos 'Últimos N dias' (None em 'Todos')"""
+    dias = {"Últimos 7 dias": 7, "Últimos 30 dias": 30, "Últimos 90 dias": 90}.get(periodo)
+    if not dias:
+        return None
+    # Corte arredondado ao minuto: reruns seguidos repetem a mesma consulta (cache de leitura)
+    return ("gte", (pd.Timestamp.now() - pd.Timedelta(days=dias)).floor("min").isoformat())
+
 def _erp_aviso_sem_supabase():
     st.warning(
         "⚙️ **Módulo ERP não configurado.**\n\n"
@@ -2703,35 +4915,28 @@ if menu not in modulos_permitidos and menu not in _MENU_ESPECIAIS:
 elif menu == "Dashboard":
     # Filtro local de período (não afeta os demais módulos)
     _dash_ini, _dash_fim = renderizar_filtros_locais("dash", "📅 Ajustar Período")
-    _dash_notas = notas_unicas.copy()
-    _dash_df_filtrado = df_filtrado.copy()
-    if _dash_ini:
-        _dash_notas = _dash_notas[_dash_notas['DataEmissao'] >= pd.to_datetime(_dash_ini)]
-        _dash_df_filtrado = _dash_df_filtrado[_dash_df_filtrado['DataEmissao'] >= pd.to_datetime(_dash_ini)]
-    if _dash_fim:
-        _dash_notas = _dash_notas[_dash_notas['DataEmissao'] <= pd.to_datetime(_dash_fim)]
-        _dash_df_filtrado = _dash_df_filtrado[_dash_df_filtrado['DataEmissao'] <= pd.to_datetime(_dash_fim)]
+    # KPIs e gráficos saem do cubo mensal (notas únicas já somadas por mês × vendedor × UF × cliente)
+    _dash_cubo = fatiar_cubo_global(_dash_ini, _dash_fim)
+    _dash_vendas = _dash_cubo[_dash_cubo['TipoMov'] == 'NF Venda']
+    _dash_devol = _dash_cubo[_dash_cubo['TipoMov'] == 'NF Dev.Venda']
 
     # KPIs principais com cards customizados
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        vendas_brutas = _dash_notas[_dash_notas['TipoMov'] == 'NF Venda']['TotalProduto'].sum()
+        vendas_brutas = _dash_vendas['TotalProduto'].sum()
         render_kpi_card("Faturamento Bruto", f"R$ {formatar_numero_br(vendas_brutas, 0)}", icon="💰", color="#1F4788")
     
     with col2:
-        faturamento_liquido = (
-            _dash_notas[_dash_notas['TipoMov'] == 'NF Venda']['TotalProduto'].sum() -
-            _dash_notas[_dash_notas['TipoMov'] == 'NF Dev.Venda']['TotalProduto'].sum()
-        )
+        faturamento_liquido = _dash_vendas['TotalProduto'].sum() - _dash_devol['TotalProduto'].sum()
         render_kpi_card("Faturamento Líquido", f"R$ {formatar_numero_br(faturamento_liquido, 0)}", icon="💵", color="#10B981")
     
     with col3:
-        clientes_unicos = _dash_df_filtrado['CPF_CNPJ'].nunique()
+        clientes_unicos = _dash_cubo['CPF_CNPJ'].nunique()
         render_kpi_card("Clientes Únicos", f"{formatar_numero_br(clientes_unicos, 0)}", icon="👥", color="#F59E0B")
     
     with col4:
-        total_notas = len(_dash_notas[_dash_notas['TipoMov'] == 'NF Venda'])
+        total_notas = int(_dash_vendas['Notas'].sum())
         render_kpi_card("Notas de Venda", f"{formatar_numero_br(total_notas, 0)}", icon="📄", color="#EF4444")
     
     st.markdown("<br>", unsafe_allow_html=True)
@@ -2740,7 +4945,7 @@ elif menu == "Dashboard":
     col1b, col2b, col3b, col4b = st.columns(4)
     
     with col1b:
-        total_devolucoes = _dash_notas[_dash_notas['TipoMov'] == 'NF Dev.Venda']['TotalProduto'].sum()
+        total_devolucoes = _dash_devol['TotalProduto'].sum()
         render_kpi_card("Devoluções", f"R$ {formatar_numero_br(total_devolucoes, 0)}", icon="↩️", color="#E5E7EB")
     
     with col2b:
@@ -2748,7 +4953,7 @@ elif menu == "Dashboard":
         render_kpi_card("Ticket Médio", f"R$ {formatar_numero_br(ticket_medio, 0)}", icon="🎯", color="#E5E7EB")
     
     with col3b:
-        qtd_notas_dev = len(_dash_notas[_dash_notas['TipoMov'] == 'NF Dev.Venda'])
+        qtd_notas_dev = int(_dash_devol['Notas'].sum())
         render_kpi_card("Notas Devolução", f"{formatar_numero_br(qtd_notas_dev, 0)}", icon="📋", color="#E5E7EB")
     
     with col4b:
@@ -2762,7 +4967,7 @@ elif menu == "Dashboard":
 
     with col5:
         st.subheader("📈 Evolução de Vendas")
-        vendas_tempo = _dash_notas[_dash_notas['TipoMov'] == 'NF Venda'].groupby('MesAno')['TotalProduto'].sum().reset_index().sort_values('MesAno')
+        vendas_tempo = _dash_vendas[_dash_vendas['Notas'] > 0].groupby('MesAno', observed=True)['TotalProduto'].sum().reset_index().sort_values('MesAno')
         if len(vendas_tempo) > 0:
             fig_linha = px.line(vendas_tempo, x='MesAno', y='TotalProduto',
                 labels={'MesAno': 'Período', 'TotalProduto': 'Valor (R$)'})
@@ -2775,7 +4980,7 @@ elif menu == "Dashboard":
 
     with col6:
         st.subheader("🗺️ Top 10 Estados")
-        vendas_estado = _dash_notas[_dash_notas['TipoMov'] == 'NF Venda'].groupby('Estado')['TotalProduto'].sum().reset_index().sort_values('TotalProduto', ascending=False).head(10)
+        vendas_estado = _dash_vendas[_dash_vendas['Notas'] > 0].groupby('Estado', observed=True)['TotalProduto'].sum().reset_index().sort_values('TotalProduto', ascending=False).head(10)
         fig_bar = px.bar(vendas_estado, x='Estado', y='TotalProduto',
             labels={'Estado': 'Estado', 'TotalProduto': 'Valor (R$)'},
             color_discrete_sequence=['#2E86AB'])
@@ -2784,7 +4989,7 @@ elif menu == "Dashboard":
 
     with col7:
         st.subheader("👥 Positivação por Vendedor")
-        atendidos = _dash_df_filtrado[_dash_df_filtrado['TipoMov'] == 'NF Venda'].groupby('Vendedor')['CPF_CNPJ'].nunique().reset_index()
+        atendidos = _dash_vendas.groupby('Vendedor', observed=True)['CPF_CNPJ'].nunique().reset_index()
         atendidos.columns = ['Vendedor', 'Clientes']
         atendidos = atendidos.sort_values('Clientes', ascending=False).head(10)
         fig_posit = px.bar(atendidos, x='Vendedor', y='Clientes',
@@ -2800,7 +5005,7 @@ elif menu == "Dashboard":
 
     with col8:
         st.subheader("🏆 Top 10 Clientes")
-        ranking_clientes = _dash_notas[_dash_notas['TipoMov'] == 'NF Venda'].groupby('RazaoSocial')['TotalProduto'].sum().reset_index().sort_values('TotalProduto', ascending=False).head(10)
+        ranking_clientes = _dash_vendas[_dash_vendas['Notas'] > 0].groupby('RazaoSocial', observed=True)['TotalProduto'].sum().reset_index().sort_values('TotalProduto', ascending=False).head(10)
         fig_clientes = px.bar(ranking_clientes, x='TotalProduto', y='RazaoSocial', orientation='h',
             labels={'RazaoSocial': 'Cliente', 'TotalProduto': 'Valor (R$)'},
             color_discrete_sequence=['#4A7BC8'])
@@ -2809,11 +5014,12 @@ elif menu == "Dashboard":
 
     with col9:
         st.subheader("⚠️ Clientes sem Compra")
-        _com_venda = set(_dash_df_filtrado[_dash_df_filtrado['TipoMov'] == 'NF Venda']['CPF_CNPJ'].unique())
-        _todos = df.sort_values('DataEmissao').groupby('CPF_CNPJ').last().reset_index()
-        _vhist = df[df['TipoMov'] == 'NF Venda'].groupby('CPF_CNPJ')['TotalProduto'].sum().reset_index()
+        _com_venda = set(_dash_vendas['CPF_CNPJ'].unique())
+        _todos = df.sort_values('DataEmissao').groupby('CPF_CNPJ', observed=True).last().reset_index()
+        _vhist = df[df['TipoMov'] == 'NF Venda'].groupby('CPF_CNPJ', observed=True)['TotalProduto'].sum().reset_index()
         _vhist.columns = ['CPF_CNPJ', 'ValorHistorico']
-        _todos = pd.merge(_todos, _vhist, on='CPF_CNPJ', how='left').fillna(0)
+        _todos = pd.merge(_todos, _vhist, on='CPF_CNPJ', how='left')
+        _todos['ValorHistorico'] = _todos['ValorHistorico'].fillna(0)
         _sem = _todos[~_todos['CPF_CNPJ'].isin(_com_venda)].sort_values('ValorHistorico', ascending=False).head(10)
         fig_churn = px.bar(_sem, x='ValorHistorico', y='RazaoSocial', orientation='h',
             labels={'RazaoSocial': 'Cliente', 'ValorHistorico': 'Valor Histórico (R$)'},
@@ -2823,7 +5029,7 @@ elif menu == "Dashboard":
 
     with col10:
         st.subheader("📊 Ranking de Vendedores")
-        ranking_vendedores = _dash_notas[_dash_notas['TipoMov'] == 'NF Venda'].groupby('Vendedor')['TotalProduto'].sum().reset_index().sort_values('TotalProduto', ascending=False).head(10)
+        ranking_vendedores = _dash_vendas[_dash_vendas['Notas'] > 0].groupby('Vendedor', observed=True)['TotalProduto'].sum().reset_index().sort_values('TotalProduto', ascending=False).head(10)
         fig_rank_vend = px.bar(ranking_vendedores, x='TotalProduto', y='Vendedor', orientation='h',
             labels={'Vendedor': 'Vendedor', 'TotalProduto': 'Valor Total (R$)'},
             color_discrete_sequence=['#163561'])
@@ -2837,13 +5043,14 @@ elif menu == "Positivação":
     # ── KPIs do mês vigente no topo ───────────────────────────────────────
     _mes_atual = pd.Timestamp.now().month
     _ano_atual = pd.Timestamp.now().year
-    _vendas_mes = df_filtrado[
-        (df_filtrado['TipoMov'] == 'NF Venda') &
-        (df_filtrado['DataEmissao'].dt.month == _mes_atual) &
-        (df_filtrado['DataEmissao'].dt.year == _ano_atual)
+    _posit_cubo = fatiar_cubo_global()
+    _posit_vendas = _posit_cubo[_posit_cubo['TipoMov'] == 'NF Venda']
+    _vendas_mes = _posit_vendas[
+        (_posit_vendas['Mes'] == _mes_atual) &
+        (_posit_vendas['Ano'] == _ano_atual)
     ]
     _posit_mes    = _vendas_mes['CPF_CNPJ'].nunique()
-    _total_base   = df['CPF_CNPJ'].nunique()
+    _total_base   = cubo.cubo['CPF_CNPJ'].nunique()
     _perc_posit   = (_posit_mes / _total_base * 100) if _total_base > 0 else 0
 
     _kp1, _kp2, _kp3 = st.columns(3)
@@ -2862,14 +5069,14 @@ elif menu == "Positivação":
     tab1, tab2, tab3_fat, tab4_prod = st.tabs(["📊 Por Vendedor", "🗺️ Por Estado", "🧾 Pedidos Faturados", "📦 Faturamento por Produto"])
     
     with tab1:
-        base_vendedor = df.groupby('Vendedor')['CPF_CNPJ'].nunique().reset_index()
+        base_vendedor = cubo.cubo.groupby('Vendedor', observed=True)['CPF_CNPJ'].nunique().reset_index()
         base_vendedor.columns = ['Vendedor', 'TotalBase']
         
-        vendas_periodo = df_filtrado[df_filtrado['TipoMov'] == 'NF Venda']
-        atendidos = vendas_periodo.groupby('Vendedor')['CPF_CNPJ'].nunique().reset_index()
+        vendas_periodo = _posit_vendas
+        atendidos = vendas_periodo.groupby('Vendedor', observed=True)['CPF_CNPJ'].nunique().reset_index()
         atendidos.columns = ['Vendedor', 'QtdAtendidos']
         
-        valor_vendedor = obter_notas_unicas(vendas_periodo).groupby('Vendedor')['Valor_Real'].sum().reset_index()
+        valor_vendedor = vendas_periodo[vendas_periodo['Notas'] > 0].groupby('Vendedor', observed=True)['Valor_Real'].sum().reset_index()
         valor_vendedor.columns = ['Vendedor', 'ValorTotal']
         
         relatorio_positivacao = pd.merge(base_vendedor, atendidos, on='Vendedor', how='left')
@@ -2897,7 +5104,7 @@ elif menu == "Positivação":
         
         st.download_button(
             "📥 Exportar Positivação por Vendedor",
-            to_excel(relatorio_positivacao),
+            excel_sob_demanda(to_excel, relatorio_positivacao),
             "positivacao_vendedor.xlsx",
             "application/vnd.ms-excel",
             key="dl_posit_vendedor"
@@ -2912,9 +5119,11 @@ elif menu == "Positivação":
         )
         
         if vendedor_selecionado:
-            notas_vendedor = obter_notas_unicas(vendas_periodo[vendas_periodo['Vendedor'] == vendedor_selecionado])
+            notas_vendedor = vendas_periodo[
+                (vendas_periodo['Vendedor'] == vendedor_selecionado) & (vendas_periodo['Notas'] > 0)
+            ]
             
-            clientes_vendedor = notas_vendedor.groupby(['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']).agg({
+            clientes_vendedor = notas_vendedor.groupby(['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado'], observed=True).agg({
                 'Valor_Real': 'sum'
             }).reset_index()
             clientes_vendedor.columns = ['CPF/CNPJ', 'Razão Social', 'Cidade', 'Estado', 'Valor Total']
@@ -2932,7 +5141,7 @@ elif menu == "Positivação":
             
             st.download_button(
                 f"📥 Exportar Clientes - {vendedor_selecionado}",
-                to_excel(clientes_vendedor),
+                excel_sob_demanda(to_excel, clientes_vendedor),
                 f"clientes_{vendedor_selecionado}.xlsx",
                 "application/vnd.ms-excel",
                 key="dl_posit_cliente_det"
@@ -2955,20 +5164,19 @@ elif menu == "Positivação":
                 key="ano_estado"
             )
         
-        df_estado_filtrado = df_filtrado.copy()
+        vendas_estado = _posit_vendas
         if vendedor_estado_filtro != 'Todos':
-            df_estado_filtrado = df_estado_filtrado[df_estado_filtrado['Vendedor'] == vendedor_estado_filtro]
+            vendas_estado = vendas_estado[vendas_estado['Vendedor'] == vendedor_estado_filtro]
         if ano_estado_filtro != 'Todos':
-            df_estado_filtrado = df_estado_filtrado[df_estado_filtrado['Ano'] == ano_estado_filtro]
+            vendas_estado = vendas_estado[vendas_estado['Ano'] == ano_estado_filtro]
         
-        base_estado = df.groupby('Estado')['CPF_CNPJ'].nunique().reset_index()
+        base_estado = cubo.cubo.groupby('Estado', observed=True)['CPF_CNPJ'].nunique().reset_index()
         base_estado.columns = ['Estado', 'TotalBase']
         
-        vendas_estado = df_estado_filtrado[df_estado_filtrado['TipoMov'] == 'NF Venda']
-        atendidos_estado = vendas_estado.groupby('Estado')['CPF_CNPJ'].nunique().reset_index()
+        atendidos_estado = vendas_estado.groupby('Estado', observed=True)['CPF_CNPJ'].nunique().reset_index()
         atendidos_estado.columns = ['Estado', 'QtdAtendidos']
         
-        valor_estado = obter_notas_unicas(vendas_estado).groupby('Estado')['Valor_Real'].sum().reset_index()
+        valor_estado = vendas_estado[vendas_estado['Notas'] > 0].groupby('Estado', observed=True)['Valor_Real'].sum().reset_index()
         valor_estado.columns = ['Estado', 'ValorTotal']
         
         relatorio_estado = pd.merge(base_estado, atendidos_estado, on='Estado', how='left')
@@ -2996,7 +5204,7 @@ elif menu == "Positivação":
         
         st.download_button(
             "📥 Exportar Positivação por Estado",
-            to_excel(relatorio_estado),
+            excel_sob_demanda(to_excel, relatorio_estado),
             "positivacao_estado.xlsx",
             "application/vnd.ms-excel",
             key="dl_posit_estado"
@@ -3115,7 +5323,7 @@ elif menu == "Positivação":
 
             st.download_button(
                 "📥 Exportar Pedidos Faturados",
-                _gerar_excel_faturado(_df_fat, _fat_vend),
+                excel_sob_demanda(_gerar_excel_faturado, _df_fat, _fat_vend),
                 _nome_arquivo_fat,
                 "application/vnd.ms-excel",
                 key="download_fat"
@@ -3177,7 +5385,7 @@ elif menu == "Positivação":
             _sinal = _prod_fat['TipoMov'].apply(lambda t: 1 if t == 'NF Venda' else -1)
             _prod_fat['ValorItem'] = _prod_fat['PrecoUnit'] * _prod_fat['Quantidade'] * _sinal
             _prod_fat['QtdItem'] = _prod_fat['Quantidade'] * _sinal
-            _prod_agrup = _prod_fat.groupby(['CodigoProduto', 'NomeProduto']).agg(
+            _prod_agrup = _prod_fat.groupby(['CodigoProduto', 'NomeProduto'], observed=True).agg(
                 Quantidade=('QtdItem', 'sum'),
                 TotalProduto=('ValorItem', 'sum')
             ).reset_index()
@@ -3192,18 +5400,9 @@ elif menu == "Positivação":
             # Adicionar Gramatura via lookup da planilha de produtos
             if planilhas_disponiveis.get('produtos_agrupados'):
                 try:
-                    _fp_gram_df = carregar_planilha_github(planilhas_disponiveis['produtos_agrupados']['url'])
-                    if _fp_gram_df is not None:
-                        _fp_gram_df.columns = _fp_gram_df.columns.str.upper().str.strip()
-                        _fp_kc = next((c for c in _fp_gram_df.columns if any(x in c for x in ['ID_COD','CODIGO','COD'])), None)
-                        _fp_gc = next((c for c in _fp_gram_df.columns if 'GRAMATUR' in c), None)
-                        if _fp_kc and _fp_gc:
-                            def _fp_norm(v):
-                                try: return str(int(float(str(v).strip())))
-                                except Exception: return str(v).strip()
-                            _fp_gram_df['_K'] = _fp_gram_df[_fp_kc].apply(_fp_norm)
-                            _fp_gmap = _fp_gram_df.drop_duplicates(subset='_K').set_index('_K')[_fp_gc]
-                            _prod_agrup['Gramatura'] = _prod_agrup['CodigoProduto'].apply(_fp_norm).map(_fp_gmap).fillna('')
+                    _fp_cat = indice_produtos(planilhas_disponiveis['produtos_agrupados'])
+                    if _fp_cat is not None and _fp_cat.col_gramatura:
+                        _prod_agrup['Gramatura'] = normalizar_codigo_serie(_prod_agrup['CodigoProduto']).map(_fp_cat.gramaturas).fillna('')
                 except Exception:
                     _prod_agrup['Gramatura'] = ''
 
@@ -3231,7 +5430,7 @@ elif menu == "Positivação":
 
             st.download_button(
                 "📥 Exportar Faturamento por Produto",
-                to_excel(_prod_agrup),
+                excel_sob_demanda(to_excel, _prod_agrup),
                 "faturamento_por_produto.xlsx",
                 "application/vnd.ms-excel",
                 key="dl_fat_produto_posit"
@@ -3251,15 +5450,21 @@ elif menu == "Inadimplência":
     
     # Carregar dados de inadimplência
     with st.spinner("📥 Carregando dados de inadimplência..."):
-        df_inadimplencia = carregar_planilha_github(planilhas_disponiveis['inadimplencia']['url'])
+        df_inadimplencia = carregar_planilha_github(planilhas_disponiveis['inadimplencia']['url'], planilhas_disponiveis['inadimplencia'].get('sha'))
     
     if df_inadimplencia is not None and len(df_inadimplencia) > 0:
-        df_inadimplencia = processar_inadimplencia(df_inadimplencia)
-        
-        
         # ========== FILTROS ==========
         st.subheader("🔍 Filtros")
-        col_f1, col_f2 = st.columns(2)
+        col_f1, col_f2, col_f3 = st.columns(3)
+        
+        with col_f3:
+            data_base_inad = st.date_input("Posição em", value=datetime.now().date(),
+                                           format="DD/MM/YYYY", key="data_base_inad")
+        
+        carteira_inad = processar_inadimplencia(
+            df_inadimplencia, versao=planilhas_disponiveis['inadimplencia'].get('sha'),
+            data_base=data_base_inad)
+        df_inadimplencia = carteira_inad.titulos
         
         with col_f1:
             vendedores_inad = ['Todos'] + sorted(df_inadimplencia['Vendedor'].dropna().unique().tolist())
@@ -3283,25 +5488,32 @@ elif menu == "Inadimplência":
         if data_final_inad:
             df_inad_filtrado = df_inad_filtrado[df_inad_filtrado['DataVencimento'] <= pd.to_datetime(data_final_inad)]
         
+        # Sem filtros, os resumos de aging já vêm prontos do cache
+        if len(df_inad_filtrado) == len(df_inadimplencia):
+            carteira_filtrada = carteira_inad
+        else:
+            carteira_filtrada = carteira_inad.filtrar(df_inad_filtrado)
+        resumo_geral_inad = carteira_filtrada.geral
+        
         st.markdown("---")
         
         # ========== CARDS DE RESUMO ==========
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            total_inadimplencia = df_inad_filtrado['ValorLiquido'].sum()
+            total_inadimplencia = resumo_geral_inad['Total']
             st.metric("Total em Aberto", f"R$ {formatar_numero_br(total_inadimplencia, 2)}")
         
         with col2:
-            qtd_titulos = len(df_inad_filtrado)
+            qtd_titulos = int(resumo_geral_inad['Titulos'])
             st.metric("Qtd. Títulos", f"{formatar_numero_br(qtd_titulos, 0)}")
         
         with col3:
-            clientes_inadimplentes = df_inad_filtrado['Cliente'].nunique()
+            clientes_inadimplentes = int(resumo_geral_inad['Clientes'])
             st.metric("Clientes Inadimplentes", f"{formatar_numero_br(clientes_inadimplentes, 0)}")
         
         with col4:
-            atraso_medio = df_inad_filtrado['DiasAtraso'].mean()
+            atraso_medio = resumo_geral_inad['AtrasoMedio'] if qtd_titulos else float('nan')
             st.metric("Atraso Médio", f"{atraso_medio:.0f} dias")
         
         st.markdown("---")
@@ -3311,10 +5523,10 @@ elif menu == "Inadimplência":
 
         with col5:
             st.markdown("**📊 Por Faixa de Atraso**")
-            ordem_faixas = ['A Vencer', '1-30 dias', '31-60 dias', '61-90 dias', 'Acima de 90 dias']
-            inad_por_faixa = df_inad_filtrado.groupby('FaixaAtraso')['ValorLiquido'].sum().reset_index()
-            inad_por_faixa['FaixaAtraso'] = pd.Categorical(inad_por_faixa['FaixaAtraso'], categories=ordem_faixas, ordered=True)
-            inad_por_faixa = inad_por_faixa.sort_values('FaixaAtraso')
+            inad_por_faixa = pd.DataFrame({
+                'FaixaAtraso': FAIXAS_ATRASO,
+                'ValorLiquido': [resumo_geral_inad[f] for f in FAIXAS_ATRASO],
+            })
             fig_faixa = px.bar(inad_por_faixa, x='FaixaAtraso', y='ValorLiquido',
                 labels={'FaixaAtraso': '', 'ValorLiquido': 'R$'},
                 color_discrete_sequence=['#1F4788'])
@@ -3333,13 +5545,8 @@ elif menu == "Inadimplência":
 
         with col7:
             st.markdown("**👤 Top Vendedores**")
-            if 'NumeroDoc' not in df_inad_filtrado.columns:
-                possiveis_nomes = [col for col in df_inad_filtrado.columns if 'DOC' in col.upper() or 'NUMERO' in col.upper()]
-                df_inad_filtrado['NumeroDoc'] = df_inad_filtrado[possiveis_nomes[0]] if possiveis_nomes else 1
-            inad_por_vendedor = df_inad_filtrado.groupby('Vendedor').agg(
-                {'ValorLiquido': 'sum', 'NumeroDoc': 'count'}).reset_index()
+            inad_por_vendedor = carteira_filtrada.por_vendedor.head(10)[['Total', 'Titulos']].reset_index()
             inad_por_vendedor.columns = ['Vendedor', 'Valor', 'QtdTitulos']
-            inad_por_vendedor = inad_por_vendedor.sort_values('Valor', ascending=False).head(10)
             fig_vend_inad = px.bar(inad_por_vendedor, x='Valor', y='Vendedor', orientation='h',
                 labels={'Vendedor': '', 'Valor': 'R$'},
                 color_discrete_sequence=['#4A7BC8'])
@@ -3348,8 +5555,8 @@ elif menu == "Inadimplência":
 
         with col8:
             st.markdown("**🗺️ Top Estados**")
-            inad_por_estado = df_inad_filtrado.groupby('Estado')['ValorLiquido'].sum().reset_index()
-            inad_por_estado = inad_por_estado.sort_values('ValorLiquido', ascending=False).head(10)
+            inad_por_estado = carteira_filtrada.por_uf.head(10)[['Total']].reset_index()
+            inad_por_estado.columns = ['Estado', 'ValorLiquido']
             fig_est_inad = px.bar(inad_por_estado, x='ValorLiquido', y='Estado', orientation='h',
                 labels={'Estado': '', 'ValorLiquido': 'R$'},
                 color_discrete_sequence=['#163561'])
@@ -3362,6 +5569,9 @@ elif menu == "Inadimplência":
         st.subheader("📋 Detalhamento dos Títulos")
         
         # Preparar dados para exibição
+        if 'NumeroDoc' not in df_inad_filtrado.columns:
+            possiveis_nomes = [col for col in df_inad_filtrado.columns if 'DOC' in col.upper() or 'NUMERO' in col.upper()]
+            df_inad_filtrado['NumeroDoc'] = df_inad_filtrado[possiveis_nomes[0]] if possiveis_nomes else 1
         df_detalhado = df_inad_filtrado[[
             'Vendedor', 'Cliente', 'NumeroDoc', 'DataVencimento', 
             'ValorLiquido', 'DiasAtraso', 'FaixaAtraso', 'Banco', 'Estado'
@@ -3402,7 +5612,7 @@ elif menu == "Inadimplência":
         )
         st.download_button(
             "📥 Exportar Relatório Completo",
-            to_excel(df_detalhado),
+            excel_sob_demanda(to_excel, df_detalhado),
             _nome_inad,
             "application/vnd.ms-excel",
             key="dl_inad_completo"
@@ -3529,7 +5739,7 @@ elif menu == "Clientes sem Compra":
     # Dados cadastrais: último registro de cada CPF
     _cadastro = (
         _df_nf.sort_values('DataEmissao')
-        .groupby('CPF_CNPJ')
+        .groupby('CPF_CNPJ', observed=True)
         .last()
         .reset_index()[['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']]
     )
@@ -3538,18 +5748,18 @@ elif menu == "Clientes sem Compra":
     # Assim um cliente do Mario que eventualmente teve NF de outro vendedor
     # ainda aparece na carteira do Mario.
     _vendedor_principal = (
-        _df_nf.groupby(['CPF_CNPJ', 'Vendedor'])
+        _df_nf.groupby(['CPF_CNPJ', 'Vendedor'], observed=True)
         .size()
         .reset_index(name='_cnt')
         .sort_values('_cnt', ascending=False)
-        .groupby('CPF_CNPJ')
+        .groupby('CPF_CNPJ', observed=True)
         .first()
         .reset_index()[['CPF_CNPJ', 'Vendedor']]
     )
 
     # Última compra de cada CPF no histórico completo
     _ultima_compra_hist = (
-        _df_nf.groupby('CPF_CNPJ')['DataEmissao']
+        _df_nf.groupby('CPF_CNPJ', observed=True)['DataEmissao']
         .max()
         .reset_index()
         .rename(columns={'DataEmissao': 'UltimaCompra'})
@@ -3557,7 +5767,7 @@ elif menu == "Clientes sem Compra":
 
     # Valor histórico total
     _valor_historico = (
-        _df_nf.groupby('CPF_CNPJ')['TotalProduto']
+        _df_nf.groupby('CPF_CNPJ', observed=True)['TotalProduto']
         .sum()
         .reset_index()
         .rename(columns={'TotalProduto': 'ValorHistorico'})
@@ -3661,7 +5871,7 @@ elif menu == "Clientes sem Compra":
 
     st.download_button(
         "📥 Exportar Clientes sem Compra",
-        to_excel(clientes_sem_compra[_display_cols]),
+        excel_sob_demanda(to_excel, clientes_sem_compra[_display_cols]),
         "clientes_sem_compra.xlsx",
         "application/vnd.ms-excel",
         key="dl_churn_excel"
@@ -3693,10 +5903,11 @@ elif menu == "Histórico":
         cpf_cnpj = None
         
         if busca_texto and len(busca_texto) >= 3:
+            _idx_cli = indice_clientes(df, sha_planilha_vendas)
             if busca_tipo == "Nome":
-                clientes_filtrados = df[df['RazaoSocial'].str.contains(busca_texto, case=False, na=False)][['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']].drop_duplicates()
+                clientes_filtrados = _idx_cli.buscar_nome(busca_texto)[['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']].copy()
             else:
-                clientes_filtrados = df[df['CPF_CNPJ'].str.contains(busca_texto, case=False, na=False)][['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']].drop_duplicates()
+                clientes_filtrados = _idx_cli.buscar_documento(busca_texto)[['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']].copy()
             
             if len(clientes_filtrados) > 0:
                 clientes_filtrados['Display'] = clientes_filtrados['RazaoSocial'] + " - " + clientes_filtrados['CPF_CNPJ'] + " (" + clientes_filtrados['Cidade'] + "/" + clientes_filtrados['Estado'] + ")"
@@ -3716,22 +5927,9 @@ elif menu == "Histórico":
             historico = df[df['CPF_CNPJ'] == cpf_cnpj].sort_values('DataEmissao', ascending=False).copy()
             # Gramatura: buscar na planilha produtos_agrupados pela coluna GRAMATURA/GRAMAT pelo ID_COD
             if planilhas_disponiveis.get('produtos_agrupados'):
-                _hg_plan = carregar_planilha_github(planilhas_disponiveis['produtos_agrupados']['url'])
-                if _hg_plan is not None:
-                    _hg_plan.columns = _hg_plan.columns.str.upper().str.strip()
-                    _hg_gcol = next((c for c in _hg_plan.columns if c in ('GRAMATURA','GRAMAT')), None)
-                    if _hg_gcol and 'ID_COD' in _hg_plan.columns:
-                        _hg_map = (
-                            _hg_plan[['ID_COD', _hg_gcol]]
-                            .drop_duplicates(subset='ID_COD')
-                            .assign(ID_COD=lambda d: d['ID_COD'].apply(
-                                lambda v: str(int(float(str(v)))) if str(v).replace('.','',1).isdigit() else str(v)
-                            ))
-                            .set_index('ID_COD')[_hg_gcol]
-                        )
-                        historico['Gramatura'] = historico['CodigoProduto'].apply(
-                            lambda v: str(int(float(str(v)))) if str(v).replace('.','',1).isdigit() else str(v)
-                        ).map(_hg_map).fillna('')
+                _hg_cat = indice_produtos(planilhas_disponiveis['produtos_agrupados'])
+                if _hg_cat is not None and _hg_cat.col_gramatura:
+                    historico['Gramatura'] = normalizar_codigo_serie(historico['CodigoProduto']).map(_hg_cat.gramaturas).fillna('')
             
             if len(historico) > 0:
                 cliente_info = historico.iloc[0]
@@ -3761,7 +5959,7 @@ elif menu == "Histórico":
                 with col8:
                     st.metric("Qtd Notas Devoluções", len(devolucoes_cliente['Numero_NF'].unique()))
                 
-                vendas_tempo_cliente = vendas_cliente.groupby('MesAno')['TotalProduto'].sum().reset_index()
+                vendas_tempo_cliente = vendas_cliente.groupby('MesAno', observed=True)['TotalProduto'].sum().reset_index()
                 vendas_tempo_cliente = vendas_tempo_cliente.sort_values('MesAno')
                 
                 if len(vendas_tempo_cliente) > 0:
@@ -3819,7 +6017,7 @@ elif menu == "Histórico":
                 
                 st.download_button(
                     "📥 Exportar Histórico Excel",
-                    to_excel(historico),
+                    excel_sob_demanda(to_excel, historico),
                     f"historico_{cpf_cnpj}.xlsx",
                     "application/vnd.ms-excel",
                     key="dl_hist_excel"
@@ -3965,7 +6163,7 @@ elif menu == "Histórico":
             # Botão de download
             st.download_button(
                 "📥 Exportar Histórico de Vendas",
-                to_excel(historico_vendedor),
+                excel_sob_demanda(to_excel, historico_vendedor),
                 f"historico_vendedor_{vendedor_hist_filtro if vendedor_hist_filtro != 'Todos' else 'todos'}.xlsx",
                 "application/vnd.ms-excel",
                 key="download_hist_vend"
@@ -3983,12 +6181,10 @@ elif menu == "Histórico":
             st.session_state.itens_pedido = []
         
         # Carregar dados de produtos se disponível
-        df_produtos_pedido = None
+        cat_produtos_pedido = None
         if planilhas_disponiveis.get('produtos_agrupados'):
             with st.spinner("📥 Carregando catálogo de produtos..."):
-                df_produtos_pedido = carregar_planilha_github(planilhas_disponiveis['produtos_agrupados']['url'])
-                if df_produtos_pedido is not None:
-                    df_produtos_pedido.columns = df_produtos_pedido.columns.str.upper()
+                cat_produtos_pedido = indice_produtos(planilhas_disponiveis['produtos_agrupados'])
         
         # SEÇÃO 1: DADOS DO CLIENTE
         st.markdown("### 👤 Informações do Cliente")
@@ -3997,13 +6193,13 @@ elif menu == "Histórico":
         
         with col_cli1:
             # Buscar cliente
-            clientes_lista = sorted(df['RazaoSocial'].dropna().unique().tolist())
-            cliente_selecionado = st.selectbox("Selecione o Cliente", [''] + clientes_lista, key="cliente_pedido")
+            _idx_cli = indice_clientes(df, sha_planilha_vendas)
+            cliente_selecionado = st.selectbox("Selecione o Cliente", [''] + _idx_cli.nomes, key="cliente_pedido")
         
         # Buscar dados do cliente
         dados_cliente = {}
         if cliente_selecionado:
-            df_cliente = df[df['RazaoSocial'] == cliente_selecionado].iloc[0]
+            df_cliente = _idx_cli.cliente(cliente_selecionado)
             dados_cliente = {
                 'razao_social': df_cliente.get('RazaoSocial', ''),
                 'cpf_cnpj': df_cliente.get('CPF_CNPJ', ''),
@@ -4071,8 +6267,8 @@ elif menu == "Histórico":
             tipo_busca_prod = st.radio("Buscar por:", ["Código", "Descrição"], horizontal=True, key="tipo_busca_prod")
             
             if tipo_busca_prod == "Código":
-                if df_produtos_pedido is not None:
-                    codigos = [''] + sorted(df_produtos_pedido['ID_COD'].dropna().astype(str).unique().tolist())
+                if cat_produtos_pedido is not None:
+                    codigos = [''] + cat_produtos_pedido.codigos
                     codigo_selecionado = st.selectbox("Código do Produto", codigos, key="cod_prod_pedido")
                 else:
                     codigo_selecionado = st.text_input("Código do Produto", key="cod_prod_pedido_txt")
@@ -4082,10 +6278,9 @@ elif menu == "Histórico":
         
         # Buscar informações do produto
         produto_info = {}
-        if df_produtos_pedido is not None and codigo_selecionado:
-            prod = df_produtos_pedido[df_produtos_pedido['ID_COD'].astype(str) == str(codigo_selecionado)]
-            if len(prod) > 0:
-                prod = prod.iloc[0]
+        if cat_produtos_pedido is not None and codigo_selecionado:
+            prod = cat_produtos_pedido.linha(codigo_selecionado)
+            if prod is not None:
                 # Montar descrição completa
                 descricao_completa = f"{prod.get('GRUPO', '')} {prod.get('DESCRIÇÃO', '') or prod.get('DESCRICAO', '')} {prod.get('LINHA', '') or prod.get('LINHAS', '')}".strip()
                 
@@ -4346,7 +6541,7 @@ elif menu == "Histórico":
             with _g1:
                 st.markdown("**Top 10 por Faturamento**")
                 _top_fat = (
-                    _df_tp.groupby('NomeProduto')['TotalProduto']
+                    _df_tp.groupby('NomeProduto', observed=True)['TotalProduto']
                     .sum().reset_index()
                     .sort_values('TotalProduto', ascending=False).head(10)
                 )
@@ -4360,7 +6555,7 @@ elif menu == "Histórico":
             with _g2:
                 st.markdown("**Top 10 por Quantidade**")
                 _top_qtd = (
-                    _df_tp.groupby('NomeProduto')['Quantidade']
+                    _df_tp.groupby('NomeProduto', observed=True)['Quantidade']
                     .sum().reset_index()
                     .sort_values('Quantidade', ascending=False).head(10)
                 )
@@ -4378,7 +6573,7 @@ elif menu == "Histórico":
             _df_evo    = _df_tp if _prod_sel == 'Todos' else _df_tp[_df_tp['NomeProduto'] == _prod_sel]
 
             if 'MesAno' in _df_evo.columns and len(_df_evo) > 0:
-                _evo = _df_evo.groupby('MesAno').agg(
+                _evo = _df_evo.groupby('MesAno', observed=True).agg(
                     Faturamento=('TotalProduto', 'sum'),
                     Quantidade=('Quantidade', 'sum')
                 ).reset_index().sort_values('MesAno')
@@ -4402,7 +6597,7 @@ elif menu == "Histórico":
             # ── Tabela detalhada ──────────────────────────────────────────
             st.markdown("**Detalhamento por Produto**")
             _df_tab = (
-                _df_tp.groupby(['CodigoProduto', 'NomeProduto'])
+                _df_tp.groupby(['CodigoProduto', 'NomeProduto'], observed=True)
                 .agg(QtdVendida=('Quantidade', 'sum'),
                      PrecoMedio=('PrecoUnit', 'mean'),
                      TotalFaturado=('TotalProduto', 'sum'))
@@ -4423,7 +6618,7 @@ elif menu == "Histórico":
 
             st.download_button(
                 "📥 Exportar Vendas por Produto",
-                to_excel(_df_tp),
+                excel_sob_demanda(to_excel, _df_tp),
                 "historico_por_produto.xlsx",
                 "application/vnd.ms-excel",
                 key="dl_hist_produto"
@@ -4438,21 +6633,19 @@ elif menu == "__novo_pedido__":
     if 'itens_pedido' not in st.session_state:
         st.session_state.itens_pedido = []
 
-    df_produtos_pedido = None
+    cat_produtos_pedido = None
     if planilhas_disponiveis.get('produtos_agrupados'):
         with st.spinner("📥 Carregando catálogo de produtos..."):
-            df_produtos_pedido = carregar_planilha_github(planilhas_disponiveis['produtos_agrupados']['url'])
-            if df_produtos_pedido is not None:
-                df_produtos_pedido.columns = df_produtos_pedido.columns.str.upper()
+            cat_produtos_pedido = indice_produtos(planilhas_disponiveis['produtos_agrupados'])
 
     st.markdown("### 👤 Informações do Cliente")
     col_cli1, col_cli2 = st.columns(2)
     with col_cli1:
-        clientes_lista = sorted(df['RazaoSocial'].dropna().unique().tolist())
-        cliente_selecionado = st.selectbox("Selecione o Cliente", [''] + clientes_lista, key="cliente_pedido_np")
+        _idx_cli = indice_clientes(df, sha_planilha_vendas)
+        cliente_selecionado = st.selectbox("Selecione o Cliente", [''] + _idx_cli.nomes, key="cliente_pedido_np")
     dados_cliente = {}
     if cliente_selecionado:
-        df_cliente_row = df[df['RazaoSocial'] == cliente_selecionado].iloc[0]
+        df_cliente_row = _idx_cli.cliente(cliente_selecionado)
         dados_cliente = {
             'razao_social': df_cliente_row.get('RazaoSocial', ''),
             'cpf_cnpj':     df_cliente_row.get('CPF_CNPJ', ''),
@@ -4498,21 +6691,29 @@ elif menu == "__novo_pedido__":
     with col_prod1:
         tipo_busca_prod = st.radio("Buscar por:", ["Código", "Descrição"], horizontal=True, key="tipo_busca_prod_np")
         if tipo_busca_prod == "Código":
-            if df_produtos_pedido is not None:
-                codigos_lista = [''] + sorted(df_produtos_pedido['ID_COD'].dropna().astype(str).unique().tolist())
+            if cat_produtos_pedido is not None:
+                codigos_lista = [''] + cat_produtos_pedido.codigos
                 codigo_selecionado = st.selectbox("Código do Produto", codigos_lista, key="cod_prod_pedido_np")
             else:
                 codigo_selecionado = st.text_input("Código do Produto", key="cod_prod_pedido_np_txt")
         else:
             busca_desc = st.text_input("Descrição do Produto", key="desc_prod_pedido_np")
             codigo_selecionado = None
+            if busca_desc and cat_produtos_pedido is not None:
+                _achados_np = cat_produtos_pedido.buscar(busca_desc)
+                if _achados_np:
+                    codigo_selecionado = st.selectbox(
+                        f"{len(_achados_np)} produto(s) encontrado(s)",
+                        [c for c, _ in _achados_np],
+                        format_func=lambda c: f"{c} — {dict(_achados_np).get(c, '')}",
+                        key="desc_sel_pedido_np")
+                else:
+                    st.caption("Nenhum produto encontrado.")
 
-    if df_produtos_pedido is not None and codigo_selecionado:
-        prod_row = df_produtos_pedido[df_produtos_pedido['ID_COD'].astype(str) == str(codigo_selecionado)]
-        if len(prod_row) > 0:
-            prod_row = prod_row.iloc[0]
-            _desc_parts = [str(prod_row.get(c, '') or '') for c in ['GRUPO','DESCRIÇÃO','DESCRICAO','LINHA','LINHAS'] if c in df_produtos_pedido.columns]
-            descricao_completa = ' '.join(p.strip() for p in _desc_parts if p.strip())
+    if cat_produtos_pedido is not None and codigo_selecionado:
+        prod_row = cat_produtos_pedido.linha(codigo_selecionado)
+        if prod_row is not None:
+            descricao_completa = cat_produtos_pedido.descricao(codigo_selecionado)
             produto_info = {
                 'codigo':      str(prod_row.get('ID_COD', '')),
                 'descricao':   descricao_completa or str(codigo_selecionado),
@@ -4661,35 +6862,24 @@ elif menu == "__historico_cliente__":
             termo_busca = st.text_input("Digite o CPF/CNPJ", key="busca_cnpj_hc", placeholder="Ex: 12.345.678/0001-90")
 
     if termo_busca and len(termo_busca) >= 3:
+        _idx_cli = indice_clientes(df, sha_planilha_vendas)
         if busca_tipo == "Nome":
-            clientes_encontrados = df[df['RazaoSocial'].str.contains(termo_busca, case=False, na=False)]['RazaoSocial'].unique()
+            clientes_encontrados = _idx_cli.buscar_nome(termo_busca)['RazaoSocial'].dropna().unique()
         else:
-            clientes_encontrados = df[df['CPF_CNPJ'].str.contains(termo_busca, na=False)]['RazaoSocial'].unique()
+            clientes_encontrados = _idx_cli.buscar_documento(termo_busca)['RazaoSocial'].dropna().unique()
 
         if len(clientes_encontrados) > 0:
             cliente_sel = st.selectbox("Selecione o cliente:", sorted(clientes_encontrados), key="cli_sel_hc")
             historico_cli = df[df['RazaoSocial'] == cliente_sel].copy()
             cliente_info = historico_cli.iloc[0].to_dict() if len(historico_cli) > 0 else {}
             # Gramatura: buscar na planilha produtos_agrupados
-            _hg_url = None
-            if planilhas_disponiveis.get('produtos_agrupados'):
-                _hg_url = planilhas_disponiveis['produtos_agrupados']['url']
-            else:
-                _hg_url = next((p['url'] for p in planilhas_disponiveis.get('todas', []) if 'PRODUTO' in p['nome'].upper()), None)
-            if _hg_url:
+            _hg_info = planilhas_disponiveis.get('produtos_agrupados') or next(
+                (p for p in planilhas_disponiveis.get('todas', []) if 'PRODUTO' in p['nome'].upper()), None)
+            if _hg_info:
                 try:
-                    _hg_plan = carregar_planilha_github(_hg_url)
-                    if _hg_plan is not None:
-                        _hg_plan.columns = _hg_plan.columns.str.upper().str.strip()
-                        _hg_kcol = next((c for c in _hg_plan.columns if any(x in c for x in ['ID_COD','CODIGO','COD'])), None)
-                        _hg_gcol = next((c for c in _hg_plan.columns if 'GRAMATUR' in c), None)
-                        if _hg_kcol and _hg_gcol:
-                            def _hg_norm2(v):
-                                try: return str(int(float(str(v).strip())))
-                                except Exception: return str(v).strip()
-                            _hg_plan['_K'] = _hg_plan[_hg_kcol].apply(_hg_norm2)
-                            _hg_map = _hg_plan.drop_duplicates(subset='_K').set_index('_K')[_hg_gcol]
-                            historico_cli['Gramatura'] = historico_cli['CodigoProduto'].apply(_hg_norm2).map(_hg_map).fillna('')
+                    _hg_cat = indice_produtos(_hg_info)
+                    if _hg_cat is not None and _hg_cat.col_codigo and _hg_cat.col_gramatura:
+                        historico_cli['Gramatura'] = normalizar_codigo_serie(historico_cli['CodigoProduto']).map(_hg_cat.gramaturas).fillna('')
                 except Exception:
                     pass
 
@@ -4751,115 +6941,10 @@ elif menu == "Pedidos Pendentes":
     # Carregar planilha
     with st.spinner("📥 Carregando pedidos pendentes..."):
         try:
-            import zipfile
-            import xml.etree.ElementTree as ET
-            from io import BytesIO
-            
-            # Baixar arquivo
-            response = requests.get(planilhas_disponiveis['pedidos_pendentes']['url'])
-            excel_file = BytesIO(response.content)
-            
-            # Extrair shared strings
-            with zipfile.ZipFile(excel_file) as z:
-                with z.open('xl/sharedStrings.xml') as f:
-                    strings_tree = ET.parse(f)
-                    ns_str = {'ss': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
-                    shared_strings = [si.text if si.text else '' for si in strings_tree.findall('.//ss:t', ns_str)]
-                
-                # Extrair sheet
-                with z.open('xl/worksheets/sheet1.xml') as f:
-                    sheet_tree = ET.parse(f)
-                    ns = {'ss': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
-                    
-                    # Parsear dados
-                    data = []
-                    current_client = None
-                    current_pedido = None
-                    
-                    for row in sheet_tree.findall('.//ss:row', ns):
-                        row_data = {}
-                        for cell in row.findall('.//ss:c', ns):
-                            ref = cell.get('r', '')
-                            col = ''.join([c for c in ref if c.isalpha()])
-                            v_elem = cell.find('.//ss:v', ns)
-                            if v_elem is not None and v_elem.text:
-                                val_type = cell.get('t', 'n')
-                                if val_type == 's':
-                                    idx = int(v_elem.text)
-                                    value = shared_strings[idx] if idx < len(shared_strings) else v_elem.text
-                                else:
-                                    value = v_elem.text
-                                row_data[col] = value
-                        
-                        if not row_data:
-                            continue
-                        
-                        # Detectar tipo de linha
-                        col_a = row_data.get('A', '')
-                        col_b = row_data.get('B', '')
-                        
-                        # Linha de cliente (apenas coluna A preenchida com nome)
-                        if col_a and not col_b and 'N° do pedido' not in col_a and 'Valor Total' not in col_a and col_a != 'Subgrupo:':
-                            current_client = col_a
-                        
-                        # Linha de pedido (tem "N° do pedido:")
-                        elif 'N° do pedido' in col_a:
-                            current_pedido = col_b
-                            
-                            # Extrair dados do produto
-                            descricao = row_data.get('C', '')
-                            if descricao and ' - ' in descricao:
-                                # Separar observação da descrição (tudo após a palavra "observa")
-                                import re as _re
-                                _obs_match = _re.search(r'observa[çc][aã]o[:\s]*', descricao, _re.IGNORECASE)
-                                if _obs_match:
-                                    observacao = descricao[_obs_match.end():].strip()
-                                    descricao = descricao[:_obs_match.start()].strip()
-                                else:
-                                    observacao = ''
-
-                                # Extrair código do produto (ex: "476 - ATADURA...")
-                                codigo_produto = descricao.split(' - ')[0].strip()
-                                
-                                try:
-                                    qtd_contratada = float(row_data.get('D', 0))
-                                    valor_unit = float(row_data.get('E', 0))  # Corrigido: E é o valor unitário
-                                    qtd_entregue = float(row_data.get('H', 0))  # Corrigido: H é qtd entregue
-                                    qtd_pendente = qtd_contratada - qtd_entregue
-                                    valor_pendente = qtd_pendente * valor_unit
-                                    
-                                    # Converter data de emissão (coluna G)
-                                    dt_emissao_val = row_data.get('G', '')
-                                    if dt_emissao_val:
-                                        try:
-                                            # Data vem como número (days since 1900)
-                                            dt_emissao = pd.Timestamp('1899-12-30') + pd.Timedelta(days=float(dt_emissao_val))
-                                        except Exception:
-                                            dt_emissao = None
-                                    else:
-                                        dt_emissao = None
-                                    
-                                    data.append({
-                                        'Cliente': current_client,
-                                        'NumeroPedido': current_pedido,
-                                        'CodigoProduto': codigo_produto,
-                                        'Descricao': descricao,
-                                        'Observacoes': observacao,
-                                        'QtdContratada': qtd_contratada,
-                                        'QtdEntregue': qtd_entregue,
-                                        'QtdPendente': qtd_pendente,
-                                        'ValorUnit': valor_unit,
-                                        'ValorPendente': valor_pendente,
-                                        'DataEmissao': dt_emissao,
-                                        'Vendedor': row_data.get('J', ''),  # Corrigido: J é o vendedor
-                                        'PercEntregue': float(row_data.get('I', 0))  # Corrigido: I é % entregue
-                                    })
-                                except Exception:
-                                    continue
-            
-            df_pendentes = pd.DataFrame(data)
-            if len(df_pendentes) > 0:
-                df_pendentes = df_pendentes.drop_duplicates(subset=['NumeroPedido', 'CodigoProduto'])
+            df_pendentes = carregar_pedidos_pendentes(
+                planilhas_disponiveis['pedidos_pendentes']['url'],
+                planilhas_disponiveis['pedidos_pendentes'].get('sha')
+            )
             
             if len(df_pendentes) == 0:
                 st.warning("⚠️ Nenhum pedido pendente encontrado na planilha")
@@ -5017,7 +7102,7 @@ elif menu == "Pedidos Pendentes":
     )
     st.download_button(
         "📥 Exportar Pedidos Pendentes (Separado por Tipo)",
-        to_excel_pedidos_pendentes(df_pend_filtrado),
+        excel_sob_demanda(to_excel_pedidos_pendentes, df_pend_filtrado),
         _nome_arquivo_pend,
         "application/vnd.ms-excel",
         key="download_pendentes"
@@ -5067,24 +7152,11 @@ elif menu == "Pedidos Pendentes":
     _df_prod_prev = None
     if planilhas_disponiveis.get('produtos_agrupados'):
         with st.spinner("Carregando dados de produtos para previsão..."):
-            _df_prod_prev = carregar_planilha_github(
-                planilhas_disponiveis['produtos_agrupados']['url']
-            )
-        if _df_prod_prev is not None:
-            _df_prod_prev.columns = _df_prod_prev.columns.str.upper().str.strip()
+            _df_prod_prev = catalogo_produtos(planilhas_disponiveis['produtos_agrupados'])
 
-    if _df_prod_prev is None:
+    if _df_prod_prev is None or 'ID_COD_N' not in _df_prod_prev.columns:
         st.warning("⚠️ Planilha Produtos_Agrupados não disponível. Previsão desabilitada.")
     else:
-        # Normalizar ID_COD
-        def _norm_cod(v):
-            try:
-                return str(int(float(str(v).strip())))
-            except Exception:
-                return str(v).strip()
-
-        _df_prod_prev['ID_COD_N'] = _df_prod_prev['ID_COD'].apply(_norm_cod)
-
         # Colunas necessárias
         _cx_col    = next((c for c in _df_prod_prev.columns if 'CX_EMB' in c), None)
         _preco_col = next((c for c in _df_prod_prev.columns if 'PRECO' in c or 'PREÇO' in c), None)
@@ -5095,7 +7167,7 @@ elif menu == "Pedidos Pendentes":
         else:
             # Preparar base de pendentes com ID_COD normalizado
             _df_base = df_pend_filtrado.copy()
-            _df_base['COD_N'] = _df_base['CodigoProduto'].apply(_norm_cod)
+            _df_base['COD_N'] = normalizar_codigo_serie(_df_base['CodigoProduto'])
 
             # Merge com produtos
             _cols_merge = ['ID_COD_N', _cx_col, _preco_col] + ([_desc_col] if _desc_col else [])
@@ -5310,30 +7382,10 @@ elif menu == "Pedidos Pendentes":
                         d = d[len(cod_str):].strip(' -|')
                     return d
 
-                # Calcular CX_EMB lookup
-                cx_lookup = {}
-                if df_prod_prev is not None and cx_col:
-                    for _, row in df_prod_prev.iterrows():
-                        try:
-                            k = str(int(float(str(row['ID_COD_N'])))).strip()
-                            v = float(row[cx_col])
-                            if v > 0:
-                                cx_lookup[k] = v
-                        except Exception:
-                            pass
-
-                # Gramatura lookup (mesma lógica do módulo consulta tabela)
-                gram_col_g = next((c for c in df_prod_prev.columns if 'GRAMATUR' in c), None) if df_prod_prev is not None else None
-                gram_lookup = {}
-                if df_prod_prev is not None and gram_col_g:
-                    for _, row in df_prod_prev.iterrows():
-                        try:
-                            k = str(int(float(str(row['ID_COD_N'])))).strip()
-                            gv = str(row.get(gram_col_g, '')).strip()
-                            if gv and gv.lower() not in ('nan', '0', '0.0', ''):
-                                gram_lookup[k] = gv
-                        except Exception:
-                            pass
+                # CX_EMB e gramatura por código — mapas prontos do índice do catálogo
+                _cat_prev = indice_produtos(planilhas_disponiveis.get('produtos_agrupados')) if df_prod_prev is not None else None
+                cx_lookup = _cat_prev.cx_embs if _cat_prev is not None and cx_col else {}
+                gram_lookup = _cat_prev.gramaturas if _cat_prev is not None else {}
 
                 COLUNAS_BASE = [
                     'N° Pedido', 'Cliente', 'Código', 'Gramatura', 'Volumes (cx)', 'Descrição',
@@ -5703,7 +7755,7 @@ elif menu == "Pedidos Pendentes":
             with _dc2:
                 st.download_button(
                     "📥 Faturamento por Data",
-                    to_excel(_fat_data),
+                    excel_sob_demanda(to_excel, _fat_data),
                     "FATURAMENTO_POR_DATA.xlsx",
                     "application/vnd.ms-excel",
                     key="dl_fat_data"
@@ -5820,20 +7872,8 @@ elif menu == "Pedidos Pendentes":
                     }
 
             # ── PASSO 2: gramatura via tabela de produtos do GitHub ──────────
-            _gram_map = {}
-            if planilhas_disponiveis.get('produtos_agrupados'):
-                _df_gram = carregar_planilha_github(planilhas_disponiveis['produtos_agrupados']['url'])
-                if _df_gram is not None:
-                    _df_gram.columns = _df_gram.columns.str.upper().str.strip()
-                    _gc = next((c for c in _df_gram.columns if any(x in c for x in ['ID_COD','CODIGO','COD'])), None)
-                    _gg = next((c for c in _df_gram.columns if 'GRAMATUR' in c), None)
-                    if _gc and _gg:
-                        for _, _gr in _df_gram.iterrows():
-                            try:    _gk = str(int(float(str(_gr[_gc]).strip())))
-                            except Exception: _gk = str(_gr[_gc]).strip()
-                            _gv = str(_gr[_gg]).strip()
-                            if _gv and _gv.lower() not in ('nan','0','0.0',''):
-                                _gram_map[_gk] = _gv
+            _cat_gram = indice_produtos(planilhas_disponiveis.get('produtos_agrupados'))
+            _gram_map = _cat_gram.gramaturas if _cat_gram is not None else {}
 
             # ── PASSO 3: copiar arquivo ATUAL aba a aba injetando os valores ──
             # ── PASSO 3: reutilizar _gerar_relatorio_previsao com dados conciliados ──
@@ -6049,32 +8089,43 @@ elif menu == "Performance de Vendedores":
     # Base apenas vendas e devoluções
     _pv_vendas = _pv_df[_pv_df['TipoMov'] == 'NF Venda'].copy()
     _pv_devol  = _pv_df[_pv_df['TipoMov'] == 'NF Dev.Venda'].copy()
-    _pv_notas  = obter_notas_unicas(_pv_df)
-    _pv_notas_v = _pv_notas[_pv_notas['TipoMov'] == 'NF Venda']
-    _pv_notas_d = _pv_notas[_pv_notas['TipoMov'] == 'NF Dev.Venda']
+
+    # Mesmo recorte sobre o cubo mensal: KPIs e gráficos de faturamento/clientes.
+    # Região e vendedor entram no recorte (antes das notas únicas), como no _pv_df
+    if _pv_periodo == "Filtro Global":
+        _pv_cubo = cubo.fatiar(data_inicial, data_final, (vendedor_filtro, _pv_vendedor),
+                               (estado_filtro, _pv_regiao), mes_filtro, ano_filtro)
+    elif _pv_periodo == "Mês Atual":
+        _pv_cubo = cubo.fatiar(vendedor=_pv_vendedor, estado=_pv_regiao, mes=_pv_now.month, ano=_pv_now.year)
+    elif _pv_periodo == "Últimos 3 Meses":
+        _pv_cubo = cubo.fatiar(ini=(_pv_now - pd.DateOffset(months=3)).ceil('D'),
+                               vendedor=_pv_vendedor, estado=_pv_regiao)
+    elif _pv_periodo == "Últimos 6 Meses":
+        _pv_cubo = cubo.fatiar(ini=(_pv_now - pd.DateOffset(months=6)).ceil('D'),
+                               vendedor=_pv_vendedor, estado=_pv_regiao)
+    elif _pv_periodo == "Ano Atual":
+        _pv_cubo = cubo.fatiar(vendedor=_pv_vendedor, estado=_pv_regiao, ano=_pv_now.year)
+    else:
+        _pv_cubo = cubo.fatiar(ini=_pv_data_ini, fim=_pv_data_fim, vendedor=_pv_vendedor, estado=_pv_regiao)
+    _pv_cubo_v = _pv_cubo[_pv_cubo['TipoMov'] == 'NF Venda']
+    _pv_notas_v = _pv_cubo_v[_pv_cubo_v['Notas'] > 0]
 
     # ── KPIs Consolidados ─────────────────────────────────────────────────────
-    _pv_fat_bruto   = _pv_notas_v['TotalProduto'].sum()
-    _pv_fat_devol   = _pv_notas_d['TotalProduto'].sum()
+    _pv_fat_bruto   = _pv_cubo_v['TotalProduto'].sum()
+    _pv_fat_devol   = _pv_cubo.loc[_pv_cubo['TipoMov'] == 'NF Dev.Venda', 'TotalProduto'].sum()
     _pv_fat_liq     = _pv_fat_bruto - _pv_fat_devol
-    _pv_clientes    = _pv_vendas['CPF_CNPJ'].nunique()
-    _pv_qtd_notas   = len(_pv_notas_v)
+    _pv_clientes    = _pv_cubo_v['CPF_CNPJ'].nunique()
+    _pv_qtd_notas   = int(_pv_cubo_v['Notas'].sum())
     _pv_ticket      = _pv_fat_bruto / _pv_clientes if _pv_clientes > 0 else 0
     _pv_vol_total   = _pv_vendas['Quantidade'].sum() if 'Quantidade' in _pv_vendas.columns else 0
 
     # Prazo médio
     def _pv_prazo_medio(df_v):
         try:
-            if 'PrazoHistorico' not in df_v.columns:
+            if 'PrazoDias' not in df_v.columns:
                 return 0
-            prazos = []
-            for val in df_v['PrazoHistorico'].dropna():
-                for p in str(val).split('/'):
-                    try:
-                        prazos.append(int(p))
-                    except Exception:
-                        pass
-            return sum(prazos) / len(prazos) if prazos else 0
+            prazos = df_v['PrazoDias'].explode().dropna()
+            return float(prazos.astype(float).mean()) if not prazos.empty else 0
         except Exception:
             return 0
 
@@ -6127,17 +8178,16 @@ elif menu == "Performance de Vendedores":
     _pv_perc_inad = 0.0
     if planilhas_disponiveis.get('inadimplencia'):
         try:
-            _pv_raw_inad = carregar_planilha_github(planilhas_disponiveis['inadimplencia']['url'])
+            _pv_raw_inad = carregar_planilha_github(planilhas_disponiveis['inadimplencia']['url'], planilhas_disponiveis['inadimplencia'].get('sha'))
             if _pv_raw_inad is not None:
-                _pv_df_inad = processar_inadimplencia(_pv_raw_inad)
-                if _pv_vendedor != 'Todos' and 'Vendedor' in _pv_df_inad.columns:
-                    _pv_inad_vend_df = _pv_df_inad[_pv_df_inad['Vendedor'] == _pv_vendedor]
-                else:
-                    _pv_inad_vend_df = _pv_df_inad.copy()
-                if _pv_regiao != 'Todas' and 'Estado' in _pv_df_inad.columns:
-                    _pv_inad_vend_df = _pv_inad_vend_df[_pv_inad_vend_df['Estado'] == _pv_regiao]
-                _pv_inad_vendedor = _pv_inad_vend_df['ValorLiquido'].sum() if 'ValorLiquido' in _pv_inad_vend_df.columns else 0
-                _pv_inad_total    = _pv_df_inad['ValorLiquido'].sum() if 'ValorLiquido' in _pv_df_inad.columns else 0
+                _pv_carteira_inad = processar_inadimplencia(
+                    _pv_raw_inad, versao=planilhas_disponiveis['inadimplencia'].get('sha'),
+                    data_base=datetime.now().date())
+                _pv_df_inad = _pv_carteira_inad.titulos
+                _pv_inad_vendedor = _pv_carteira_inad.total(
+                    vendedor=_pv_vendedor if _pv_vendedor != 'Todos' else None,
+                    estado=_pv_regiao if _pv_regiao != 'Todas' else None)
+                _pv_inad_total    = _pv_carteira_inad.total()
                 _pv_perc_inad     = (_pv_inad_vendedor / _pv_fat_bruto * 100) if _pv_fat_bruto > 0 else 0
         except Exception:
             pass
@@ -6152,7 +8202,7 @@ elif menu == "Performance de Vendedores":
     _pv_ctr_filtrado = None
     if planilhas_disponiveis.get('contrato'):
         try:
-            _pv_raw_contrato = carregar_planilha_github(planilhas_disponiveis['contrato']['url'])
+            _pv_raw_contrato = carregar_planilha_github(planilhas_disponiveis['contrato']['url'], planilhas_disponiveis['contrato'].get('sha'))
             if _pv_raw_contrato is not None:
                 _pv_df_contrato = _pv_raw_contrato.copy()
                 _pv_df_contrato.columns = [str(c).strip() for c in _pv_df_contrato.columns]
@@ -6262,9 +8312,9 @@ elif menu == "Performance de Vendedores":
     with _pv_tab1:
         st.markdown("#### Comparativo de Desempenho por Vendedor")
 
-        _pv_comp = _pv_notas_v.groupby('Vendedor').agg(
+        _pv_comp = _pv_notas_v.groupby('Vendedor', observed=True).agg(
             FaturamentoBruto=('TotalProduto', 'sum'),
-            QtdNotas=('Numero_NF', 'count'),
+            QtdNotas=('Notas', 'sum'),
             ClientesAtendidos=('CPF_CNPJ', 'nunique'),
         ).reset_index()
 
@@ -6273,7 +8323,7 @@ elif menu == "Performance de Vendedores":
 
         # Volume por vendedor
         if 'Quantidade' in _pv_vendas.columns:
-            _pv_vol_vend = _pv_vendas.groupby('Vendedor')['Quantidade'].sum().reset_index()
+            _pv_vol_vend = _pv_vendas.groupby('Vendedor', observed=True)['Quantidade'].sum().reset_index()
             _pv_vol_vend.columns = ['Vendedor', 'VolumeTotal']
             _pv_comp = _pv_comp.merge(_pv_vol_vend, on='Vendedor', how='left')
         else:
@@ -6284,24 +8334,17 @@ elif menu == "Performance de Vendedores":
             _mapa_com = {'4%': 4.0, '3%': 3.0, '2,5%': 2.5, '2%': 2.0}
             _pv_vendas_c = _pv_vendas.copy()
             _pv_vendas_c['ComissaoNum'] = _pv_vendas_c['Comissao'].map(_mapa_com)
-            _pv_com_vend = _pv_vendas_c.groupby('Vendedor')['ComissaoNum'].mean().reset_index()
+            _pv_com_vend = _pv_vendas_c.groupby('Vendedor', observed=True)['ComissaoNum'].mean().reset_index()
             _pv_com_vend.columns = ['Vendedor', 'ComissaoMedia']
             _pv_comp = _pv_comp.merge(_pv_com_vend, on='Vendedor', how='left')
         else:
             _pv_comp['ComissaoMedia'] = None
 
         # Prazo médio por vendedor
-        if 'PrazoHistorico' in _pv_vendas.columns:
-            def _prazo_med_vend(series):
-                prazos = []
-                for val in series.dropna():
-                    for p in str(val).split('/'):
-                        try:
-                            prazos.append(int(p))
-                        except Exception:
-                            pass
-                return sum(prazos) / len(prazos) if prazos else 0
-            _pv_prazo_vend = _pv_vendas.groupby('Vendedor')['PrazoHistorico'].apply(_prazo_med_vend).reset_index()
+        if 'PrazoDias' in _pv_vendas.columns:
+            _pv_prazos_exp = _pv_vendas[['Vendedor', 'PrazoDias']].explode('PrazoDias')
+            _pv_prazos_exp['PrazoDias'] = pd.to_numeric(_pv_prazos_exp['PrazoDias'], errors='coerce')
+            _pv_prazo_vend = _pv_prazos_exp.groupby('Vendedor', observed=True)['PrazoDias'].mean().fillna(0).reset_index()
             _pv_prazo_vend.columns = ['Vendedor', 'PrazoMedio']
             _pv_comp = _pv_comp.merge(_pv_prazo_vend, on='Vendedor', how='left')
         else:
@@ -6567,7 +8610,7 @@ elif menu == "Performance de Vendedores":
                 _mm_notas_v = _mm_notas[_mm_notas['TipoMov'] == 'NF Venda'].copy()
 
                 # Total empresa por mês (sem filtro de vendedor)
-                _mm_total_empresa = _mm_notas_v.groupby('MesAno')['TotalProduto'].sum().to_dict()
+                _mm_total_empresa = _mm_notas_v.groupby('MesAno', observed=True)['TotalProduto'].sum().to_dict()
 
                 # Vendedores a exibir
                 if _pv_vendedor != 'Todos':
@@ -6621,7 +8664,7 @@ elif menu == "Performance de Vendedores":
                 _mm_row = 4
                 for vend in _mm_vendedores:
                     _vend_df = _mm_notas_v[_mm_notas_v['Vendedor'] == vend]
-                    _vend_por_mes = _vend_df.groupby('MesAno')['TotalProduto'].sum().to_dict()
+                    _vend_por_mes = _vend_df.groupby('MesAno', observed=True)['TotalProduto'].sum().to_dict()
                     _regiao_vend  = _vend_df['Estado'].mode()[0] if len(_vend_df) > 0 and 'Estado' in _vend_df.columns else _pv_regiao
 
                     ws2.write(_mm_row, 0, vend, fmt_text)
@@ -6789,14 +8832,14 @@ elif menu == "Performance de Vendedores":
                     _rp_row += 1
 
                     # ── Agregar por produto deste vendedor ────────────────
-                    _vp = _vend_df.groupby(['NomeProduto', 'CodigoProduto', 'Grupo']).agg(
+                    _vp = _vend_df.groupby(['NomeProduto', 'CodigoProduto', 'Grupo'], observed=True).agg(
                         Quantidade=('Quantidade', 'sum'),
                         Faturamento=('ValorItem', 'sum'),
                         Clientes=('CPF_CNPJ', 'nunique')
                     ).reset_index().sort_values('Faturamento', ascending=False)
 
                     _vp['Perc_Total'] = _vp['Faturamento'] / _vend_total if _vend_total > 0 else 0
-                    _vp_grupo_total = _vend_df.groupby('Grupo')['ValorItem'].sum().to_dict()
+                    _vp_grupo_total = _vend_df.groupby('Grupo', observed=True)['ValorItem'].sum().to_dict()
                     _vp['Perc_Grupo'] = _vp['Grupo'].map(
                         lambda g: (_vp_grupo_total.get(g, 0) / _vend_total) if _vend_total > 0 else 0
                     )
@@ -6857,7 +8900,7 @@ elif menu == "Performance de Vendedores":
                         ws3.write(_rp_row, c_idx, col, fmt_mes_header)
                     _rp_row += 1
 
-                    _vp_grupo_agg = _vp.groupby('Grupo').agg(
+                    _vp_grupo_agg = _vp.groupby('Grupo', observed=True).agg(
                         Faturamento=('Faturamento', 'sum'),
                         QtdProdutos=('NomeProduto', 'count')
                     ).reset_index()
@@ -6923,21 +8966,21 @@ elif menu == "Performance de Vendedores":
                 # Cadastro: último registro de cada CPF
                 _cs_cadastro = (
                     _cs_nf.sort_values('DataEmissao')
-                    .groupby('CPF_CNPJ').last().reset_index()
+                    .groupby('CPF_CNPJ', observed=True).last().reset_index()
                     [['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']]
                 )
 
                 # Vendedor principal
                 _cs_vend_principal = (
-                    _cs_nf.groupby(['CPF_CNPJ', 'Vendedor']).size()
+                    _cs_nf.groupby(['CPF_CNPJ', 'Vendedor'], observed=True).size()
                     .reset_index(name='_cnt').sort_values('_cnt', ascending=False)
-                    .groupby('CPF_CNPJ').first().reset_index()[['CPF_CNPJ', 'Vendedor']]
+                    .groupby('CPF_CNPJ', observed=True).first().reset_index()[['CPF_CNPJ', 'Vendedor']]
                 )
 
                 # Última compra e valor histórico
-                _cs_ultima = (_cs_nf.groupby('CPF_CNPJ')['DataEmissao'].max()
+                _cs_ultima = (_cs_nf.groupby('CPF_CNPJ', observed=True)['DataEmissao'].max()
                               .reset_index().rename(columns={'DataEmissao': 'UltimaCompra'}))
-                _cs_valor  = (_cs_nf.groupby('CPF_CNPJ')['TotalProduto'].sum()
+                _cs_valor  = (_cs_nf.groupby('CPF_CNPJ', observed=True)['TotalProduto'].sum()
                               .reset_index().rename(columns={'TotalProduto': 'ValorHistorico'}))
 
                 _cs_todos = (_cs_cadastro
@@ -7105,7 +9148,10 @@ elif menu == "Performance de Vendedores":
             output.seek(0)
             return output.getvalue()
 
-        _excel_bytes = _gerar_excel_performance(
+        _excel_bytes = excel_sob_demanda(
+            _gerar_excel_performance,
+            chave=(sha_planilha_vendas, _pv_vendedor, _pv_regiao, _pv_periodo,
+                   _pv_vendas, _pv_ctr_filtrado),
             _vendas_periodo=_pv_vendas,
             _comp_data=_pv_comp,
             _vendedor_sel=_pv_vendedor,
@@ -7128,7 +9174,7 @@ elif menu == "Performance de Vendedores":
     with _pv_tab2:
         st.markdown("#### Evolução de Vendas ao Longo do Tempo")
 
-        _pv_evol = _pv_notas_v.groupby(['MesAno', 'Vendedor'])['TotalProduto'].sum().reset_index()
+        _pv_evol = _pv_notas_v.groupby(['MesAno', 'Vendedor'], observed=True)['TotalProduto'].sum().reset_index()
         _pv_evol = _pv_evol.sort_values('MesAno')
 
         if _pv_vendedor != 'Todos':
@@ -7148,7 +9194,7 @@ elif menu == "Performance de Vendedores":
                 st.info("Nenhuma venda encontrada para este vendedor no período.")
         else:
             # Multi-linha: top 8 vendedores
-            _top_vend = _pv_notas_v.groupby('Vendedor')['TotalProduto'].sum().nlargest(8).index.tolist()
+            _top_vend = _pv_notas_v.groupby('Vendedor', observed=True)['TotalProduto'].sum().nlargest(8).index.tolist()
             _pv_evol_top = _pv_evol[_pv_evol['Vendedor'].isin(_top_vend)]
             _fig_evol = px.line(
                 _pv_evol_top, x='MesAno', y='TotalProduto',
@@ -7164,7 +9210,7 @@ elif menu == "Performance de Vendedores":
 
         # Evolução do ticket médio
         st.markdown("#### Evolução do Ticket Médio")
-        _pv_tick_evol = _pv_notas_v.groupby(['MesAno', 'Vendedor']).agg(
+        _pv_tick_evol = _pv_notas_v.groupby(['MesAno', 'Vendedor'], observed=True).agg(
             Fat=('TotalProduto', 'sum'),
             Cli=('CPF_CNPJ', 'nunique')
         ).reset_index()
@@ -7195,7 +9241,7 @@ elif menu == "Performance de Vendedores":
     with _pv_tab3:
         st.markdown("#### Análise de Capilaridade — Clientes Atendidos por Vendedor")
 
-        _pv_cap = _pv_vendas.groupby(['Vendedor', 'Estado'])['CPF_CNPJ'].nunique().reset_index()
+        _pv_cap = _pv_cubo_v.groupby(['Vendedor', 'Estado'], observed=True)['CPF_CNPJ'].nunique().reset_index()
         _pv_cap.columns = ['Vendedor', 'Estado', 'Clientes']
 
         if _pv_vendedor != 'Todos':
@@ -7213,7 +9259,7 @@ elif menu == "Performance de Vendedores":
 
             # Mapa de calor vendedor × estado
             st.markdown("#### Heatmap de Faturamento por Estado")
-            _pv_heat_v = _pv_notas_v[_pv_notas_v['Vendedor'] == _pv_vendedor].groupby('Estado')['TotalProduto'].sum().reset_index()
+            _pv_heat_v = _pv_notas_v[_pv_notas_v['Vendedor'] == _pv_vendedor].groupby('Estado', observed=True)['TotalProduto'].sum().reset_index()
             _fig_heat = px.bar(
                 _pv_heat_v.sort_values('TotalProduto', ascending=True).tail(15),
                 x='TotalProduto', y='Estado', orientation='h',
@@ -7227,7 +9273,7 @@ elif menu == "Performance de Vendedores":
 
         else:
             # Heatmap vendedor × estado
-            _pv_heat = _pv_vendas.groupby(['Vendedor', 'Estado'])['CPF_CNPJ'].nunique().reset_index()
+            _pv_heat = _pv_cubo_v.groupby(['Vendedor', 'Estado'], observed=True)['CPF_CNPJ'].nunique().reset_index()
             _pv_heat_pivot = _pv_heat.pivot(index='Vendedor', columns='Estado', values='CPF_CNPJ').fillna(0)
 
             _fig_heat = go.Figure(data=go.Heatmap(
@@ -7248,10 +9294,10 @@ elif menu == "Performance de Vendedores":
             st.plotly_chart(_fig_heat, use_container_width=True)
 
             # Bubble chart: faturamento vs clientes
-            _pv_bubble = _pv_notas_v.groupby('Vendedor').agg(
+            _pv_bubble = _pv_notas_v.groupby('Vendedor', observed=True).agg(
                 Fat=('TotalProduto', 'sum'),
                 Cli=('CPF_CNPJ', 'nunique'),
-                Notas=('Numero_NF', 'count')
+                Notas=('Notas', 'sum')
             ).reset_index()
             _fig_bub = px.scatter(
                 _pv_bubble,
@@ -7269,7 +9315,7 @@ elif menu == "Performance de Vendedores":
     with _pv_tab4:
         st.markdown("#### Concentração de Vendas por Produto")
 
-        _pv_mix = _pv_vendas.groupby('NomeProduto').agg(
+        _pv_mix = _pv_vendas.groupby('NomeProduto', observed=True).agg(
             Total=('TotalProduto', 'sum'),
             Volume=('Quantidade', 'sum') if 'Quantidade' in _pv_vendas.columns else ('TotalProduto', 'count'),
             Clientes=('CPF_CNPJ', 'nunique')
@@ -7343,7 +9389,7 @@ elif menu == "Performance de Vendedores":
 
         st.download_button(
             "📥 Exportar Mix de Produtos (Excel)",
-            to_excel(_pv_mix),
+            excel_sob_demanda(to_excel, _pv_mix),
             "mix_produtos.xlsx",
             "application/vnd.ms-excel",
             key="pv_dl_mix"
@@ -7355,192 +9401,178 @@ elif menu == "Performance de Vendedores":
     st.markdown('<p style="color:#6C757D;font-size:0.84rem;">Gera um relatório executivo em PDF com base nos filtros aplicados.</p>', unsafe_allow_html=True)
 
     if st.button("🖨️ Gerar Relatório PDF", type="primary", key="pv_gerar_pdf"):
-        try:
-            from fpdf import FPDF
-            import math
-
-            class PerformancePDF(FPDF):
-                def header(self):
-                    # Logo
-                    try:
-                        import tempfile, os
-                        _resp_logo = requests.get("https://i.imgur.com/gt3rgyL.png", timeout=8)
-                        if _resp_logo.status_code == 200:
-                            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as _ftmp:
-                                _ftmp.write(_resp_logo.content)
-                                _tmp_path = _ftmp.name
-                            self.image(_tmp_path, x=10, y=8, w=28)
-                            os.unlink(_tmp_path)
-                    except Exception:
-                        pass
-                    self.set_xy(42, 10)
-                    self.set_font('Helvetica', 'B', 13)
-                    self.set_text_color(31, 71, 136)
-                    self.cell(0, 6, 'MEDTEXTIL PRODUTOS TEXTIL HOSPITALARES', ln=True)
-                    self.set_xy(42, 17)
-                    self.set_font('Helvetica', '', 8)
-                    self.set_text_color(108, 117, 125)
-                    self.cell(0, 5, 'CNPJ: 40.357.820/0001-50  |  Dashboard Comercial BI 2.0', ln=True)
-                    self.ln(4)
-                    self.set_draw_color(31, 71, 136)
-                    self.set_line_width(0.8)
-                    self.line(10, self.get_y(), 200, self.get_y())
-                    self.ln(3)
-
-                def footer(self):
-                    self.set_y(-14)
-                    self.set_font('Helvetica', 'I', 7)
-                    self.set_text_color(173, 181, 189)
-                    self.cell(0, 5, f'Performance de Vendedores  ·  Gerado em {_pv_now.strftime("%d/%m/%Y %H:%M")}  ·  Pág. {self.page_no()}', align='C')
-
-            pdf = PerformancePDF()
-            pdf.set_auto_page_break(auto=True, margin=18)
-            pdf.add_page()
-            pdf.set_margins(12, 12, 12)
-
-            # ── Título do relatório ───────────────────────────────────────
-            pdf.set_font('Helvetica', 'B', 16)
-            pdf.set_text_color(31, 71, 136)
-            pdf.cell(0, 10, 'RELATÓRIO DE PERFORMANCE DE VENDEDORES', ln=True, align='C')
-            pdf.set_font('Helvetica', '', 9)
-            pdf.set_text_color(108, 117, 125)
-            _pv_label_periodo = f"Período: {_pv_periodo}"
-            if _pv_data_ini and _pv_periodo == "Personalizado":
-                _pv_label_periodo = f"Período: {_pv_data_ini.strftime('%d/%m/%Y') if hasattr(_pv_data_ini,'strftime') else str(_pv_data_ini)} a {_pv_data_fim.strftime('%d/%m/%Y') if _pv_data_fim and hasattr(_pv_data_fim,'strftime') else '—'}"
-            pdf.cell(0, 6, f"Vendedor: {_pv_vendedor}  |  Região: {_pv_regiao}  |  {_pv_label_periodo}", ln=True, align='C')
-            pdf.ln(5)
-
-            # ── Resumo Executivo ──────────────────────────────────────────
-            pdf.set_fill_color(31, 71, 136)
-            pdf.set_text_color(255, 255, 255)
-            pdf.set_font('Helvetica', 'B', 9)
-            pdf.cell(0, 7, '  RESUMO EXECUTIVO', fill=True, border=0, ln=True)
-            pdf.set_text_color(50, 50, 50)
-            pdf.set_font('Helvetica', '', 8)
+        def _gerar_pdf_performance(progresso):
+            try:
+                from fpdf import FPDF
 
-            _pv_kpis_pdf = [
-                ('Faturamento Líquido',       f"R$ {formatar_numero_br(_pv_fat_liq, 2)}"),
-                ('Faturamento Bruto',          f"R$ {formatar_numero_br(_pv_fat_bruto, 2)}"),
-                ('Devoluções',                 f"R$ {formatar_numero_br(_pv_fat_devol, 2)}"),
-                ('Clientes Positivados',       f"{formatar_numero_br(_pv_clientes, 0)}"),
-                ('Ticket Médio',               f"R$ {formatar_numero_br(_pv_ticket, 2)}"),
-                ('Volume Vendido',             f"{formatar_numero_br(_pv_vol_total, 0)} un"),
-                ('Prazo Médio de Venda',       f"{_pv_prazo:.0f} dias"),
-                ('Comissão Média',             _pv_comissao),
-                ('Índice de Inadimplência',    f"R$ {formatar_numero_br(_pv_inad_vendedor, 2)}"),
-                ('Inadimplência / Fat. Bruto', f"{_pv_perc_inad:.1f}%"),
-            ]
-            w1, w2 = 85, 95
-            fill_kpi = False
-            for k, v in _pv_kpis_pdf:
-                pdf.set_fill_color(240, 244, 255) if fill_kpi else pdf.set_fill_color(255, 255, 255)
-                pdf.set_font('Helvetica', 'B', 8)
-                pdf.cell(w1, 6, f'  {k}:', border='LB', fill=True)
+                class PerformancePDF(FPDF):
+                    def header(self):
+                        # Logo (arquivo em cache: o PDF embute a imagem uma única vez)
+                        _caminho_logo_pdf = logo_caminho()
+                        if _caminho_logo_pdf:
+                            try:
+                                self.image(_caminho_logo_pdf, x=10, y=8, w=28)
+                            except Exception:
+                                pass
+                        self.set_xy(42, 10)
+                        self.set_font('Helvetica', 'B', 13)
+                        self.set_text_color(31, 71, 136)
+                        self.cell(0, 6, 'MEDTEXTIL PRODUTOS TEXTIL HOSPITALARES', ln=True)
+                        self.set_xy(42, 17)
+                        self.set_font('Helvetica', '', 8)
+                        self.set_text_color(108, 117, 125)
+                        self.cell(0, 5, 'CNPJ: 40.357.820/0001-50  |  Dashboard Comercial BI 2.0', ln=True)
+                        self.ln(4)
+                        self.set_draw_color(31, 71, 136)
+                        self.set_line_width(0.8)
+                        self.line(10, self.get_y(), 200, self.get_y())
+                        self.ln(3)
+
+                    def footer(self):
+                        self.set_y(-14)
+                        self.set_font('Helvetica', 'I', 7)
+                        self.set_text_color(173, 181, 189)
+                        self.cell(0, 5, f'Performance de Vendedores  ·  Gerado em {_pv_now.strftime("%d/%m/%Y %H:%M")}  ·  Pág. {self.page_no()}', align='C')
+
+                pdf = PerformancePDF()
+                pdf.set_auto_page_break(auto=True, margin=18)
+                pdf.add_page()
+                pdf.set_margins(12, 12, 12)
+
+                # ── Título do relatório ───────────────────────────────────────
+                pdf.set_font('Helvetica', 'B', 16)
+                pdf.set_text_color(31, 71, 136)
+                pdf.cell(0, 10, 'RELATÓRIO DE PERFORMANCE DE VENDEDORES', ln=True, align='C')
+                pdf.set_font('Helvetica', '', 9)
+                pdf.set_text_color(108, 117, 125)
+                _pv_label_periodo = f"Período: {_pv_periodo}"
+                if _pv_data_ini and _pv_periodo == "Personalizado":
+                    _pv_label_periodo = f"Período: {_pv_data_ini.strftime('%d/%m/%Y') if hasattr(_pv_data_ini,'strftime') else str(_pv_data_ini)} a {_pv_data_fim.strftime('%d/%m/%Y') if _pv_data_fim and hasattr(_pv_data_fim,'strftime') else '—'}"
+                pdf.cell(0, 6, f"Vendedor: {_pv_vendedor}  |  Região: {_pv_regiao}  |  {_pv_label_periodo}", ln=True, align='C')
+                pdf.ln(5)
+
+                # ── Resumo Executivo ──────────────────────────────────────────
+                pdf.set_fill_color(31, 71, 136)
+                pdf.set_text_color(255, 255, 255)
+                pdf.set_font('Helvetica', 'B', 9)
+                pdf.cell(0, 7, '  RESUMO EXECUTIVO', fill=True, border=0, ln=True)
+                pdf.set_text_color(50, 50, 50)
                 pdf.set_font('Helvetica', '', 8)
-                pdf.cell(w2, 6, f'  {v}', border='RB', fill=True, ln=True)
-                fill_kpi = not fill_kpi
-            pdf.ln(6)
-
-            # ── Tabela Comparativa de Vendedores ─────────────────────────
-            pdf.set_fill_color(31, 71, 136)
-            pdf.set_text_color(255, 255, 255)
-            pdf.set_font('Helvetica', 'B', 9)
-            pdf.cell(0, 7, '  COMPARATIVO DE VENDEDORES', fill=True, border=0, ln=True)
-
-            _pv_cols_pdf    = ['Vendedor', 'Faturamento (R$)', 'Clientes', 'Ticket Médio', 'Vol.', 'Prazo (d)', 'Comissão']
-            _pv_widths_pdf  = [50, 32, 16, 28, 15, 20, 22]
-
-            pdf.set_text_color(255, 255, 255)
-            pdf.set_font('Helvetica', 'B', 7)
-            for col, w in zip(_pv_cols_pdf, _pv_widths_pdf):
-                pdf.cell(w, 7, col, border=1, fill=True, align='C')
-            pdf.ln()
 
-            _pv_comp_sorted = _pv_comp.sort_values('FaturamentoBruto', ascending=False).head(20)
-            fill_row_pdf = False
-            for _, row in _pv_comp_sorted.iterrows():
-                pdf.set_fill_color(240, 244, 255) if fill_row_pdf else pdf.set_fill_color(255, 255, 255)
-                pdf.set_text_color(50, 50, 50)
-                pdf.set_font('Helvetica', '', 7)
-                _vend_str = str(row['Vendedor'])[:22]
-                _fat_str  = f"R$ {formatar_numero_br(row['FaturamentoBruto'], 2)}"
-                _cli_str  = str(int(row['ClientesAtendidos']))
-                _tick_str = f"R$ {formatar_numero_br(row['TicketMedio'], 2)}"
-                _vol_str  = f"{formatar_numero_br(row.get('VolumeTotal', 0), 0)}"
-                _prz_str  = f"{row.get('PrazoMedio', 0):.0f}"
-                _com_str  = f"{row['ComissaoMedia']:.2f}%" if pd.notnull(row.get('ComissaoMedia')) else "N/D"
-                _row_vals = [_vend_str, _fat_str, _cli_str, _tick_str, _vol_str, _prz_str, _com_str]
-                _aligns   = ['L', 'R', 'C', 'R', 'C', 'C', 'C']
-                for val, w, align in zip(_row_vals, _pv_widths_pdf, _aligns):
-                    pdf.cell(w, 6, val, border=1, fill=True, align=align)
-                pdf.ln()
-                fill_row_pdf = not fill_row_pdf
-            pdf.ln(6)
-
-            # ── Top Produtos ──────────────────────────────────────────────
-            pdf.set_fill_color(31, 71, 136)
-            pdf.set_text_color(255, 255, 255)
-            pdf.set_font('Helvetica', 'B', 9)
-            pdf.cell(0, 7, '  MIX DE PRODUTOS — TOP 15', fill=True, border=0, ln=True)
-
-            _pv_mix_pdf_cols = ['Produto', 'Faturamento (R$)', '% Part.', '% Acum.', 'Clientes']
-            _pv_mix_pdf_w    = [70, 32, 18, 18, 18]
-            pdf.set_font('Helvetica', 'B', 7)
-            for col, w in zip(_pv_mix_pdf_cols, _pv_mix_pdf_w):
-                pdf.cell(w, 7, col, border=1, fill=True, align='C')
-            pdf.ln()
+                _pv_kpis_pdf = [
+                    ('Faturamento Líquido',       f"R$ {formatar_numero_br(_pv_fat_liq, 2)}"),
+                    ('Faturamento Bruto',          f"R$ {formatar_numero_br(_pv_fat_bruto, 2)}"),
+                    ('Devoluções',                 f"R$ {formatar_numero_br(_pv_fat_devol, 2)}"),
+                    ('Clientes Positivados',       f"{formatar_numero_br(_pv_clientes, 0)}"),
+                    ('Ticket Médio',               f"R$ {formatar_numero_br(_pv_ticket, 2)}"),
+                    ('Volume Vendido',             f"{formatar_numero_br(_pv_vol_total, 0)} un"),
+                    ('Prazo Médio de Venda',       f"{_pv_prazo:.0f} dias"),
+                    ('Comissão Média',             _pv_comissao),
+                    ('Índice de Inadimplência',    f"R$ {formatar_numero_br(_pv_inad_vendedor, 2)}"),
+                    ('Inadimplência / Fat. Bruto', f"{_pv_perc_inad:.1f}%"),
+                ]
+                w1, w2 = 85, 95
+                fill_kpi = False
+                for k, v in _pv_kpis_pdf:
+                    pdf.set_fill_color(240, 244, 255) if fill_kpi else pdf.set_fill_color(255, 255, 255)
+                    pdf.set_font('Helvetica', 'B', 8)
+                    pdf.cell(w1, 6, f'  {k}:', border='LB', fill=True)
+                    pdf.set_font('Helvetica', '', 8)
+                    pdf.cell(w2, 6, f'  {v}', border='RB', fill=True, ln=True)
+                    fill_kpi = not fill_kpi
+                pdf.ln(6)
+
+                # ── Tabela Comparativa de Vendedores ─────────────────────────
+                pdf.set_fill_color(31, 71, 136)
+                pdf.set_text_color(255, 255, 255)
+                pdf.set_font('Helvetica', 'B', 9)
+                pdf.cell(0, 7, '  COMPARATIVO DE VENDEDORES', fill=True, border=0, ln=True)
 
-            fill_mix = False
-            for _, row in _pv_mix.head(15).iterrows():
-                pdf.set_fill_color(240, 244, 255) if fill_mix else pdf.set_fill_color(255, 255, 255)
-                pdf.set_text_color(50, 50, 50)
-                pdf.set_font('Helvetica', '', 7)
-                _prod_str = str(row['NomeProduto'])[:38]
-                _fat_str  = f"R$ {formatar_numero_br(row['Total'], 2)}"
-                _part_str = f"{row['Participacao']:.2f}%"
-                _acum_str = f"{row['CumulativaPerc']:.2f}%"
-                _cli_str  = str(int(row['Clientes']))
-                _mix_vals = [_prod_str, _fat_str, _part_str, _acum_str, _cli_str]
-                _mix_al   = ['L', 'R', 'C', 'C', 'C']
-                for val, w, al in zip(_mix_vals, _pv_mix_pdf_w, _mix_al):
-                    pdf.cell(w, 6, val, border=1, fill=True, align=al)
+                _pv_cols_pdf    = ['Vendedor', 'Faturamento (R$)', 'Clientes', 'Ticket Médio', 'Vol.', 'Prazo (d)', 'Comissão']
+                _pv_widths_pdf  = [50, 32, 16, 28, 15, 20, 22]
+
+                pdf.set_text_color(255, 255, 255)
+                pdf.set_font('Helvetica', 'B', 7)
+                for col, w in zip(_pv_cols_pdf, _pv_widths_pdf):
+                    pdf.cell(w, 7, col, border=1, fill=True, align='C')
                 pdf.ln()
-                fill_mix = not fill_mix
-            pdf.ln(6)
 
-            # ── Inadimplência resumida ────────────────────────────────────
-            if _pv_df_inad is not None and _pv_inad_vendedor > 0:
-                pdf.set_fill_color(239, 68, 68)
+                _pv_comp_sorted = _pv_comp.sort_values('FaturamentoBruto', ascending=False).head(20)
+                fill_row_pdf = False
+                for _, row in _pv_comp_sorted.iterrows():
+                    pdf.set_fill_color(240, 244, 255) if fill_row_pdf else pdf.set_fill_color(255, 255, 255)
+                    pdf.set_text_color(50, 50, 50)
+                    pdf.set_font('Helvetica', '', 7)
+                    _vend_str = str(row['Vendedor'])[:22]
+                    _fat_str  = f"R$ {formatar_numero_br(row['FaturamentoBruto'], 2)}"
+                    _cli_str  = str(int(row['ClientesAtendidos']))
+                    _tick_str = f"R$ {formatar_numero_br(row['TicketMedio'], 2)}"
+                    _vol_str  = f"{formatar_numero_br(row.get('VolumeTotal', 0), 0)}"
+                    _prz_str  = f"{row.get('PrazoMedio', 0):.0f}"
+                    _com_str  = f"{row['ComissaoMedia']:.2f}%" if pd.notnull(row.get('ComissaoMedia')) else "N/D"
+                    _row_vals = [_vend_str, _fat_str, _cli_str, _tick_str, _vol_str, _prz_str, _com_str]
+                    _aligns   = ['L', 'R', 'C', 'R', 'C', 'C', 'C']
+                    for val, w, align in zip(_row_vals, _pv_widths_pdf, _aligns):
+                        pdf.cell(w, 6, val, border=1, fill=True, align=align)
+                    pdf.ln()
+                    fill_row_pdf = not fill_row_pdf
+                pdf.ln(6)
+
+                # ── Top Produtos ──────────────────────────────────────────────
+                pdf.set_fill_color(31, 71, 136)
                 pdf.set_text_color(255, 255, 255)
                 pdf.set_font('Helvetica', 'B', 9)
-                pdf.cell(0, 7, '  INADIMPLÊNCIA', fill=True, border=0, ln=True)
-                pdf.set_text_color(50, 50, 50)
-                pdf.set_font('Helvetica', '', 8)
-                pdf.set_fill_color(255, 240, 240)
-                pdf.cell(95, 6, f'  Valor em Aberto: R$ {formatar_numero_br(_pv_inad_vendedor, 2)}', border='LB', fill=True)
-                pdf.cell(90, 6, f'  % sobre Fat. Bruto: {_pv_perc_inad:.1f}%', border='RB', fill=True, ln=True)
-                pdf.ln(4)
-
-            # ── Rodapé do relatório ───────────────────────────────────────
-            pdf.set_font('Helvetica', 'I', 7)
-            pdf.set_text_color(173, 181, 189)
-            pdf.multi_cell(0, 5,
-                'Este relatório é gerado automaticamente com base nos dados filtrados do sistema BI Medtextil. '
-                'As informações refletem o período e os filtros selecionados no momento da geração.')
-
-            _pv_pdf_bytes = pdf.output()
-            st.download_button(
-                label="⬇️ Baixar PDF",
-                data=bytes(_pv_pdf_bytes),
-                file_name=f"performance_vendedores_{_pv_now.strftime('%Y%m%d_%H%M')}.pdf",
-                mime="application/pdf",
-                key="pv_dl_pdf_btn"
-            )
-            st.success("✅ PDF gerado com sucesso! Clique em 'Baixar PDF' para salvar.")
+                pdf.cell(0, 7, '  MIX DE PRODUTOS — TOP 15', fill=True, border=0, ln=True)
 
-        except ImportError:
-            # Fallback ReportLab
-            try:
+                _pv_mix_pdf_cols = ['Produto', 'Faturamento (R$)', '% Part.', '% Acum.', 'Clientes']
+                _pv_mix_pdf_w    = [70, 32, 18, 18, 18]
+                pdf.set_font('Helvetica', 'B', 7)
+                for col, w in zip(_pv_mix_pdf_cols, _pv_mix_pdf_w):
+                    pdf.cell(w, 7, col, border=1, fill=True, align='C')
+                pdf.ln()
+
+                fill_mix = False
+                for _, row in _pv_mix.head(15).iterrows():
+                    pdf.set_fill_color(240, 244, 255) if fill_mix else pdf.set_fill_color(255, 255, 255)
+                    pdf.set_text_color(50, 50, 50)
+                    pdf.set_font('Helvetica', '', 7)
+                    _prod_str = str(row['NomeProduto'])[:38]
+                    _fat_str  = f"R$ {formatar_numero_br(row['Total'], 2)}"
+                    _part_str = f"{row['Participacao']:.2f}%"
+                    _acum_str = f"{row['CumulativaPerc']:.2f}%"
+                    _cli_str  = str(int(row['Clientes']))
+                    _mix_vals = [_prod_str, _fat_str, _part_str, _acum_str, _cli_str]
+                    _mix_al   = ['L', 'R', 'C', 'C', 'C']
+                    for val, w, al in zip(_mix_vals, _pv_mix_pdf_w, _mix_al):
+                        pdf.cell(w, 6, val, border=1, fill=True, align=al)
+                    pdf.ln()
+                    fill_mix = not fill_mix
+                pdf.ln(6)
+
+                # ── Inadimplência resumida ────────────────────────────────────
+                if _pv_df_inad is not None and _pv_inad_vendedor > 0:
+                    pdf.set_fill_color(239, 68, 68)
+                    pdf.set_text_color(255, 255, 255)
+                    pdf.set_font('Helvetica', 'B', 9)
+                    pdf.cell(0, 7, '  INADIMPLÊNCIA', fill=True, border=0, ln=True)
+                    pdf.set_text_color(50, 50, 50)
+                    pdf.set_font('Helvetica', '', 8)
+                    pdf.set_fill_color(255, 240, 240)
+                    pdf.cell(95, 6, f'  Valor em Aberto: R$ {formatar_numero_br(_pv_inad_vendedor, 2)}', border='LB', fill=True)
+                    pdf.cell(90, 6, f'  % sobre Fat. Bruto: {_pv_perc_inad:.1f}%', border='RB', fill=True, ln=True)
+                    pdf.ln(4)
+
+                # ── Rodapé do relatório ───────────────────────────────────────
+                pdf.set_font('Helvetica', 'I', 7)
+                pdf.set_text_color(173, 181, 189)
+                pdf.multi_cell(0, 5,
+                    'Este relatório é gerado automaticamente com base nos dados filtrados do sistema BI Medtextil. '
+                    'As informações refletem o período e os filtros selecionados no momento da geração.')
+
+                return bytes(pdf.output())
+
+            except ImportError:
+                # Fallback ReportLab
                 from reportlab.lib.pagesizes import A4
                 from reportlab.lib import colors
                 from reportlab.lib.units import mm
@@ -7579,20 +9611,13 @@ elif menu == "Performance de Vendedores":
                 _elements_rl.append(_kpi_table)
                 _pv_doc.build(_elements_rl)
                 _pv_buf.seek(0)
+                return _pv_buf.getvalue()
 
-                st.download_button(
-                    "⬇️ Baixar PDF",
-                    data=_pv_buf.getvalue(),
-                    file_name=f"performance_vendedores_{_pv_now.strftime('%Y%m%d_%H%M')}.pdf",
-                    mime="application/pdf",
-                    key="pv_dl_pdf_rl"
-                )
-                st.success("✅ PDF gerado com sucesso!")
-            except Exception as _e_rl:
-                st.error(f"❌ Erro ao gerar PDF: {_e_rl}")
-        except Exception as _e_pdf:
-            st.error(f"❌ Erro ao gerar PDF: {_e_pdf}")
-            st.info("💡 Verifique se a biblioteca fpdf2 está instalada: pip install fpdf2")
+        enviar_tarefa("📄 PDF Performance de Vendedores", _gerar_pdf_performance,
+                      f"performance_vendedores_{_pv_now.strftime('%Y%m%d_%H%M')}.pdf",
+                      "application/pdf")
+        st.toast("PDF em geração — acompanhe e baixe em 📥 Exportações, na barra lateral.", icon="📄")
+        st.rerun()
 
 
 
@@ -7660,11 +9685,11 @@ elif menu == "Performance de Vendedores":
         st.info(f"Nenhum vendedor com vendas em {_label_mes_card}.")
     else:
         # Faturamento líquido via Valor_Real (notas_unicas) — igual ao dashboard
-        _fat_card = _nu_mes.groupby("Vendedor")["Valor_Real"].sum()
+        _fat_card = _nu_mes.groupby("Vendedor", observed=True)["Valor_Real"].sum()
 
         # Positivação: clientes únicos com NF Venda no mês (df completo, tem CPF_CNPJ)
-        _posit_card = _df_mes_card.groupby("Vendedor")["CPF_CNPJ"].nunique()
-        _base_hist  = _df_nf_hist_raw.groupby("Vendedor")["CPF_CNPJ"].nunique()
+        _posit_card = _df_mes_card.groupby("Vendedor", observed=True)["CPF_CNPJ"].nunique()
+        _base_hist  = _df_nf_hist_raw.groupby("Vendedor", observed=True)["CPF_CNPJ"].nunique()
 
         # Cálculo de meta por vendedor — usa NFs deduplicadas para soma correta
         def _meta_card(vendedor):
@@ -7701,13 +9726,13 @@ elif menu == "Performance de Vendedores":
         _fat_mes_ant_c = _nu_hist[
             (_nu_hist["DataEmissao"].dt.month == _mes_ant_c) &
             (_nu_hist["DataEmissao"].dt.year  == _ano_ant_c)
-        ].groupby("Vendedor")["Valor_Real"].sum()
+        ].groupby("Vendedor", observed=True)["Valor_Real"].sum()
 
         # Faturamento mesmo mês ano anterior via Valor_Real
         _fat_ano_ant_c = _nu_hist[
             (_nu_hist["DataEmissao"].dt.month == _mes_card) &
             (_nu_hist["DataEmissao"].dt.year  == _ano_card - 1)
-        ].groupby("Vendedor")["Valor_Real"].sum()
+        ].groupby("Vendedor", observed=True)["Valor_Real"].sum()
 
         # Clientes reativados: compraram no mês de referência MAS não compraram
         # nos 3 meses anteriores (= inativos por 3+ meses que voltaram)
@@ -7719,7 +9744,7 @@ elif menu == "Performance de Vendedores":
             _df_nf_hist_raw[
                 (_df_nf_hist_raw["DataEmissao"].dt.month == _mes_card) &
                 (_df_nf_hist_raw["DataEmissao"].dt.year  == _ano_card)
-            ].groupby("Vendedor")["CPF_CNPJ"].apply(set)
+            ].groupby("Vendedor", observed=True)["CPF_CNPJ"].apply(set)
         )
 
         # CPFs que compraram nos 3 meses anteriores por vendedor
@@ -7727,7 +9752,7 @@ elif menu == "Performance de Vendedores":
             _df_nf_hist_raw[
                 (_df_nf_hist_raw["DataEmissao"] >= _3m_antes_c) &
                 (_df_nf_hist_raw["DataEmissao"] <  _ref_ts_c)
-            ].groupby("Vendedor")["CPF_CNPJ"].apply(set)
+            ].groupby("Vendedor", observed=True)["CPF_CNPJ"].apply(set)
         )
 
         def _reativados_vend(vendedor):
@@ -7903,18 +9928,9 @@ elif menu == "Performance de Vendedores":
 
     if st.button("🖼️ Gerar Card(s) como Imagem PNG", key="btn_gerar_png_card", type="primary"):
         try:
-            from PIL import Image as _PilImg, ImageDraw as _PilDraw, ImageFont as _PilFont
-            import requests as _req_img
+            from PIL import ImageDraw as _PilDraw, ImageFont as _PilFont
             import io as _io_img
 
-            # Baixar logo do GitHub
-            _logo_url = f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/{GITHUB_FOLDER}/logo.png"
-            try:
-                _logo_resp = _req_img.get(_logo_url, timeout=5)
-                _logo_pil  = _PilImg.open(_io_img.BytesIO(_logo_resp.content)).convert("RGBA")
-            except Exception:
-                _logo_pil = None
-
             # Paleta Medtextil
             _C_NAVY  = (13,  35,  75)   # #0D234B
             _C_GREEN = (39, 174,  96)   # #27AE60
@@ -8026,15 +10042,11 @@ elif menu == "Performance de Vendedores":
                 _meta_cor = "#27AE60" if _perc_m >= 100 else ("#F39C12" if _perc_m >= 70 else "#E74C3C")
                 _barra_w  = min(int(_perc_m), 100)
 
-                # Logo base64
-                _logo_b64 = ""
-                try:
-                    import base64 as _b64
-                    import requests as _req2
-                    _lr2 = _req2.get(f"https://raw.githubusercontent.com/{GITHUB_REPO}/main/{GITHUB_FOLDER}/logo.png", timeout=5)
-                    _logo_b64 = _b64.b64encode(_lr2.content).decode()
+                # Logo base64 (cache de ativos)
+                _logo_b64 = logo_base64()
+                if _logo_b64:
                     _logo_tag = f'<img src="data:image/png;base64,{_logo_b64}" style="height:90px;margin-bottom:4px;">'
-                except Exception:
+                else:
                     _logo_tag = '<div style="font-size:48px;font-weight:900;color:#0D234B;">MEDTEXTIL</div>'
 
                 _html = f"""<!DOCTYPE html>
@@ -8342,33 +10354,30 @@ elif menu == "Performance de Vendedores":
 
             _vends_gerar = _vends_ativos if _vend_img_sel == "Todos" else [_vend_img_sel]
 
-            if len(_vends_gerar) == 1:
-                _png_bytes = _draw_card_img(_vends_gerar[0])
-                st.image(_png_bytes, caption=f"Card — {_vends_gerar[0]}")
-                st.download_button(
-                    "⬇️ Baixar imagem PNG",
-                    data=_png_bytes,
-                    file_name=f"resultado_{_vends_gerar[0].replace(' ','_')}_{_mes_card:02d}_{_ano_card}.png",
-                    mime="image/png",
-                    key="dl_png_single"
-                )
-            else:
+            def _gerar_cards_png(progresso):
+                if len(_vends_gerar) == 1:
+                    return _draw_card_img(_vends_gerar[0])
                 import zipfile as _zf
                 _zip_buf = _io_img.BytesIO()
                 with _zf.ZipFile(_zip_buf, "w") as _zobj:
-                    for _vg in _vends_gerar:
+                    for _i_vg, _vg in enumerate(_vends_gerar):
+                        progresso(_i_vg, len(_vends_gerar), _vg)
                         _pb = _draw_card_img(_vg)
                         _fname = f"resultado_{_vg.replace(' ','_')}_{_mes_card:02d}_{_ano_card}.png"
                         _zobj.writestr(_fname, _pb)
-                _zip_buf.seek(0)
-                st.download_button(
-                    f"⬇️ Baixar todos os cards ({len(_vends_gerar)} imagens .zip)",
-                    data=_zip_buf.getvalue(),
-                    file_name=f"cards_resultado_{_mes_card:02d}_{_ano_card}.zip",
-                    mime="application/zip",
-                    key="dl_png_zip"
-                )
-            st.success("✅ Imagem(ns) gerada(s)!")
+                return _zip_buf.getvalue()
+
+            if len(_vends_gerar) == 1:
+                _rotulo_png = f"🖼️ Card — {_vends_gerar[0]}"
+                _nome_png = f"resultado_{_vends_gerar[0].replace(' ','_')}_{_mes_card:02d}_{_ano_card}.png"
+                _mime_png = "image/png"
+            else:
+                _rotulo_png = f"🖼️ Cards ({len(_vends_gerar)} imagens)"
+                _nome_png = f"cards_resultado_{_mes_card:02d}_{_ano_card}.zip"
+                _mime_png = "application/zip"
+            enviar_tarefa(_rotulo_png, _gerar_cards_png, _nome_png, _mime_png)
+            st.toast("Card(s) em geração — acompanhe e baixe em 📥 Exportações, na barra lateral.", icon="🖼️")
+            st.rerun()
         except Exception as _e_png:
             st.error(f"Erro ao gerar imagem: {_e_png}")
             st.info("Instale Pillow: pip install Pillow")
@@ -8378,20 +10387,17 @@ elif menu == "Rankings":
     st.markdown('<h2 style="color:#4A7BC8;font-weight:700;margin-bottom:4px;font-size:1.35rem;">Rankings</h2>', unsafe_allow_html=True)
 
     _rank_ini, _rank_fim = renderizar_filtros_locais("rank", "📅 Ajustar Período")
-    _rank_notas = notas_unicas.copy()
-    if _rank_ini:
-        _rank_notas = _rank_notas[_rank_notas['DataEmissao'] >= pd.to_datetime(_rank_ini)]
-    if _rank_fim:
-        _rank_notas = _rank_notas[_rank_notas['DataEmissao'] <= pd.to_datetime(_rank_fim)]
+    _rank_cubo = fatiar_cubo_global(_rank_ini, _rank_fim)
+    _rank_notas = _rank_cubo[_rank_cubo['Notas'] > 0]
 
     tab1, tab2 = st.tabs(["📊 Vendedores", "👥 Clientes"])
     
     with tab1:
         st.subheader("Ranking de Vendedores por Valor")
         
-        ranking_vendedores = _rank_notas.groupby('Vendedor').agg({
+        ranking_vendedores = _rank_notas.groupby('Vendedor', observed=True).agg({
             'Valor_Real': 'sum',
-            'Numero_NF': 'count',
+            'Notas': 'sum',
             'CPF_CNPJ': 'nunique'
         }).reset_index()
         ranking_vendedores.columns = ['Vendedor', 'Valor Total', 'Qtd Notas', 'Qtd Clientes']
@@ -8416,7 +10422,7 @@ elif menu == "Rankings":
         
         st.download_button(
             "📥 Exportar Ranking Vendedores",
-            to_excel(ranking_vendedores),
+            excel_sob_demanda(to_excel, ranking_vendedores),
             "ranking_vendedores.xlsx",
             "application/vnd.ms-excel",
             key="dl_rank_vendedores"
@@ -8427,9 +10433,9 @@ elif menu == "Rankings":
         
         top_n = st.selectbox("Exibir Top:", [10, 20, 50, 100], key="top_clientes")
         
-        ranking_clientes = _rank_notas.groupby(['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado']).agg({
+        ranking_clientes = _rank_notas.groupby(['CPF_CNPJ', 'RazaoSocial', 'Cidade', 'Estado'], observed=True).agg({
             'Valor_Real': 'sum',
-            'Numero_NF': 'count'
+            'Notas': 'sum'
         }).reset_index()
         ranking_clientes.columns = ['CPF/CNPJ', 'Razão Social', 'Cidade', 'Estado', 'Valor Total', 'Qtd Notas']
         ranking_clientes = ranking_clientes.sort_values('Valor Total', ascending=False).head(top_n)
@@ -8454,7 +10460,7 @@ elif menu == "Rankings":
         
         st.download_button(
             "📥 Exportar Ranking Clientes",
-            to_excel(ranking_clientes),
+            excel_sob_demanda(to_excel, ranking_clientes),
             f"ranking_top{top_n}_clientes.xlsx",
             "application/vnd.ms-excel",
             key="dl_rank_clientes"
@@ -8497,20 +10503,21 @@ elif menu == "Consulta Clientes":
 
     # ── Carregar tabela de preços ─────────────────────────────────────────
     _df_tabela = None
+    _cat_tabela = None
     
     # Tentar carregar produtos_agrupados primeiro (mais confiável)
     if planilhas_disponiveis.get('produtos_agrupados'):
         with st.spinner("Carregando catálogo de produtos..."):
-            _df_tabela = carregar_planilha_github(planilhas_disponiveis['produtos_agrupados']['url'])
-            if _df_tabela is not None:
-                _df_tabela.columns = _df_tabela.columns.str.upper().str.strip()
+            _cat_tabela = indice_produtos(planilhas_disponiveis['produtos_agrupados'])
+            if _cat_tabela is not None:
+                _df_tabela = _cat_tabela.df.copy(deep=False)
                 st.success("✅ Usando: Produtos Agrupados")
     
     # Se não conseguiu, tentar tabela_ne
     if _df_tabela is None and planilhas_disponiveis.get('tabela_ne'):
         with st.spinner("Carregando tabela NE..."):
             try:
-                response = requests.get(planilhas_disponiveis['tabela_ne']['url'], timeout=15)
+                response = sessao_http().get(planilhas_disponiveis['tabela_ne']['url'], timeout=15)
                 content = io.BytesIO(response.content)
                 
                 # Tentar diferentes skiprows para encontrar o cabeçalho correto
@@ -8588,7 +10595,11 @@ elif menu == "Consulta Clientes":
     st.markdown("#### Consulta de Produto")
 
     # ── Campo de código do produto ────────────────────────────────────────
-    _codigos_lista = [''] + sorted(_df_tabela[_cod_col].dropna().astype(str).unique().tolist())
+    _usa_indice = _cat_tabela is not None and _cod_col == _cat_tabela.col_codigo
+    if _usa_indice:
+        _codigos_lista = [''] + _cat_tabela.codigos
+    else:
+        _codigos_lista = [''] + sorted(_df_tabela[_cod_col].dropna().astype(str).unique().tolist())
     _cc1, _cc2, _cc3 = st.columns([1, 2, 1])
     with _cc1:
         _cod_sel = st.selectbox("Código do Produto", _codigos_lista,
@@ -8601,7 +10612,9 @@ elif menu == "Consulta Clientes":
 
     # ── Buscar produto e calcular preços ──────────────────────────────────
     _prod_row = None
-    if _cod_sel:
+    if _cod_sel and _usa_indice:
+        _prod_row = _cat_tabela.linha(_cod_sel)
+    elif _cod_sel:
         _match = _df_tabela[_df_tabela[_cod_col].astype(str) == str(_cod_sel)]
         if len(_match) > 0:
             _prod_row = _match.iloc[0]
@@ -8738,12 +10751,12 @@ elif menu == "__erp_novo_pedido__":
         st.markdown("### 👤 Cliente")
         _c1, _c2 = st.columns(2)
         with _c1:
-            _clientes_lista = sorted(df["RazaoSocial"].dropna().unique().tolist())
-            _cli_sel = st.selectbox("Cliente", [""] + _clientes_lista,
+            _idx_cli = indice_clientes(df, sha_planilha_vendas)
+            _cli_sel = st.selectbox("Cliente", [""] + _idx_cli.nomes,
                                     key="erp_cliente_sel")
         _dc = {}
         if _cli_sel:
-            _row = df[df["RazaoSocial"] == _cli_sel].iloc[0]
+            _row = _idx_cli.cliente(_cli_sel)
             _dc = {
                 "razao_social": _row.get("RazaoSocial", ""),
                 "cpf_cnpj":     _row.get("CPF_CNPJ", ""),
@@ -8754,7 +10767,8 @@ elif menu == "__erp_novo_pedido__":
             # Verificar inadimplência
             if planilhas_disponiveis.get("inadimplencia"):
                 _df_inad_check = carregar_planilha_github(
-                    planilhas_disponiveis["inadimplencia"]["url"])
+                    planilhas_disponiveis["inadimplencia"]["url"],
+                    planilhas_disponiveis["inadimplencia"].get("sha"))
                 if _df_inad_check is not None:
                     _df_inad_check.columns = _df_inad_check.columns.str.upper()
                     _cnpj_col = next(
@@ -8814,20 +10828,14 @@ elif menu == "__erp_novo_pedido__":
 
         # ── Seção C: Itens ────────────────────────────────────────────────
         st.markdown("### 🛒 Adicionar Produto")
-        _df_prod = None
-        if planilhas_disponiveis.get("produtos_agrupados"):
-            _df_prod = carregar_planilha_github(
-                planilhas_disponiveis["produtos_agrupados"]["url"])
-            if _df_prod is not None:
-                _df_prod.columns = _df_prod.columns.str.upper()
+        _cat_erp = indice_produtos(planilhas_disponiveis.get("produtos_agrupados"))
 
         _pa, _pb, _pc, _pd = st.columns([2, 1, 1, 1])
         with _pa:
             _busca_tipo = st.radio("Buscar por:", ["Código", "Descrição"],
                                    horizontal=True, key="erp_busca_tipo")
-            if _busca_tipo == "Código" and _df_prod is not None:
-                _cods = [""] + sorted(
-                    _df_prod["ID_COD"].dropna().astype(str).unique().tolist())
+            if _busca_tipo == "Código" and _cat_erp is not None:
+                _cods = [""] + _cat_erp.codigos
                 _cod_sel_erp = st.selectbox("Código", _cods,
                                             key="erp_cod_sel")
             elif _busca_tipo == "Código":
@@ -8835,36 +10843,30 @@ elif menu == "__erp_novo_pedido__":
             else:
                 _desc_busca = st.text_input("Descrição", key="erp_desc_busca")
                 _cod_sel_erp = ""
+                if _desc_busca and _cat_erp is not None:
+                    _achados = _cat_erp.buscar(_desc_busca)
+                    if _achados:
+                        _cod_sel_erp = st.selectbox(
+                            f"{len(_achados)} produto(s) encontrado(s)",
+                            [c for c, _ in _achados],
+                            format_func=lambda c: f"{c} — {dict(_achados).get(c, '')}",
+                            key="erp_desc_sel")
+                    else:
+                        st.caption("Nenhum produto encontrado.")
 
         _prod_info = {}
-        if _df_prod is not None:
-            if _busca_tipo == "Código" and _cod_sel_erp:
-                _mask = _df_prod["ID_COD"].astype(str) == str(_cod_sel_erp)
-                if _mask.any():
-                    _pr = _df_prod[_mask].iloc[0]
-                    _prod_info = {
-                        "codigo":    str(_pr.get("ID_COD", "")),
-                        "descricao": str(_pr.get("NOME_PRODUTO",
-                                        _pr.get("DESCRICAO",
-                                        _pr.get("PRODUTO", "")))),
-                        "peso":      str(_pr.get("GRAMATURA", "")),
-                        "cx_embarque": str(_pr.get("CX_EMB", "")),
-                        "preco_ref": float(_pr.get("PRECO", 0) or 0),
-                    }
-            elif _busca_tipo == "Descrição" and _desc_busca:
-                _mask = _df_prod.apply(
-                    lambda r: _desc_busca.upper() in str(r).upper(), axis=1)
-                if _mask.any():
-                    _pr = _df_prod[_mask].iloc[0]
-                    _prod_info = {
-                        "codigo":    str(_pr.get("ID_COD", "")),
-                        "descricao": str(_pr.get("NOME_PRODUTO",
-                                        _pr.get("DESCRICAO",
-                                        _pr.get("PRODUTO", "")))),
-                        "peso":      str(_pr.get("GRAMATURA", "")),
-                        "cx_embarque": str(_pr.get("CX_EMB", "")),
-                        "preco_ref": float(_pr.get("PRECO", 0) or 0),
-                    }
+        if _cat_erp is not None:
+            _pr = _cat_erp.linha(_cod_sel_erp) if _cod_sel_erp else None
+            if _pr is not None:
+                _prod_info = {
+                    "codigo":    str(_pr.get("ID_COD", "")),
+                    "descricao": str(_pr.get("NOME_PRODUTO",
+                                    _pr.get("DESCRICAO",
+                                    _pr.get("PRODUTO", "")))),
+                    "peso":      str(_pr.get("GRAMATURA", "")),
+                    "cx_embarque": str(_pr.get("CX_EMB", "")),
+                    "preco_ref": float(_pr.get("PRECO", 0) or 0),
+                }
 
         with _pb:
             _qtd_erp = st.number_input("Quantidade", min_value=1, value=1,
@@ -9081,41 +11083,32 @@ elif menu == "__erp_meus_pedidos__":
                             "Últimos 90 dias"],
                 key="erp_mp_periodo")
 
-        # Buscar pedidos
+        # Buscar pedidos (filtros aplicados no Supabase)
         _filtros_mp = {}
         if not _erp_is_gestor:
             _filtros_mp["criado_por_id"] = _erp_user_id
         if _status_filtro_mp != "Todos":
             _filtros_mp["status"] = _status_filtro_mp
-
-        _pedidos_mp = supa_select("pedidos", filtros=_filtros_mp,
-                                  ordem="criado_em.desc", limite=200)
-
-        # Filtro cliente (client-side)
         if _cli_filtro_mp:
-            _pedidos_mp = [
-                p for p in _pedidos_mp
-                if _cli_filtro_mp.lower() in
-                p.get("cliente_razao_social", "").lower()
-            ]
-
-        # Filtro período
-        if _periodo_mp != "Todos":
-            _dias_mp = {"Últimos 7 dias": 7,
-                        "Últimos 30 dias": 30,
-                        "Últimos 90 dias": 90}[_periodo_mp]
-            _corte_mp = pd.Timestamp.now() - pd.Timedelta(days=_dias_mp)
-            _pedidos_mp = [
-                p for p in _pedidos_mp
-                if pd.to_datetime(p.get("criado_em", "")) >= _corte_mp
-            ]
-
-        # KPIs
-        _total_mp  = len(_pedidos_mp)
-        _valor_mp  = sum(float(p.get("valor_total", 0) or 0)
-                         for p in _pedidos_mp)
-        _abertos_mp = sum(1 for p in _pedidos_mp
-                          if p.get("status") not in ("faturado", "cancelado"))
+            _filtros_mp["cliente_razao_social"] = ("contem", _cli_filtro_mp)
+        _per_filtro_mp = _erp_filtro_periodo(_periodo_mp)
+        if _per_filtro_mp:
+            _filtros_mp["criado_em"] = _per_filtro_mp
+
+        # Página atual da listagem (o total filtrado vem do count=exact)
+        _tam_pag_mp = 50
+        _cursor_mp = _erp_cursor_pagina(
+            "erp_mp_paginas",
+            (_status_filtro_mp, _cli_filtro_mp, _periodo_mp, _erp_user_id))
+        _pedidos_mp, _total_pag_mp, _prox_mp = supa_select_pagina(
+            "pedidos", filtros=_filtros_mp, tamanho=_tam_pag_mp, cursor=_cursor_mp)
+
+        # KPIs agregados no banco (uma linha por status)
+        _resumo_mp = supa_resumo("pedidos", filtros=_filtros_mp)
+        _total_mp  = _total_pag_mp
+        _valor_mp  = sum(_v for _, _v in _resumo_mp.values())
+        _abertos_mp = sum(_q for _s, (_q, _) in _resumo_mp.items()
+                          if _s not in ("faturado", "cancelado"))
         _k1, _k2, _k3 = st.columns(3)
         _erp_kpi(_k1, "Total de Pedidos", str(_total_mp))
         _erp_kpi(_k2, "Valor Total", f"R$ {formatar_numero_br(_valor_mp, 2)}", "#15803D")
@@ -9125,6 +11118,10 @@ elif menu == "__erp_meus_pedidos__":
         if not _pedidos_mp:
             st.info("Nenhum pedido encontrado com os filtros selecionados.")
         else:
+            _erp_navegacao_paginas("erp_mp_paginas", _prox_mp, _total_pag_mp,
+                                   len(_pedidos_mp), _tam_pag_mp)
+            # Itens e histórico dos pedidos da página em consultas em lote
+            _itens_mp, _hist_mp = carregar_detalhes_pedidos([p.get("id") for p in _pedidos_mp])
             for _p in _pedidos_mp:
                 _status_p  = _p.get("status", "rascunho")
                 _num_p     = _p.get("numero", "—")
@@ -9150,9 +11147,9 @@ elif menu == "__erp_meus_pedidos__":
                                          use_container_width=True):
                                 st.session_state.erp_pedido_id = _id_p
                                 st.session_state.erp_numero    = _num_p
-                                st.session_state.erp_itens     = supa_select(
-                                    "itens_pedido",
-                                    filtros={"pedido_id": _id_p})
+                                st.session_state.erp_itens     = [
+                                    item_pedido_do_registro(r)
+                                    for r in _itens_mp.get(_id_p, [])]
                                 st.session_state.menu_option = \
                                     "__erp_novo_pedido__"
                                 st.rerun()
@@ -9182,8 +11179,7 @@ elif menu == "__erp_meus_pedidos__":
                                     st.rerun()
 
                     # Itens do pedido
-                    _itens_p = supa_select("itens_pedido",
-                                           filtros={"pedido_id": _id_p})
+                    _itens_p = _itens_mp.get(_id_p, [])
                     if _itens_p:
                         _df_itens_p = pd.DataFrame(_itens_p)[[
                             "codigo_produto", "descricao", "quantidade",
@@ -9197,9 +11193,7 @@ elif menu == "__erp_meus_pedidos__":
                                      hide_index=True)
 
                     # Histórico de status
-                    _hist_p = supa_select("historico_status",
-                                          filtros={"pedido_id": _id_p},
-                                          ordem="criado_em.asc")
+                    _hist_p = _hist_mp.get(_id_p, [])
                     if _hist_p:
                         st.markdown("**Histórico:**")
                         for _h in _hist_p:
@@ -9301,6 +11295,8 @@ elif menu == "__erp_fila_aprovacao__":
         if not _enviados:
             st.success("✅ Nenhum pedido aguardando aprovação.")
         else:
+            _itens_fila, _ = carregar_detalhes_pedidos(
+                [p.get("id") for p in _enviados], historico=False)
             for _pf in _enviados:
                 _id_f   = _pf.get("id", "")
                 _num_f  = _pf.get("numero", "—")
@@ -9323,8 +11319,7 @@ elif menu == "__erp_fila_aprovacao__":
                 )
 
                 with st.expander(_titulo_f, expanded=_urgente_f):
-                    _itens_f = supa_select("itens_pedido",
-                                           filtros={"pedido_id": _id_f})
+                    _itens_f = _itens_fila.get(_id_f, [])
                     if _itens_f:
                         _df_f = pd.DataFrame(_itens_f)[[
                             "codigo_produto", "descricao", "quantidade",
@@ -9417,43 +11412,22 @@ elif menu == "__erp_todos_pedidos__":
                  "Últimos 90 dias"],
                 key="erp_tp_periodo")
 
+        # Filtros aplicados no Supabase
         _filtros_tp = {}
         if _st_todos != "Todos":
             _filtros_tp["status"] = _st_todos
-
-        _todos_ped = supa_select("pedidos", filtros=_filtros_tp,
-                                 ordem="criado_em.desc", limite=500)
-
         if _vend_todos:
-            _todos_ped = [
-                p for p in _todos_ped
-                if _vend_todos.lower() in
-                p.get("criado_por_nome", "").lower()
-            ]
+            _filtros_tp["criado_por_nome"] = ("contem", _vend_todos)
         if _cli_todos:
-            _todos_ped = [
-                p for p in _todos_ped
-                if _cli_todos.lower() in
-                p.get("cliente_razao_social", "").lower()
-            ]
-        if _per_todos != "Todos":
-            _dias_tp = {"Últimos 7 dias": 7,
-                        "Últimos 30 dias": 30,
-                        "Últimos 90 dias": 90}[_per_todos]
-            _corte_tp = pd.Timestamp.now() - pd.Timedelta(days=_dias_tp)
-            _todos_ped = [
-                p for p in _todos_ped
-                if pd.to_datetime(p.get("criado_em","")) >= _corte_tp
-            ]
+            _filtros_tp["cliente_razao_social"] = ("contem", _cli_todos)
+        _per_filtro_tp = _erp_filtro_periodo(_per_todos)
+        if _per_filtro_tp:
+            _filtros_tp["criado_em"] = _per_filtro_tp
 
-        # KPIs por status
-        _contadores = {}
-        _valores    = {}
-        for _p in _todos_ped:
-            _s = _p.get("status","")
-            _contadores[_s] = _contadores.get(_s, 0) + 1
-            _valores[_s]    = _valores.get(_s, 0.0) + \
-                              float(_p.get("valor_total", 0) or 0)
+        # KPIs por status agregados no banco (uma linha por status)
+        _resumo_tp = supa_resumo("pedidos", filtros=_filtros_tp)
+        _contadores = {_s: _q for _s, (_q, _) in _resumo_tp.items()}
+        _valores    = {_s: _v for _s, (_, _v) in _resumo_tp.items()}
 
         _status_order = ["rascunho","enviado","aprovado",
                          "em_separacao","faturado","cancelado"]
@@ -9472,9 +11446,13 @@ elif menu == "__erp_todos_pedidos__":
 
         st.markdown("---")
 
-        # Exportar Excel
-        if _todos_ped:
-            _df_export_tp = pd.DataFrame([{
+        # Exportar Excel: a lista completa só é lida quando o usuário baixa
+        def _excel_todos_pedidos(filtros):
+            _registros = supa_select_todos(
+                "pedidos", filtros=filtros, ordem="criado_em.desc,id.desc",
+                colunas="id,numero,status,cliente_razao_social,criado_por_nome,"
+                        "valor_total,tipo_frete,cond_pagto,criado_em")
+            return to_excel(pd.DataFrame([{
                 "Número":     p.get("numero",""),
                 "Status":     p.get("status",""),
                 "Cliente":    p.get("cliente_razao_social",""),
@@ -9483,16 +11461,28 @@ elif menu == "__erp_todos_pedidos__":
                 "Frete":      p.get("tipo_frete",""),
                 "Pagamento":  p.get("cond_pagto",""),
                 "Data":       str(p.get("criado_em",""))[:10],
-            } for p in _todos_ped])
+            } for p in _registros]))
+
+        if _contadores:
             st.download_button(
                 "📥 Exportar Excel",
-                data=to_excel(_df_export_tp),
+                data=excel_sob_demanda(_excel_todos_pedidos, dict(_filtros_tp),
+                                       chave=(_filtros_tp, _resumo_tp)),
                 file_name="todos_pedidos.xlsx",
                 mime="application/vnd.ms-excel",
                 key="dl_erp_todos_pedidos",
             )
 
-        # Listagem
+        # Listagem paginada
+        _tam_pag_tp = 50
+        _cursor_tp = _erp_cursor_pagina(
+            "erp_tp_paginas", (_st_todos, _vend_todos, _cli_todos, _per_todos))
+        _todos_ped, _total_pag_tp, _prox_tp = supa_select_pagina(
+            "pedidos", filtros=_filtros_tp, tamanho=_tam_pag_tp, cursor=_cursor_tp)
+        _erp_navegacao_paginas("erp_tp_paginas", _prox_tp, _total_pag_tp,
+                               len(_todos_ped), _tam_pag_tp)
+        _itens_tp, _ = carregar_detalhes_pedidos(
+            [p.get("id") for p in _todos_ped], historico=False)
         for _pt in _todos_ped:
             _id_t   = _pt.get("id","")
             _num_t  = _pt.get("numero","—")
@@ -9552,8 +11542,7 @@ elif menu == "__erp_todos_pedidos__":
                                     status_anterior=_sts_t)
                                 st.rerun()
                 with _at4:
-                    _itens_t = supa_select("itens_pedido",
-                                           filtros={"pedido_id": _id_t})
+                    _itens_t = _itens_tp.get(_id_t, [])
                     if _itens_t:
                         try:
                             _pdf_t = gerar_pdf_pedido(
@@ -0,0 +1,22 @@
+-- Contador por ano: proximo_numero_pedido(ano) incrementa e devolve o número
+-- do pedido (MED-AAAA-NNNNNN) numa única instrução, sem corrida entre
+-- vendedores. A carga inicial parte do maior número já gravado em cada ano.
+
+create table if not exists pedidos_sequencia (
+  ano    int primary key,
+  ultimo int not null
+);
+
+insert into pedidos_sequencia (ano, ultimo)
+select split_part(numero, '-', 2)::int, max(split_part(numero, '-', 3)::int)
+  from pedidos
+ where numero ~ '^MED-[0-9]{4}-[0-9]+$'
+ group by 1
+on conflict (ano) do nothing;
+
+create or replace function proximo_numero_pedido(p_ano int)
+returns text language sql as $$
+  insert into pedidos_sequencia as s (ano, ultimo) values (p_ano, 1)
+  on conflict (ano) do update set ultimo = s.ultimo + 1
+  returning 'MED-' || p_ano || '-' || lpad(ultimo::text, 6, '0');
+$$;
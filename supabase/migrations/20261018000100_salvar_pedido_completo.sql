@@ -0,0 +1,86 @@
+-- Grava cabeçalho + itens + histórico de um pedido numa única transação
+-- (usada por salvar_pedido em app.py; sem ela o app grava pela API REST).
+-- Pedidos novos sem número são numerados por proximo_numero_pedido
+-- (migração 20261018000000_pedidos_sequencia.sql).
+--
+-- Os inserts listam as colunas enviadas pelo app: colunas fora da lista
+-- ficam com o default da tabela (jsonb_populate_record preencheria NULL).
+
+create or replace function salvar_pedido_completo(p_pedido jsonb, p_itens jsonb, p_historico jsonb)
+returns text language plpgsql as $$
+declare
+  v_id     text := p_pedido->>'id';
+  v_numero text;
+begin
+  if exists (select 1 from pedidos where id::text = v_id) then
+    update pedidos p set
+      status = r.status, cliente_razao_social = r.cliente_razao_social,
+      cliente_cpf_cnpj = r.cliente_cpf_cnpj, cliente_ie = r.cliente_ie,
+      cliente_cidade = r.cliente_cidade, cliente_estado = r.cliente_estado,
+      cliente_telefone = r.cliente_telefone, cliente_email_nfe = r.cliente_email_nfe,
+      cliente_endereco = r.cliente_endereco, representante = r.representante,
+      obs_cliente = r.obs_cliente, tabela_preco = r.tabela_preco,
+      tipo_frete = r.tipo_frete, data_venda = r.data_venda, cond_pagto = r.cond_pagto,
+      estado_comissao = r.estado_comissao, obs_pedido = r.obs_pedido,
+      valor_total = r.valor_total, atualizado_em = r.atualizado_em
+    from jsonb_populate_record(null::pedidos, p_pedido) r
+    where p.id::text = v_id
+    returning p.numero into v_numero;
+  else
+    -- Pedido novo sem número: aloca no contador dentro da mesma transação
+    v_numero := coalesce(nullif(p_pedido->>'numero', ''),
+                         proximo_numero_pedido(extract(year from now())::int));
+    insert into pedidos (
+      id, numero, status, cliente_razao_social, cliente_cpf_cnpj, cliente_ie,
+      cliente_cidade, cliente_estado, cliente_telefone, cliente_email_nfe,
+      cliente_endereco, representante, obs_cliente, tabela_preco, tipo_frete,
+      data_venda, cond_pagto, estado_comissao, obs_pedido, valor_total,
+      criado_por_id, criado_por_nome, criado_em, atualizado_em)
+    select
+      r.id, v_numero, r.status, r.cliente_razao_social, r.cliente_cpf_cnpj, r.cliente_ie,
+      r.cliente_cidade, r.cliente_estado, r.cliente_telefone, r.cliente_email_nfe,
+      r.cliente_endereco, r.representante, r.obs_cliente, r.tabela_preco, r.tipo_frete,
+      r.data_venda, r.cond_pagto, r.estado_comissao, r.obs_pedido, r.valor_total,
+      r.criado_por_id, r.criado_por_nome, r.criado_em, r.atualizado_em
+    from jsonb_populate_record(null::pedidos, p_pedido) r;
+  end if;
+
+  delete from itens_pedido
+   where pedido_id::text = v_id
+     and id::text <> all(array(select e->>'id' from jsonb_array_elements(p_itens) e));
+
+  insert into itens_pedido (
+    id, pedido_id, codigo_produto, descricao, gramatura, cx_embarque, quantidade,
+    valor_unit, preco_ref, preco_historico, comissao_perc, total, alerta_preco_baixo,
+    criado_em)
+  select
+    r.id, r.pedido_id, r.codigo_produto, r.descricao, r.gramatura, r.cx_embarque, r.quantidade,
+    r.valor_unit, r.preco_ref, r.preco_historico, r.comissao_perc, r.total, r.alerta_preco_baixo,
+    r.criado_em
+  from jsonb_populate_recordset(null::itens_pedido, p_itens) r
+  on conflict (id) do update set
+    (codigo_produto, descricao, gramatura, cx_embarque, quantidade, valor_unit,
+     preco_ref, preco_historico, comissao_perc, total, alerta_preco_baixo) =
+    (excluded.codigo_produto, excluded.descricao, excluded.gramatura, excluded.cx_embarque,
+     excluded.quantidade, excluded.valor_unit, excluded.preco_ref, excluded.preco_historico,
+     excluded.comissao_perc, excluded.total, excluded.alerta_preco_baixo)
+  where (itens_pedido.codigo_produto, itens_pedido.descricao, itens_pedido.gramatura,
+         itens_pedido.cx_embarque, itens_pedido.quantidade, itens_pedido.valor_unit,
+         itens_pedido.preco_ref, itens_pedido.preco_historico, itens_pedido.comissao_perc,
+         itens_pedido.total, itens_pedido.alerta_preco_baixo)
+    is distinct from
+        (excluded.codigo_produto, excluded.descricao, excluded.gramatura, excluded.cx_embarque,
+         excluded.quantidade, excluded.valor_unit, excluded.preco_ref, excluded.preco_historico,
+         excluded.comissao_perc, excluded.total, excluded.alerta_preco_baixo);
+
+  insert into historico_status (
+    id, pedido_id, status_anterior, status_novo, usuario_id, usuario_nome, observacao, criado_em)
+  select
+    r.id, r.pedido_id, r.status_anterior, r.status_novo, r.usuario_id, r.usuario_nome,
+    r.observacao, r.criado_em
+  from jsonb_populate_record(null::historico_status, p_historico) r
+  on conflict (id) do nothing;
+
+  return v_numero;
+end;
+$$;
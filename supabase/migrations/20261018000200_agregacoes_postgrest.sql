@@ -0,0 +1,6 @@
+-- Libera as agregações do PostgREST (ex.: select=status,count(),valor_total.sum())
+-- usadas pelos KPIs das telas de pedidos (supa_resumo em app.py). Sem elas o
+-- app soma as colunas lidas em blocos.
+
+alter role authenticator set pgrst.db_aggregates_enabled = 'true';
+notify pgrst, 'reload config';
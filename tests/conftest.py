@@ -0,0 +1,45 @@
+"""
+app.py é um script Streamlit: importá-lo executa a página inteira. Os testes
+carregam só as definições de nível de módulo de que precisam (classes,
+funções e constantes pelo nome), junto com os imports do topo do arquivo.
+"""
+import ast
+from pathlib import Path
+
+import pytest
+
+APP = Path(__file__).resolve().parents[1] / 'app.py'
+
+
+def _nomes_definidos(no):
+    if isinstance(no, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return {no.name}
+    if isinstance(no, ast.Assign):
+        return {t.id for t in no.targets if isinstance(t, ast.Name)}
+    return set()
+
+
+def carregar_definicoes(*nomes):
+    """Namespace com as definições `nomes` de app.py (na ordem do arquivo)"""
+    arvore = ast.parse(APP.read_text(encoding='utf-8'))
+    namespace = {'__name__': 'app_definicoes', '__file__': str(APP)}
+    for no in arvore.body:
+        if isinstance(no, (ast.Import, ast.ImportFrom)):
+            try:
+                exec(compile(ast.Module(body=[no], type_ignores=[]), str(APP), 'exec'), namespace)
+            except ImportError:
+                # Dependências de tela (plotly, reportlab...) não são usadas aqui
+                pass
+    faltando = set(nomes)
+    for no in arvore.body:
+        if _nomes_definidos(no) & faltando:
+            exec(compile(ast.Module(body=[no], type_ignores=[]), str(APP), 'exec'), namespace)
+            faltando -= _nomes_definidos(no)
+    if faltando:
+        raise LookupError(f"definições não encontradas em app.py: {sorted(faltando)}")
+    return namespace
+
+
+@pytest.fixture
+def app():
+    return carregar_definicoes
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def ns(app):
+    return app('CacheVersionado', '_caches_versionados', 'versao_conhecida', 'cache_por_versao',
+               'FiltroVendas', '_filtro_vendas_em_cache', 'filtro_vendas')
+
+
+@pytest.mark.parametrize('versao, conhecida', [
+    ('abc', True),
+    (('abc', 'def'), True),
+    (None, False),
+    (('abc', None), False),
+    (['abc', None], False),
+])
+def test_versao_conhecida(ns, versao, conhecida):
+    assert ns['versao_conhecida'](versao) is conhecida
+
+
+def test_versao_composta_com_membro_none_nao_usa_cache(ns):
+    chamadas = []
+
+    @ns['cache_por_versao']()
+    def totais(df):
+        chamadas.append(len(df))
+        return df.sum()
+
+    totais(pd.DataFrame({'v': [1]}), versao=('sha-vendas', None))
+    segundo = totais(pd.DataFrame({'v': [1, 2]}), versao=('sha-vendas', None))
+    assert chamadas == [1, 2]
+    assert segundo['v'] == 3
+
+    totais(pd.DataFrame({'v': [1]}), versao=['sha-vendas', 'sha-catalogo'])
+    totais(pd.DataFrame({'v': [1, 2]}), versao=('sha-vendas', 'sha-catalogo'))
+    assert chamadas == [1, 2, 1]
+
+
+def test_filtro_vendas_sem_sha_monta_a_partir_da_base_atual(ns):
+    def base(nfs):
+        df = pd.DataFrame({'Numero_NF': nfs, 'Vendedor': 'ANA', 'Estado': 'SP'})
+        df['DataEmissao'] = pd.Timestamp('2026-01-10')
+        df['Ano'], df['Mes'] = 2026, 1
+        return df
+
+    _, notas = ns['filtro_vendas'](base([1]), None).filtrar()
+    assert notas['Numero_NF'].tolist() == [1]
+    _, notas = ns['filtro_vendas'](base([7, 8]), None).filtrar()
+    assert notas['Numero_NF'].tolist() == [7, 8]
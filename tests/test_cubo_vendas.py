@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def base_vendas():
+    """
+    NF 100 é venda da ANA em janeiro e devolução do BETO em fevereiro (mesmo
+    número); os itens da NF 400 estão na mesma célula, mas em datas diferentes
+    """
+    linhas = [
+        # Numero_NF, Vendedor, Estado, CPF_CNPJ, TipoMov, DataEmissao, TotalProduto
+        (100, 'ANA', 'SP', '111', 'NF Venda', '2026-01-10', 100.0),
+        (100, 'ANA', 'SP', '111', 'NF Venda', '2026-01-10', 100.0),
+        (100, 'BETO', 'RJ', '222', 'NF Dev.Venda', '2026-02-05', 30.0),
+        (200, 'BETO', 'RJ', '222', 'NF Venda', '2026-02-07', 50.0),
+        (200, 'BETO', 'RJ', '222', 'NF Venda', '2026-02-07', 50.0),
+        (300, 'ANA', 'SP', '111', 'NF Venda', '2026-02-20', 70.0),
+        (400, 'BETO', 'RJ', '222', 'NF Venda', '2026-01-05', 40.0),
+        (400, 'BETO', 'RJ', '222', 'NF Venda', '2026-01-25', 45.0),
+    ]
+    df = pd.DataFrame(linhas, columns=['Numero_NF', 'Vendedor', 'Estado', 'CPF_CNPJ',
+                                       'TipoMov', 'DataEmissao', 'TotalProduto'])
+    df['DataEmissao'] = pd.to_datetime(df['DataEmissao'])
+    df['Valor_Real'] = df['TotalProduto'] * 0.9
+    df['RazaoSocial'] = 'CLIENTE ' + df['CPF_CNPJ']
+    df['Cidade'] = 'CIDADE'
+    df['Ano'] = df['DataEmissao'].dt.year
+    df['Mes'] = df['DataEmissao'].dt.month
+    df['MesAno'] = df['DataEmissao'].dt.strftime('%m/%Y')
+    return df
+
+
+def _filtro_antigo(df, ini=None, fim=None, vendedor=None, estado=None, mes=None,
+                   ini_local=None, fim_local=None):
+    """
+    Filtros como eram antes do cubo: máscaras + obter_notas_unicas e, depois,
+    o período local das páginas sobre notas_unicas
+    """
+    if ini:
+        df = df[df['DataEmissao'] >= pd.Timestamp(ini)]
+    if fim:
+        df = df[df['DataEmissao'] <= pd.Timestamp(fim)]
+    for coluna, valor in (('Vendedor', vendedor), ('Estado', estado), ('Mes', mes)):
+        for v in (valor if isinstance(valor, tuple) else (valor,)):
+            if v and v not in ('Todos', 'Todas'):
+                df = df[df[coluna] == v]
+    notas = df.drop_duplicates(subset=['Numero_NF'], keep='first')
+    if ini_local:
+        notas = notas[notas['DataEmissao'] >= pd.Timestamp(ini_local)]
+    if fim_local:
+        notas = notas[notas['DataEmissao'] <= pd.Timestamp(fim_local)]
+    return notas
+
+
+def _por_tipo(notas=None, cubo=None):
+    if cubo is not None:
+        por_tipo = cubo.groupby('TipoMov', observed=True)[['Notas', 'TotalProduto', 'Valor_Real']].sum()
+        return por_tipo[por_tipo['Notas'] > 0]
+    return notas.groupby('TipoMov').agg(Notas=('Numero_NF', 'size'),
+                                        TotalProduto=('TotalProduto', 'sum'),
+                                        Valor_Real=('Valor_Real', 'sum'))
+
+
+@pytest.mark.parametrize('filtros', [
+    {},
+    {'vendedor': 'ANA'},
+    {'vendedor': 'BETO'},
+    {'estado': 'RJ'},
+    {'mes': 1},
+    {'mes': 2},
+    {'ini': '2026-02-06', 'fim': '2026-02-28'},
+    {'ini': '2026-01-01', 'fim': '2026-02-10', 'vendedor': 'BETO'},
+    {'ini': '2026-01-10', 'fim': '2026-01-31'},
+    {'ini_local': '2026-02-01'},
+    {'vendedor': 'BETO', 'ini_local': '2026-01-20', 'fim_local': '2026-02-06'},
+    {'ini': '2026-01-01', 'ini_local': '2026-01-15', 'fim_local': '2026-02-28'},
+    {'vendedor': ('BETO', 'Todos'), 'estado': ('RJ', 'RJ')},
+    {'vendedor': ('ANA', 'BETO')},
+])
+def test_recortes_do_cubo_batem_com_filtro_e_notas_unicas(app, base_vendas, filtros):
+    ns = app('CuboVendas')
+    cubo = ns['CuboVendas'](base_vendas)
+    fatia = cubo.fatiar(**filtros)
+    esperado = _por_tipo(_filtro_antigo(base_vendas, **filtros))
+    pd.testing.assert_frame_equal(_por_tipo(cubo=fatia), esperado,
+                                  check_dtype=False, check_index_type=False)
+
+
+def test_nf_repetida_entre_celulas_conta_so_a_primeira_do_recorte(app, base_vendas):
+    fatia = app('CuboVendas')['CuboVendas'](base_vendas).fatiar()
+    por_tipo = fatia.groupby('TipoMov')[['Notas', 'TotalProduto', 'Linhas']].sum()
+    # A devolução do BETO repete o número da venda da ANA: como no
+    # drop_duplicates sobre o recorte, só a venda conta
+    assert por_tipo.loc['NF Venda', 'Notas'] == 4
+    assert por_tipo.loc['NF Venda', 'TotalProduto'] == 260.0
+    assert por_tipo.loc['NF Dev.Venda', 'Notas'] == 0
+    assert por_tipo.loc['NF Dev.Venda', 'Linhas'] == 1
@@ -0,0 +1,35 @@
+import os
+import time
+
+
+def test_inicio_apaga_arquivos_vencidos_pela_data_de_modificacao(app, tmp_path):
+    ns = app('EXPORTS_DIR', 'ExecutorTarefas')
+    antigo = tmp_path / 'orfao.bin'
+    parcial = tmp_path / 'interrompido.bin.tmp'
+    recente = tmp_path / 'recente.bin'
+    for arquivo in (antigo, parcial, recente):
+        arquivo.write_bytes(b'x')
+    vencido = time.time() - 25 * 3600
+    os.utime(antigo, (vencido, vencido))
+    os.utime(parcial, (vencido, vencido))
+
+    ns['ExecutorTarefas'](diretorio=str(tmp_path), max_workers=1, reter_horas=24)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['recente.bin']
+
+
+def test_excecao_da_tarefa_vira_status_erro(app, tmp_path):
+    ns = app('EXPORTS_DIR', 'ExecutorTarefas')
+    executor = ns['ExecutorTarefas'](diretorio=str(tmp_path), max_workers=1)
+
+    def gerar(progresso):
+        raise ConnectionError("inadimplencia.xlsx indisponível")
+
+    tarefa_id = executor.enviar("u1", "Relatório", gerar, "r.zip", "application/zip")
+    limite = time.time() + 5
+    while executor.tarefas("u1")[0]['status'] in ('na_fila', 'executando') and time.time() < limite:
+        time.sleep(0.01)
+    tarefa = executor.tarefas("u1")[0]
+    assert (tarefa['id'], tarefa['status']) == (tarefa_id, 'erro')
+    assert tarefa['erro'] == "inadimplencia.xlsx indisponível"
+    assert not (tmp_path / f"{tarefa_id}.bin").exists()
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def base_vendas():
+    linhas = [
+        (100, 'ANA', 'SP', 'NF Venda', '2026-01-10'),
+        (100, 'BETO', 'RJ', 'NF Dev.Venda', '2026-02-05'),
+        (200, 'BETO', 'RJ', 'NF Venda', '2026-02-07'),
+        (200, 'BETO', 'RJ', 'NF Venda', '2026-02-07'),
+        (300, 'ANA', 'RJ', 'NF Venda', '2026-01-20'),
+    ]
+    df = pd.DataFrame(linhas, columns=['Numero_NF', 'Vendedor', 'Estado', 'TipoMov', 'DataEmissao'])
+    df['DataEmissao'] = pd.to_datetime(df['DataEmissao'])
+    df['Ano'] = df['DataEmissao'].dt.year
+    df['Mes'] = df['DataEmissao'].dt.month
+    return df
+
+
+def _filtro_antigo(df, ini=None, fim=None, vendedor=None, estado=None, mes=None, ano=None):
+    mascara = np.ones(len(df), dtype=bool)
+    if ini:
+        mascara &= df['DataEmissao'] >= pd.Timestamp(ini)
+    if fim:
+        mascara &= df['DataEmissao'] <= pd.Timestamp(fim)
+    for coluna, valor in (('Vendedor', vendedor), ('Estado', estado), ('Mes', mes), ('Ano', ano)):
+        if valor is not None:
+            mascara &= df[coluna] == valor
+    filtrado = df[mascara]
+    return filtrado, filtrado.drop_duplicates(subset=['Numero_NF'], keep='first')
+
+
+@pytest.mark.parametrize('filtros', [
+    {},
+    {'vendedor': 'BETO'},
+    {'estado': 'RJ'},
+    {'mes': 2},
+    {'ini': '2026-01-15', 'fim': '2026-02-28'},
+    {'vendedor': 'ANA', 'ano': 2026},
+])
+def test_notas_unicas_sao_do_recorte(app, base_vendas, filtros):
+    ns = app('FiltroVendas')
+    itens, notas = ns['FiltroVendas'](base_vendas).filtrar(**filtros)
+    esperado_itens, esperado_notas = _filtro_antigo(base_vendas, **filtros)
+    pd.testing.assert_frame_equal(itens, esperado_itens)
+    pd.testing.assert_frame_equal(notas, esperado_notas)
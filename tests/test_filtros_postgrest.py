@@ -0,0 +1,31 @@
+def test_in_coloca_valores_entre_aspas(app):
+    params = app('_valor_lista_postgrest', '_padrao_contem', '_params_filtros')['_params_filtros']
+    assert params({"id": ("in", ["a", 'b,"c")'])}) == [("id", 'in.("a","b,\\"c\\")")')]
+
+
+def test_contem_trata_texto_digitado_como_literal(app):
+    params = app('_valor_lista_postgrest', '_padrao_contem', '_params_filtros')['_params_filtros']
+    resultado = params({
+        "status": "enviado",
+        "cliente_razao_social": ("contem", "SANTA CASA, (MATRIZ) 50%*"),
+        "criado_em": ("gte", "2026-01-01"),
+    })
+    assert resultado == [
+        ("status", "eq.enviado"),
+        ("criado_em", "gte.2026-01-01"),
+        ("and", '(cliente_razao_social.ilike."*SANTA CASA, (MATRIZ) 50\\\\%_*")'),
+    ]
+
+
+def test_mudanca_de_status_descarta_resumo_agregado_em_cache(app):
+    cache = app('CacheLeituraSupabase')['CacheLeituraSupabase']()
+    agregado = cache.chave([("usuario_id", "eq.u1"),
+                            ("select", "status,quantidade:count(),total:valor_total.sum()")], None, False)
+    lista = cache.chave([("usuario_id", "eq.u1"), ("select", "id,status")], None, False)
+    cache.guardar("pedidos", agregado, [{"status": "enviado", "quantidade": 3, "total": 300.0}])
+    cache.guardar("pedidos", lista, [{"id": "p1", "status": "enviado"}])
+
+    cache.atualizar_linhas("pedidos", "p1", {"status": "aprovado"})
+
+    assert cache.obter("pedidos", agregado) is None
+    assert cache.obter("pedidos", lista) == [{"id": "p1", "status": "aprovado"}]
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+DEFINICOES = (
+    'SupabaseErro', '_SEM_CACHE', 'CacheLeituraSupabase', 'supabase_cliente',
+    '_avisar_erro_supabase', '_formatar_numero_pedido', '_numero_pedido_pelo_maximo',
+    'gerar_numero_pedido', '_CAMPOS_ITEM_PEDIDO', 'SupabaseMemoria', '_mesmo_valor_item',
+    '_salvar_pedido_rest', 'salvar_pedido',
+)
+
+CLIENTE = {"razao_social": "HOSPITAL TESTE", "cpf_cnpj": "00.000.000/0001-00", "estado": "CE"}
+PEDIDO = {"tabela_preco": "NE", "tipo_frete": "CIF", "cond_pagto": "28 DIAS"}
+
+
+def _itens(n=3):
+    return [{"codigo": f"P{i}", "descricao": f"PRODUTO {i}", "quantidade": i + 1,
+             "valor_unit": 10.0, "total": 10.0 * (i + 1)} for i in range(n)]
+
+
+@pytest.fixture(params=[("salvar_pedido_completo", "proximo_numero_pedido"), ("proximo_numero_pedido",)],
+                ids=["rpc", "rest"])
+def ambiente(app, request):
+    ns = app(*DEFINICOES)
+    return ns, ns['SupabaseMemoria'](funcoes=request.param)
+
+
+def test_gravacoes_concorrentes_recebem_numeros_unicos(ambiente):
+    ns, banco = ambiente
+    salvar = ns['salvar_pedido']
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        resultados = list(pool.map(
+            lambda i: salvar(CLIENTE, PEDIDO, _itens(), f"pedido {i}", usuario_id=f"u{i}", cliente=banco),
+            range(64)))
+
+    ano = datetime.now().year
+    numeros = sorted(numero for _, numero in resultados)
+    assert numeros == [f"MED-{ano}-{i:06d}" for i in range(1, 65)]
+    assert len(banco.tabelas["pedidos"]) == 64
+    assert len(banco.tabelas["itens_pedido"]) == 64 * 3
+    assert len(banco.tabelas["historico_status"]) == 64
+
+
+def test_edicao_regrava_so_itens_alterados_e_remove_excluidos(ambiente):
+    ns, banco = ambiente
+    salvar = ns['salvar_pedido']
+    itens = _itens()
+    pedido_id, numero = salvar(CLIENTE, PEDIDO, itens, "", cliente=banco)
+    assert all(i.get("id") for i in itens)
+
+    editados = [dict(itens[0], quantidade=99, total=990.0), itens[2]]
+    pid, num = salvar(CLIENTE, dict(PEDIDO, numero=numero), editados, "", pedido_id=pedido_id, cliente=banco)
+    assert (pid, num) == (pedido_id, numero)
+    gravados = {r["id"]: r for r in banco.tabelas["itens_pedido"].values()}
+    assert set(gravados) == {itens[0]["id"], itens[2]["id"]}
+    assert gravados[itens[0]["id"]]["quantidade"] == 99
+    assert len(banco.tabelas["pedidos"]) == 1
+
+
+def test_sem_funcoes_no_banco_usa_o_maior_numero(app):
+    ns = app(*DEFINICOES)
+    banco = ns['SupabaseMemoria'](funcoes=())
+    _, primeiro = ns['salvar_pedido'](CLIENTE, PEDIDO, _itens(1), "", cliente=banco)
+    _, segundo = ns['salvar_pedido'](CLIENTE, PEDIDO, _itens(1), "", cliente=banco)
+    ano = datetime.now().year
+    assert (primeiro, segundo) == (f"MED-{ano}-000001", f"MED-{ano}-000002")
@@ -0,0 +1,64 @@
+import pytest
+
+
+def test_rpc_lembra_funcao_ausente(app, monkeypatch):
+    ns = app('SupabaseErro', '_SEM_CACHE', '_total_content_range', 'CacheLeituraSupabase', 'SupabaseClient')
+    cliente = ns['SupabaseClient']("https://exemplo.supabase.co", "chave")
+    chamadas = []
+
+    def requisitar(metodo, tabela, **kwargs):
+        chamadas.append((metodo, tabela))
+        raise ns['SupabaseErro']("HTTP 404", 404)
+
+    monkeypatch.setattr(cliente, 'requisitar', requisitar)
+    for _ in range(3):
+        with pytest.raises(ns['SupabaseErro']) as erro:
+            cliente.rpc("salvar_pedido_completo", {})
+        assert erro.value.status == 404
+    assert chamadas == [("POST", "rpc/salvar_pedido_completo")]
+
+
+def test_rpc_nao_lembra_outros_erros(app, monkeypatch):
+    ns = app('SupabaseErro', '_SEM_CACHE', '_total_content_range', 'CacheLeituraSupabase', 'SupabaseClient')
+    cliente = ns['SupabaseClient']("https://exemplo.supabase.co", "chave")
+    respostas = iter([ns['SupabaseErro']("HTTP 500", 500), "MED-2026-000001"])
+
+    def requisitar(metodo, tabela, **kwargs):
+        r = next(respostas)
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+    monkeypatch.setattr(cliente, 'requisitar', requisitar)
+    with pytest.raises(ns['SupabaseErro']):
+        cliente.rpc("proximo_numero_pedido", {"p_ano": 2026})
+    assert cliente.rpc("proximo_numero_pedido", {"p_ano": 2026}) == "MED-2026-000001"
+
+
+class _Resposta:
+    def __init__(self, status_code, corpo):
+        self.status_code = status_code
+        self.content = b'x'
+        self.text = str(corpo)
+        self.headers = {}
+        self._corpo = corpo
+
+    def json(self):
+        return self._corpo
+
+
+@pytest.mark.parametrize('resposta', [_Resposta(200, "MED-2026-000001"), _Resposta(404, "not found")],
+                         ids=['sucesso', '404'])
+def test_numero_pedido_nao_descarta_leituras_em_cache(app, monkeypatch, resposta):
+    ns = app('SupabaseErro', '_SEM_CACHE', '_total_content_range', 'CacheLeituraSupabase', 'SupabaseClient')
+    cliente = ns['SupabaseClient']("https://exemplo.supabase.co", "chave")
+    chave = cliente.cache.chave([("status", "eq.enviado")], None, False)
+    cliente.cache.guardar("pedidos", chave, [{"id": "p1", "status": "enviado"}])
+    monkeypatch.setattr(cliente._sessao, 'request', lambda *a, **k: resposta)
+
+    for _ in range(2):
+        try:
+            cliente.rpc("proximo_numero_pedido", {"p_ano": 2026})
+        except ns['SupabaseErro']:
+            pass
+    assert cliente.cache.obter("pedidos", chave) == [{"id": "p1", "status": "enviado"}]